@@ -0,0 +1,200 @@
+# ann_index.py
+#
+# IVF-flat approximate nearest neighbour partitions for VideoVectorIndex.
+#
+# Vectors are clustered around `nlist` spherical k-means centroids; a query
+# only scores the rows in the `nprobe` closest partitions. Partitions hold row
+# positions into the owning index's matrix, so vectors are never duplicated.
+# nprobe trades recall for speed (nprobe == nlist is an exact scan).
+#
+# Snapshots record the embedding model, the catalogue size the centroids were
+# trained on and a fingerprint of each vector, so a rebuild only reuses a
+# partition for a vector that has not changed since it was assigned.
+
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def train_centroids(
+    vectors: np.ndarray,
+    nlist: int,
+    iterations: int = 10,
+    sample_size: Optional[int] = None,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    Spherical k-means on (a sample of) L2-normalised vectors.
+    """
+    rng = np.random.default_rng(seed)
+    n = vectors.shape[0]
+    nlist = max(1, min(nlist, n))
+    sample_size = sample_size or min(n, nlist * 64)
+    sample = vectors[rng.choice(n, size=min(n, sample_size), replace=False)]
+
+    centroids = sample[rng.choice(sample.shape[0], size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=nlist)
+
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty partitions with random sample points.
+            sums[empty] = sample[rng.choice(sample.shape[0], size=int(empty.sum()))]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+
+    return centroids
+
+
+_FINGERPRINT_WEIGHTS: Dict[int, np.ndarray] = {}
+
+
+def vector_fingerprints(vectors: np.ndarray) -> np.ndarray:
+    """
+    A uint64 fingerprint per row of a float32 matrix: a fixed random odd
+    weighting of the raw bits, so any change to a vector changes its value.
+    """
+    bits = np.ascontiguousarray(vectors, dtype=np.float32).view(np.uint32).astype(np.uint64)
+    dim = bits.shape[1]
+    weights = _FINGERPRINT_WEIGHTS.get(dim)
+    if weights is None:
+        rng = np.random.default_rng(dim)
+        weights = rng.integers(0, 2**63, size=dim, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        _FINGERPRINT_WEIGHTS[dim] = weights
+    with np.errstate(over="ignore"):
+        return (bits * weights).sum(axis=1, dtype=np.uint64)
+
+
+class IVFSnapshot(NamedTuple):
+    centroids: np.ndarray
+    model: str
+    trained_size: int
+    # video_id -> (partition, vector fingerprint)
+    known: Dict[int, Tuple[int, int]]
+
+
+def assign_partitions(vectors: np.ndarray, centroids: np.ndarray, block: int = 8192) -> np.ndarray:
+    out = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], block):
+        out[start : start + block] = np.argmax(vectors[start : start + block] @ centroids.T, axis=1)
+    return out
+
+
+class IVFPartitions:
+    def __init__(self, centroids: np.ndarray, nprobe: int = 8, trained_size: int = 0, model: str = ""):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.nprobe = nprobe
+        # Catalogue size the centroids were trained on, and the embedding model.
+        self.trained_size = trained_size
+        self.model = model
+        self._members: List[set] = [set() for _ in range(self.nlist)]
+        self._arrays: List[Optional[np.ndarray]] = [None] * self.nlist
+        self._row_list: Dict[int, int] = {}
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    def __len__(self) -> int:
+        return len(self._row_list)
+
+    def _put(self, row: int, part: int) -> None:
+        old = self._row_list.get(row)
+        if old == part:
+            return
+        if old is not None:
+            self._members[old].discard(row)
+            self._arrays[old] = None
+        self._members[part].add(row)
+        self._arrays[part] = None
+        self._row_list[row] = part
+
+    def assign(self, row: int, vector: np.ndarray) -> None:
+        self._put(row, int(np.argmax(self.centroids @ vector)))
+
+    def assign_all(self, rows: Sequence[int], parts: Sequence[int]) -> None:
+        for row, part in zip(rows, parts):
+            self._put(int(row), int(part))
+
+    def unassign(self, row: int) -> None:
+        part = self._row_list.pop(row, None)
+        if part is not None:
+            self._members[part].discard(row)
+            self._arrays[part] = None
+
+    def move(self, src_row: int, dst_row: int) -> None:
+        """The owning index moved a vector from src_row to dst_row."""
+        part = self._row_list.pop(src_row, None)
+        if part is None:
+            return
+        self._members[part].discard(src_row)
+        self._members[part].add(dst_row)
+        self._arrays[part] = None
+        self._row_list[dst_row] = part
+
+    def partition_of(self, row: int) -> Optional[int]:
+        return self._row_list.get(row)
+
+    def _rows(self, part: int) -> np.ndarray:
+        arr = self._arrays[part]
+        if arr is None:
+            arr = np.fromiter(self._members[part], dtype=np.int64, count=len(self._members[part]))
+            self._arrays[part] = arr
+        return arr
+
+    def candidate_rows(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        scores = self.centroids @ query
+        probe = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        rows = [self._rows(int(p)) for p in probe]
+        return np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+
+    def save(self, path: Path, ids: np.ndarray, fingerprints: np.ndarray) -> None:
+        """
+        Persist centroids plus each id's partition and vector fingerprint.
+        `ids[row]` / `fingerprints[row]` describe the vector at each row.
+        """
+        rows = np.fromiter(self._row_list.keys(), dtype=np.int64, count=len(self._row_list))
+        parts = np.fromiter(self._row_list.values(), dtype=np.int32, count=len(self._row_list))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Unique temp file per writer, so concurrent saves never share one.
+        with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp", delete=False) as tmp:
+            try:
+                np.savez(
+                    tmp,
+                    centroids=self.centroids,
+                    ids=ids[rows],
+                    parts=parts,
+                    fingerprints=fingerprints[rows],
+                    model=np.array(self.model),
+                    trained_size=np.array(self.trained_size),
+                )
+            except BaseException:
+                tmp.close()
+                os.unlink(tmp.name)
+                raise
+        os.replace(tmp.name, path)
+
+    @staticmethod
+    def load(path: Path) -> IVFSnapshot:
+        with np.load(path) as data:
+            if "fingerprints" not in data.files:
+                raise ValueError("snapshot predates vector fingerprints")
+            known = dict(zip(
+                data["ids"].tolist(),
+                zip(data["parts"].tolist(), data["fingerprints"].tolist()),
+            ))
+            return IVFSnapshot(
+                centroids=data["centroids"],
+                model=str(data["model"]),
+                trained_size=int(data["trained_size"]),
+                known=known,
+            )
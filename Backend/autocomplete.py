@@ -0,0 +1,236 @@
+# autocomplete.py
+#
+# In-memory prefix trie over normalised video titles for /api/search/suggest.
+# Every trie node caches the ids of its most-viewed titles, so a one-word
+# prefix lookup is a walk of len(prefix) nodes with no sorting or DB access.
+
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlmodel import Session, select
+
+from models import Video
+
+# Rebuild from the database after this many seconds, picking up view counts
+# and writes made by other workers. 0 disables the refresh.
+AUTOCOMPLETE_MAX_AGE = float(os.getenv("AUTOCOMPLETE_MAX_AGE", "600"))
+
+# Ids cached per node; larger than the response size so duplicate titles can be dropped.
+NODE_TOP_K = 20
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return text.lower()
+
+
+def tokenize(text: str) -> List[str]:
+    return WORD_RE.findall(normalize(text))
+
+
+class _Node:
+    __slots__ = ("children", "ids", "top", "dirty")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.ids: Set[int] = set()  # titles containing the word ending here
+        self.top: List[int] = []  # best NODE_TOP_K ids in this subtree
+        self.dirty = False
+
+
+class TitleAutocomplete:
+    def __init__(self, max_age: float = AUTOCOMPLETE_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._root = _Node()
+        self._titles: Dict[int, str] = {}
+        self._views: Dict[int, int] = {}
+        self._tokens: Dict[int, Tuple[str, ...]] = {}
+        self._built_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._titles)
+
+    def _rank(self, video_id: int) -> Tuple[int, int]:
+        return (-self._views.get(video_id, 0), video_id)
+
+    def _path(self, token: str, create: bool = False) -> List[_Node]:
+        node = self._root
+        path = []
+        for ch in token:
+            child = node.children.get(ch)
+            if child is None:
+                if not create:
+                    return []
+                child = node.children[ch] = _Node()
+            node = child
+            path.append(node)
+        return path
+
+    def _offer(self, node: _Node, video_id: int) -> None:
+        if video_id in node.top:
+            node.top.sort(key=self._rank)
+            return
+        if len(node.top) < NODE_TOP_K or self._rank(video_id) < self._rank(node.top[-1]):
+            node.top.append(video_id)
+            node.top.sort(key=self._rank)
+            del node.top[NODE_TOP_K:]
+
+    def _insert(self, video_id: int, title: str, views: int) -> None:
+        for token in self._index_words(video_id, title, views):
+            path = self._path(token, create=True)
+            path[-1].ids.add(video_id)
+            for node in path:
+                self._offer(node, video_id)
+
+    def _delete(self, video_id: int) -> None:
+        tokens = self._tokens.pop(video_id, ())
+        for token in tokens:
+            path = self._path(token)
+            if not path:
+                continue
+            path[-1].ids.discard(video_id)
+            for node in path:
+                if video_id in node.top:
+                    node.top.remove(video_id)
+                    # A displaced id may now belong in the top list; recompute lazily.
+                    node.dirty = True
+        self._titles.pop(video_id, None)
+        self._views.pop(video_id, None)
+
+    def _refresh(self, node: _Node) -> None:
+        ids: Set[int] = set()
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            ids.update(current.ids)
+            stack.extend(current.children.values())
+        node.top = sorted(ids, key=self._rank)[:NODE_TOP_K]
+        node.dirty = False
+
+    def _index_words(self, video_id: int, title: str, views: int) -> Tuple[str, ...]:
+        tokens = tuple(dict.fromkeys(tokenize(title)))
+        self._titles[video_id] = title
+        self._views[video_id] = views or 0
+        self._tokens[video_id] = tokens
+        return tokens
+
+    def _compute_tops(self) -> None:
+        """Bottom-up top-K for every node; used after a bulk load."""
+        order: List[_Node] = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(node.children.values())
+        for node in reversed(order):  # children before parents
+            candidates = set(node.ids)
+            for child in node.children.values():
+                candidates.update(child.top)
+            node.top = sorted(candidates, key=self._rank)[:NODE_TOP_K]
+            node.dirty = False
+
+    # --- public API ---
+
+    def load(self, rows: Iterable[Tuple[int, str, int]]) -> None:
+        fresh = TitleAutocomplete(self.max_age)
+        for video_id, title, views in rows:
+            for token in fresh._index_words(video_id, title or "", views):
+                fresh._path(token, create=True)[-1].ids.add(video_id)
+        fresh._compute_tops()
+
+        with self._lock:
+            self._root = fresh._root
+            self._titles = fresh._titles
+            self._views = fresh._views
+            self._tokens = fresh._tokens
+            self._built_at = time.monotonic()
+
+    def build(self, session: Session) -> None:
+        self.load(session.exec(select(Video.id, Video.title, Video.views)).all())
+
+    def needs_build(self) -> bool:
+        if self._built_at is None:
+            return True
+        return bool(self.max_age) and time.monotonic() - self._built_at > self.max_age
+
+    def ensure_built(self, session: Session) -> None:
+        if self.needs_build():
+            self.build(session)
+
+    def invalidate(self) -> None:
+        """Force a rebuild on the next lookup (e.g. after a bulk import)."""
+        self._built_at = None
+
+    def upsert(self, video_id: int, title: str, views: int = 0) -> None:
+        with self._lock:
+            if self._built_at is None:
+                return  # Not built yet; the first lookup loads everything.
+            self._delete(video_id)
+            self._insert(video_id, title or "", views)
+
+    def remove(self, video_id: int) -> None:
+        with self._lock:
+            self._delete(video_id)
+
+    def suggest(self, q: str, limit: int = 10) -> List[str]:
+        """
+        Most-viewed titles where the last query word prefixes a title word and
+        every earlier query word appears in the title.
+        """
+        tokens = tokenize(q)
+        if not tokens:
+            return []
+        prefix, others = tokens[-1], tokens[:-1]
+
+        with self._lock:
+            path = self._path(prefix)
+            if not path:
+                return []
+            node = path[-1]
+
+            if not others:
+                if node.dirty:
+                    self._refresh(node)
+                candidates = node.top
+            else:
+                # Intersect the exact-word sets, smallest first, then check the prefix.
+                sets = []
+                for word in others:
+                    word_path = self._path(word)
+                    if not word_path or not word_path[-1].ids:
+                        return []
+                    sets.append(word_path[-1].ids)
+                sets.sort(key=len)
+                matched = set(sets[0]).intersection(*sets[1:])
+                candidates = sorted(
+                    (
+                        video_id
+                        for video_id in matched
+                        if any(t.startswith(prefix) for t in self._tokens[video_id])
+                    ),
+                    key=self._rank,
+                )
+
+            results: List[str] = []
+            seen: Set[str] = set()
+            for video_id in candidates:
+                title = self._titles[video_id]
+                key = normalize(title).strip()
+                if key in seen:
+                    continue
+                seen.add(key)
+                results.append(title)
+                if len(results) >= limit:
+                    break
+            return results
+
+
+title_autocomplete = TitleAutocomplete()
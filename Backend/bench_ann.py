@@ -0,0 +1,94 @@
+# bench_ann.py
+#
+# Recall@k and latency of the IVF index against exact search.
+#
+#   python bench_ann.py                          # 100k synthetic 384-d vectors
+#   python bench_ann.py --synthetic 300000 --nprobe 4 8 16 32
+#   python bench_ann.py --from-db                # real Video embeddings
+
+import argparse
+import time
+from typing import List
+
+import numpy as np
+
+import vector_embeddings
+from vector_embeddings import VideoVectorIndex
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Clustered unit vectors; uniform random data has no structure to exploit."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    vectors = centers[labels] + 0.35 * rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def db_vectors() -> np.ndarray:
+    from sqlmodel import Session
+    from database import engine
+
+    index = VideoVectorIndex(max_age=0)
+    with Session(engine) as session:
+        index.build(session)
+    return index._matrix[: len(index)].copy()
+
+
+def timed_queries(index: VideoVectorIndex, queries: np.ndarray, k: int, **kwargs) -> tuple:
+    results: List[List[int]] = []
+    started = time.perf_counter()
+    for q in queries:
+        results.append([video_id for video_id, _ in index.search(q, limit=k, **kwargs)])
+    elapsed_ms = (time.perf_counter() - started) * 1000 / len(queries)
+    return results, elapsed_ms
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark IVF vs exact video search.")
+    parser.add_argument("--synthetic", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--from-db", action="store_true")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    vectors = db_vectors() if args.from_db else synthetic_vectors(args.synthetic, args.dim, args.clusters)
+    n = vectors.shape[0]
+    if n == 0:
+        print("No vectors to benchmark.")
+        return
+
+    # Force the IVF path regardless of catalogue size; keep benchmarks off the real snapshot.
+    vector_embeddings.VIDEO_ANN = "ivf"
+    vector_embeddings.VIDEO_ANN_MIN_SIZE = 0
+    vector_embeddings.VIDEO_ANN_NLIST = args.nlist
+    vector_embeddings.VIDEO_ANN_SNAPSHOT = vector_embeddings.VIDEO_ANN_SNAPSHOT.with_name("bench_ivf.npz")
+    if vector_embeddings.VIDEO_ANN_SNAPSHOT.exists():
+        vector_embeddings.VIDEO_ANN_SNAPSHOT.unlink()
+
+    index = VideoVectorIndex(max_age=0)
+    started = time.perf_counter()
+    index.load(list(range(1, n + 1)), list(vectors))
+    build_s = time.perf_counter() - started
+
+    rng = np.random.default_rng(1)
+    picks = rng.choice(n, size=min(args.queries, n), replace=False)
+    queries = vectors[picks] + 0.05 * rng.normal(size=(len(picks), vectors.shape[1])).astype(np.float32)
+
+    exact, exact_ms = timed_queries(index, queries, args.k, exact=True)
+    print(f"vectors={n} dim={vectors.shape[1]} nlist={index._ann.nlist} build={build_s:.2f}s")
+    print(f"{'mode':>12} {'recall@' + str(args.k):>10} {'ms/query':>10} {'speedup':>8}")
+    print(f"{'exact':>12} {1.0:>10.3f} {exact_ms:>10.3f} {1.0:>8.1f}")
+
+    for nprobe in args.nprobe:
+        approx, ann_ms = timed_queries(index, queries, args.k, nprobe=nprobe)
+        recall = np.mean([len(set(a) & set(e)) / len(e) for a, e in zip(approx, exact) if e])
+        print(f"{'nprobe=' + str(nprobe):>12} {recall:>10.3f} {ann_ms:>10.3f} {exact_ms / ann_ms:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# chat_store.py
+#
+# Chat turns are stored one row per message in ChatMessage, keyed by
+# (chat_id, seq), and only ever appended: a send inserts two rows instead of
+# rewriting the whole conversation. Chats created before this still carry
+# their messages in the ChatHistory.messages JSON column (message_count is
+# NULL); they are moved over by migrate_chat_messages.py, or on first use.
+
+from typing import List, Optional, Tuple
+
+from sqlalchemy import func, insert, update
+from sqlmodel import Session, select
+
+from models import ChatHistory, ChatMessage, utc_now
+
+# Most recent messages sent to Gemini as conversation history.
+CHAT_HISTORY_MESSAGES = 20
+
+
+def migrate_chat(session: Session, chat: ChatHistory, keep_json: bool = False) -> int:
+    """
+    Copy a legacy chat's JSON messages into ChatMessage rows (not committed).
+    Returns the number of rows written.
+    """
+    if chat.message_count is not None:
+        return 0
+
+    legacy = chat.messages or []
+    rows = [
+        {
+            "chat_id": chat.id,
+            "seq": seq,
+            "role": message.get("role") or "user",
+            "content": message.get("content") or "",
+            "timestamp": message.get("timestamp") or "",
+        }
+        for seq, message in enumerate(legacy)
+    ]
+    if rows:
+        session.exec(insert(ChatMessage), params=rows)
+    chat.message_count = len(rows)
+    if not keep_json:
+        chat.messages = []
+    session.add(chat)
+    return len(rows)
+
+
+def ensure_migrated(session: Session, chat: ChatHistory) -> None:
+    if chat.message_count is None:
+        migrate_chat(session, chat)
+        session.commit()
+        session.refresh(chat)
+
+
+def recent_messages(
+    session: Session,
+    chat: ChatHistory,
+    limit: int = CHAT_HISTORY_MESSAGES,
+    since_seq: Optional[int] = None,
+) -> List[ChatMessage]:
+    """The last `limit` messages of a chat (from seq `since_seq` on), oldest first."""
+    ensure_migrated(session, chat)
+    statement = select(ChatMessage).where(ChatMessage.chat_id == chat.id)
+    if since_seq:
+        statement = statement.where(ChatMessage.seq >= since_seq)
+    rows = session.exec(statement.order_by(ChatMessage.seq.desc()).limit(limit)).all()
+    return list(reversed(rows))
+
+
+def message_page(
+    session: Session,
+    chat: ChatHistory,
+    before_seq: Optional[int] = None,
+    limit: int = 50,
+) -> Tuple[List[ChatMessage], bool]:
+    """
+    Up to `limit` messages before seq `before_seq` (default: the newest),
+    oldest first, and whether older ones remain.
+    """
+    ensure_migrated(session, chat)
+    statement = select(ChatMessage).where(ChatMessage.chat_id == chat.id)
+    if before_seq is not None:
+        statement = statement.where(ChatMessage.seq < before_seq)
+    rows = session.exec(statement.order_by(ChatMessage.seq.desc()).limit(limit + 1)).all()
+    return list(reversed(rows[:limit])), len(rows) > limit
+
+
+def append_messages(session: Session, chat: ChatHistory, messages: List[dict]) -> None:
+    """
+    Append role/content/timestamp dicts to a chat and bump last_updated
+    (not committed). The chat must already have an id.
+    """
+    if chat.message_count is None:
+        migrate_chat(session, chat)
+        session.flush()
+
+    # Reserving the seq range with an UPDATE takes SQLite's write lock first,
+    # so two sends to the same chat can't pick the same numbers.
+    session.exec(
+        update(ChatHistory)
+        .where(ChatHistory.id == chat.id)
+        .values(
+            message_count=func.coalesce(ChatHistory.message_count, 0) + len(messages),
+            last_updated=utc_now(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    end = session.exec(select(ChatHistory.message_count).where(ChatHistory.id == chat.id)).one()
+    start = end - len(messages)
+    session.exec(
+        insert(ChatMessage),
+        params=[
+            {
+                "chat_id": chat.id,
+                "seq": start + offset,
+                "role": message["role"],
+                "content": message["content"],
+                "timestamp": message["timestamp"],
+            }
+            for offset, message in enumerate(messages)
+        ],
+    )
@@ -0,0 +1,334 @@
+# chat_summary.py
+#
+# Bounded prompts. Each request sends Gemini at most CHAT_PROMPT_TOKEN_BUDGET
+# (estimated) tokens besides the system instruction: the typed message,
+# history, retrieved module context and extracted file text all share it
+# (fit_prompt). History itself is capped at CHAT_HISTORY_TOKEN_BUDGET: the
+# chat's rolling summary, then the newest messages that still fit. Once the
+# messages not yet covered by the summary outgrow that, the older ones are
+# folded into the summary by a background task after the reply has gone
+# out, so prompt size, and with it latency, stays flat however long a chat
+# gets or however much is attached.
+#
+#   ChatHistory.summary      covers messages with seq < summary_seq
+#   messages >= summary_seq  sent verbatim (newest first, within budget)
+
+import asyncio
+import os
+from typing import Any, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import google.generativeai as genai
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, update
+from sqlmodel import Session, select
+
+from database import engine
+from models import ChatHistory, ChatMessage
+
+# Hard cap on everything sent per request except the system instruction.
+CHAT_PROMPT_TOKEN_BUDGET = int(os.getenv("CHAT_PROMPT_TOKEN_BUDGET", "12000"))
+# Cap on the history part (summary + verbatim messages).
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "4000"))
+# Longest single message kept in history; longer ones are cut.
+CHAT_MESSAGE_TOKEN_LIMIT = int(os.getenv("CHAT_MESSAGE_TOKEN_LIMIT", "1000"))
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "400"))
+# Transcript sent to the summariser in one go.
+CHAT_SUMMARY_INPUT_TOKENS = int(os.getenv("CHAT_SUMMARY_INPUT_TOKENS", "8000"))
+CHAT_SUMMARY_MODEL = os.getenv("CHAT_SUMMARY_MODEL", "gemini-2.5-flash")
+# Newest messages considered per summarisation; anything older that was
+# never summarised (very long legacy chats) is skipped.
+CHAT_SUMMARY_SCAN_MESSAGES = 200
+
+# Rough Gemini tokenisation for English text, and the cost of one image.
+CHARS_PER_TOKEN = 4
+IMAGE_TOKENS = 258
+
+MODULE_CONTEXT_HEADER = (
+    "[System: Module context follows. Use it to answer, and cite sources as 'Source: <name>'.]\n"
+)
+CONTEXT_SEPARATOR = "\n\n"
+SUMMARY_ACK = "Got it, I'll keep that in mind."
+
+SUMMARY_INSTRUCTION = """
+You maintain a running summary of a tutoring conversation between a student
+and Lumeni, an AI tutor. Merge the new messages into the existing summary.
+Keep the topics and problems worked on, what the student understood or
+struggled with, attempts made, resources shared and any open question.
+Plain prose, under 200 words, no greeting.
+"""
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    return (len(text or "") + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text: str, limit: int) -> str:
+    if estimate_tokens(text) <= limit:
+        return text
+    if limit <= 0:
+        return ""
+    marker = " …[truncated]"
+    chars = limit * CHARS_PER_TOKEN
+    if chars <= len(marker):
+        return text[:chars]
+    return text[: chars - len(marker)].rstrip() + marker
+
+
+def build_history(
+    summary: Optional[str],
+    messages: Sequence[ChatMessage],
+    budget: int = CHAT_HISTORY_TOKEN_BUDGET,
+) -> List[dict]:
+    """
+    SDK history for a request: the summary (as a leading exchange) and the
+    newest messages, oldest first, within `budget` estimated tokens.
+    """
+    if budget <= 0:
+        return []
+    used = 0
+    summary_turn = None
+    if summary:
+        summary = truncate_to_tokens(summary, min(CHAT_SUMMARY_MAX_TOKENS, budget // 2))
+        summary_turn = f"[System: Summary of the earlier conversation:\n{summary}]"
+        used = estimate_tokens(summary_turn) + estimate_tokens(SUMMARY_ACK)
+        if used > budget:
+            summary_turn, used = None, 0
+
+    kept: List[Tuple[str, str]] = []
+    for message in reversed(messages):
+        if not message.content:
+            continue
+        content = truncate_to_tokens(message.content, CHAT_MESSAGE_TOKEN_LIMIT)
+        cost = estimate_tokens(content)
+        if used + cost > budget:
+            break
+        kept.append(("model" if message.role == "bot" else "user", content))
+        used += cost
+    kept.reverse()
+    # History must not open with a model turn after a cut.
+    while kept and kept[0][0] == "model":
+        kept.pop(0)
+
+    history = []
+    if summary_turn:
+        history.append({"role": "user", "parts": [summary_turn]})
+        history.append({"role": "model", "parts": [SUMMARY_ACK]})
+    history += [{"role": role, "parts": [content]} for role, content in kept]
+    return history
+
+
+def history_tokens(history: Sequence[dict]) -> int:
+    return sum(estimate_tokens(part) for turn in history for part in turn["parts"])
+
+
+class FittedPrompt(NamedTuple):
+    history: List[dict]
+    message: str
+    context_chunks: List[str]
+    files: List[Any]  # extracted text, or image dicts
+    tokens: int
+
+    def content_parts(self) -> List[Any]:
+        """The user turn: module context, then the message, then the files."""
+        parts: List[Any] = []
+        if self.context_chunks:
+            parts.append(MODULE_CONTEXT_HEADER + CONTEXT_SEPARATOR.join(self.context_chunks))
+        if self.message:
+            parts.append(self.message)
+        return parts + self.files
+
+
+def prompt_tokens(history: Sequence[dict], content_parts: Sequence[Any]) -> int:
+    """Estimated size of a request: history plus the user turn."""
+    return history_tokens(history) + sum(
+        estimate_tokens(part) if isinstance(part, str) else IMAGE_TOKENS for part in content_parts
+    )
+
+
+def fit_prompt(
+    summary: Optional[str],
+    messages: Sequence[ChatMessage],
+    message: str,
+    context_chunks: Sequence[str],
+    files: Sequence[Any],
+    budget: int = CHAT_PROMPT_TOKEN_BUDGET,
+) -> FittedPrompt:
+    """
+    Cut one request's inputs down to `budget` estimated tokens. Shares are
+    taken in order: images (fixed cost, at most half the budget), the typed
+    message (at most half the budget), history (at most
+    CHAT_HISTORY_TOKEN_BUDGET and half of what is left), whole
+    module-context chunks (at most half of the rest when files are
+    attached), and extracted file texts, which split the remainder evenly.
+    Raises ValueError when the images alone don't fit.
+    """
+    images = [part for part in files if not isinstance(part, str)]
+    if IMAGE_TOKENS * len(images) > budget // 2:
+        raise ValueError(f"At most {budget // 2 // IMAGE_TOKENS} images can be attached to one message.")
+    remaining = budget - IMAGE_TOKENS * len(images)
+
+    message = truncate_to_tokens(message, max(0, min(remaining, budget // 2)))
+    remaining -= estimate_tokens(message)
+
+    history = build_history(summary, messages, min(CHAT_HISTORY_TOKEN_BUDGET, max(0, remaining) // 2))
+    remaining -= history_tokens(history)
+
+    texts = [part for part in files if isinstance(part, str)]
+    context_budget = max(0, remaining // 2 if texts else remaining)
+    kept_chunks: List[str] = []
+    for chunk in context_chunks:
+        # The header comes with the first chunk, a separator with the rest.
+        overhead = CONTEXT_SEPARATOR if kept_chunks else MODULE_CONTEXT_HEADER
+        cost = estimate_tokens(overhead) + estimate_tokens(chunk)
+        if cost > context_budget:
+            break
+        kept_chunks.append(chunk)
+        context_budget -= cost
+        remaining -= cost
+
+    share = max(0, remaining) // len(texts) if texts else 0
+    fitted_files = []
+    for part in files:
+        if isinstance(part, str):
+            part = truncate_to_tokens(part, share)
+            if not part:
+                continue
+            remaining -= estimate_tokens(part)
+        fitted_files.append(part)
+
+    return FittedPrompt(history, message, kept_chunks, fitted_files, budget - remaining)
+
+
+def needs_summary(session: Session, chat: ChatHistory) -> bool:
+    """Whether the messages after the summary exceed the history budget."""
+    per_message = CHAT_MESSAGE_TOKEN_LIMIT * CHARS_PER_TOKEN
+    chars = session.exec(
+        select(func.sum(func.min(func.length(ChatMessage.content), per_message))).where(
+            ChatMessage.chat_id == chat.id,
+            ChatMessage.seq >= (chat.summary_seq or 0),
+        )
+    ).one()
+    return (chars or 0) > CHAT_HISTORY_TOKEN_BUDGET * CHARS_PER_TOKEN
+
+
+def _plan_summary(chat_id: int) -> Optional[Tuple[Optional[str], int, int, List[ChatMessage]]]:
+    """
+    (current summary, its summary_seq, new summary_seq, messages to fold).
+    Keeps the newest messages worth half the budget out of the summary.
+    """
+    with Session(engine) as session:
+        chat = session.get(ChatHistory, chat_id)
+        if chat is None:
+            return None
+        start = chat.summary_seq or 0
+        rows = list(reversed(session.exec(
+            select(ChatMessage)
+            .where(ChatMessage.chat_id == chat_id, ChatMessage.seq >= start)
+            .order_by(ChatMessage.seq.desc())
+            .limit(CHAT_SUMMARY_SCAN_MESSAGES)
+        ).all()))
+        summary = chat.summary
+        session.expunge_all()
+
+    keep_tokens = CHAT_HISTORY_TOKEN_BUDGET // 2
+    cut, used = len(rows), 0
+    while cut > 0:
+        cost = estimate_tokens(truncate_to_tokens(rows[cut - 1].content or "", CHAT_MESSAGE_TOKEN_LIMIT))
+        if used + cost > keep_tokens and len(rows) - cut >= 2:
+            break
+        used += cost
+        cut -= 1
+    # The verbatim part starts at a student message.
+    while cut < len(rows) and rows[cut].role == "bot":
+        cut += 1
+    if cut == 0:
+        return None
+    return summary, start, rows[cut - 1].seq + 1, rows[:cut]
+
+
+def _transcript(messages: Sequence[ChatMessage]) -> str:
+    lines: List[str] = []
+    used = 0
+    for message in reversed(messages):
+        speaker = "Tutor" if message.role == "bot" else "Student"
+        line = f"{speaker}: {truncate_to_tokens(message.content or '', CHAT_MESSAGE_TOKEN_LIMIT)}"
+        used += estimate_tokens(line)
+        if used > CHAT_SUMMARY_INPUT_TOKENS and lines:
+            break
+        lines.append(line)
+    return "\n\n".join(reversed(lines))
+
+
+_summary_model: Optional[genai.GenerativeModel] = None
+
+
+def get_summary_model() -> genai.GenerativeModel:
+    global _summary_model
+    if _summary_model is None:
+        _summary_model = genai.GenerativeModel(
+            model_name=CHAT_SUMMARY_MODEL,
+            system_instruction=SUMMARY_INSTRUCTION,
+            # Room for the model's thinking tokens; the stored text is capped.
+            generation_config={"temperature": 0.2, "max_output_tokens": 2048},
+        )
+    return _summary_model
+
+
+async def summarize_messages(summary: Optional[str], messages: Sequence[ChatMessage]) -> str:
+    prompt = (
+        f"Existing summary:\n{summary or '(none)'}\n\n"
+        f"New messages:\n{_transcript(messages)}\n\n"
+        "Updated summary:"
+    )
+    response = await get_summary_model().generate_content_async(prompt)
+    text = (response.text or "").strip()
+    if not text:
+        raise ValueError("empty summary")
+    return truncate_to_tokens(text, CHAT_SUMMARY_MAX_TOKENS)
+
+
+def _store_summary(chat_id: int, start: int, end: int, summary: str) -> bool:
+    with Session(engine) as session:
+        # Skipped if another task moved the summary on meanwhile.
+        result = session.exec(
+            update(ChatHistory)
+            .where(ChatHistory.id == chat_id, func.coalesce(ChatHistory.summary_seq, 0) == start)
+            .values(summary=summary, summary_seq=end)
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+        return result.rowcount > 0
+
+
+_pending: Set[int] = set()
+_tasks: Set[asyncio.Task] = set()
+
+
+async def _summarize_chat(chat_id: int) -> None:
+    try:
+        plan = await run_in_threadpool(_plan_summary, chat_id)
+        if plan is None:
+            return
+        summary, start, end, messages = plan
+        new_summary = await summarize_messages(summary, messages)
+        if await run_in_threadpool(_store_summary, chat_id, start, end, new_summary):
+            print(f"📝 Chat {chat_id}: messages before #{end} summarised.")
+    except Exception as e:
+        print(f"⚠️ Could not summarise chat {chat_id}: {e}")
+    finally:
+        _pending.discard(chat_id)
+
+
+def maybe_schedule_summary(session: Session, chat: ChatHistory) -> None:
+    """
+    Call after a turn is saved, from the event loop: starts a background
+    summarisation when the chat's history is over budget (at most one per
+    chat at a time).
+    """
+    if chat.id in _pending or not needs_summary(session, chat):
+        return
+    _pending.add(chat.id)
+    task = asyncio.get_running_loop().create_task(_summarize_chat(chat.id))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
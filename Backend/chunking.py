@@ -0,0 +1,340 @@
+# chunking.py
+#
+# Splits extracted material text into embedding-sized chunks.
+#
+#   sentence   whole sentences packed up to CHUNK_MAX_TOKENS (default)
+#   token      fixed token windows overlapping by CHUNK_OVERLAP_TOKENS
+#   structure  like sentence, but a chunk never crosses a page or heading,
+#              and carries the heading it sits under
+#   chars      the original 1000/200 character windows
+#
+# Sizes are measured in the embedding model's word pieces: with the model's
+# tokenizer when transformers is installed, otherwise with a conservative
+# estimate. Every chunk fits the encoder's input, so nothing is silently
+# truncated at encode time. Each chunk keeps the page its text starts on.
+
+import os
+import re
+import threading
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from vector_embeddings import EMBEDDING_MODEL_NAME
+
+CHUNK_STRATEGY = os.getenv("CHUNK_STRATEGY", "sentence").lower()
+STRATEGIES = ("sentence", "token", "structure", "chars")
+
+# all-MiniLM-L6-v2 reads 256 word pieces including [CLS] and [SEP].
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "254"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+# Sentences repeated at the start of the next chunk (sentence/structure).
+CHUNK_OVERLAP_SENTENCES = int(os.getenv("CHUNK_OVERLAP_SENTENCES", "1"))
+
+# Sentence ends, or a blank line between paragraphs.
+SENTENCE_BREAK_RE = re.compile(r"(?<=[.!?])[\"')\]]*\s+(?=[\"'(\[]?[A-Z0-9])|\n\s*\n")
+SENTENCE_END_RE = re.compile(r"[.!?][\"')\]]*\s*$")
+WORD_RE = re.compile(r"\S+")
+PIECE_RE = re.compile(r"\w+|[^\w\s]")
+MAX_CARRY_CHARS = 2000
+HEADING_RE = re.compile(
+    r"^(#{1,6}\s+\S.*|(\d+(\.\d+)*\.?|[IVXLC]+\.|chapter\s+\w+|section\s+\w+|part\s+\w+)\s+\S.*)$",
+    re.IGNORECASE,
+)
+
+
+class Chunk(NamedTuple):
+    text: str
+    page: Optional[int] = None
+    section: Optional[str] = None
+
+
+# --- token counting ---
+
+_tokenizer = None
+_tokenizer_checked = False
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer():
+    """
+    The embedding model's (fast) tokenizer, or None to use the estimate.
+    """
+    global _tokenizer, _tokenizer_checked
+    if _tokenizer_checked:
+        return _tokenizer
+    with _tokenizer_lock:
+        if not _tokenizer_checked:
+            try:
+                from transformers import AutoTokenizer
+
+                name = EMBEDDING_MODEL_NAME
+                if "/" not in name:
+                    name = f"sentence-transformers/{name}"
+                _tokenizer = AutoTokenizer.from_pretrained(name)
+            except Exception as e:
+                print(f"⚠️ No tokenizer for {EMBEDDING_MODEL_NAME} ({e}); estimating chunk sizes.")
+            _tokenizer_checked = True
+    return _tokenizer
+
+
+def _estimate(word: str) -> int:
+    # Every word and punctuation mark is at least one piece; long words split.
+    return sum(1 + len(piece) // 6 for piece in PIECE_RE.findall(word)) or 1
+
+
+def _words(text: str) -> List[Tuple[str, int]]:
+    """(word, word pieces) for each whitespace-separated word."""
+    words = WORD_RE.findall(text)
+    if not words:
+        return []
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return [(word, _estimate(word)) for word in words]
+    ids = tokenizer(words, add_special_tokens=False)["input_ids"]
+    return [(word, max(1, len(pieces))) for word, pieces in zip(words, ids)]
+
+
+def count_tokens(text: str) -> int:
+    return sum(cost for _, cost in _words(text))
+
+
+# --- splitting ---
+
+def is_heading(line: str) -> bool:
+    line = line.strip()
+    if not line or len(line) > 100 or line.endswith((".", ",", ";", ":")):
+        return False
+    if HEADING_RE.match(line):
+        return True
+    letters = [ch for ch in line if ch.isalpha()]
+    return len(letters) >= 4 and line.isupper()
+
+
+def split_sentences(text: str) -> List[str]:
+    sentences = []
+    for part in SENTENCE_BREAK_RE.split(text or ""):
+        sentence = " ".join(part.split())
+        if sentence:
+            sentences.append(sentence)
+    return sentences
+
+
+def _sentence_units(
+    pages: Iterable[Tuple[Optional[int], str]],
+    structured: bool,
+) -> Iterator[Tuple[str, Optional[int], Optional[str], bool]]:
+    """
+    (sentence, page, section, starts_block). A block start forbids packing
+    with what came before: every page and heading when `structured`.
+    Otherwise a sentence broken by a page end is joined back together.
+    """
+    section = None
+    carry, carry_page = "", None
+    for page, text in pages:
+        if not structured:
+            sentences = split_sentences(text)
+            if not sentences:
+                continue
+            sentence_pages = [page] * len(sentences)
+            if carry:
+                sentences[0] = f"{carry} {sentences[0]}"
+                sentence_pages[0] = carry_page
+                carry = ""
+            # An unfinished last sentence continues on the next page (within reason).
+            if not SENTENCE_END_RE.search(sentences[-1]) and len(sentences[-1]) < MAX_CARRY_CHARS:
+                carry, carry_page = sentences.pop(), sentence_pages.pop()
+            for sentence, sentence_page in zip(sentences, sentence_pages):
+                yield sentence, sentence_page, None, False
+            continue
+
+        block: List[str] = []
+        new_block = True
+
+        def flush() -> Iterator[Tuple[str, Optional[int], Optional[str], bool]]:
+            nonlocal new_block
+            for sentence in split_sentences("\n".join(block)):
+                yield sentence, page, section, new_block
+                new_block = False
+            block.clear()
+
+        for line in (text or "").splitlines():
+            if is_heading(line):
+                yield from flush()
+                section = " ".join(line.strip().lstrip("#").split())
+                new_block = True
+                block.append(line)
+            else:
+                block.append(line)
+        yield from flush()
+
+    if carry:
+        yield carry, carry_page, None, False
+
+
+def _windows(
+    words: List[Tuple[str, int, Optional[int]]],
+    max_tokens: int,
+    overlap: int,
+    final: bool = True,
+) -> Iterator[Tuple[Chunk, int]]:
+    """
+    Token windows over (word, pieces, page). Yields (chunk, words consumed);
+    with final=False the last, possibly short, window is held back.
+    """
+    start = 0
+    while start < len(words):
+        size, end = 0, start
+        while end < len(words) and (end == start or size + words[end][1] <= max_tokens):
+            size += words[end][1]
+            end += 1
+        if end >= len(words) and not final:
+            return
+        text = " ".join(word for word, _, _ in words[start:end])
+        if end >= len(words):
+            yield Chunk(text, words[start][2]), end
+            return
+
+        # Step back over up to `overlap` pieces, but always move forward.
+        back, kept = end, 0
+        while back - 1 > start and kept + words[back - 1][1] <= overlap:
+            back -= 1
+            kept += words[back][1]
+        yield Chunk(text, words[start][2]), back
+        start = back
+
+
+def token_chunks(
+    pages: Iterable[Tuple[Optional[int], str]],
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap: int = CHUNK_OVERLAP_TOKENS,
+) -> Iterator[Chunk]:
+    pending: List[Tuple[str, int, Optional[int]]] = []
+    for page, text in pages:
+        pending += [(word, cost, page) for word, cost in _words(text or "")]
+        consumed = 0
+        for chunk, consumed in _windows(pending, max_tokens, overlap, final=False):
+            yield chunk
+        pending = pending[consumed:]
+    for chunk, _ in _windows(pending, max_tokens, overlap):
+        yield chunk
+
+
+def sentence_chunks(
+    pages: Iterable[Tuple[Optional[int], str]],
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_sentences: int = CHUNK_OVERLAP_SENTENCES,
+    structured: bool = False,
+) -> Iterator[Chunk]:
+    """
+    Whole sentences packed up to max_tokens; the last overlap_sentences of
+    a chunk open the next one (unless that would overflow it). A sentence
+    longer than max_tokens is split into token windows.
+    """
+    current: List[Tuple[str, int, Optional[int], Optional[str]]] = []
+    size = 0
+
+    def flush() -> Chunk:
+        return Chunk(" ".join(s for s, _, _, _ in current), current[0][2], current[0][3])
+
+    for sentence, page, section, starts_block in _sentence_units(pages, structured):
+        words = [(word, cost, page) for word, cost in _words(sentence)]
+        tokens = sum(cost for _, cost, _ in words)
+
+        if current and (starts_block or size + tokens > max_tokens):
+            yield flush()
+            carried = current[-overlap_sentences:] if overlap_sentences and not starts_block else []
+            if sum(t for _, t, _, _ in carried) + tokens > max_tokens:
+                carried = []
+            current = list(carried)
+            size = sum(t for _, t, _, _ in current)
+
+        if tokens > max_tokens:
+            if current:
+                yield flush()
+                current, size = [], 0
+            for chunk, _ in _windows(words, max_tokens, 0):
+                yield chunk._replace(section=section)
+            continue
+
+        current.append((sentence, tokens, page, section))
+        size += tokens
+
+    if current:
+        yield flush()
+
+
+def char_chunks(
+    pages: Iterable[Tuple[Optional[int], str]],
+    chunk_size: int = 1000,
+    overlap: int = 200,
+) -> Iterator[Chunk]:
+    """
+    Character windows over (page_number, text) pieces, only the current
+    window plus one page held in memory. Each chunk carries the page its
+    first character came from.
+    """
+    buffer = ""
+    # (offset in buffer, page) where each page's text begins
+    starts: List[Tuple[int, Optional[int]]] = []
+
+    def page_at_start() -> Optional[int]:
+        page = starts[0][1] if starts else None
+        for offset, number in starts:
+            if offset > 0:
+                break
+            page = number
+        return page
+
+    def emit() -> Chunk:
+        nonlocal buffer, starts
+        chunk = Chunk(buffer[:chunk_size], page_at_start())
+        shift = max(1, chunk_size - overlap)
+        buffer = buffer[shift:]
+        starts = [(offset - shift, number) for offset, number in starts]
+        # Keep only the page the buffer now starts in, plus later ones.
+        while len(starts) > 1 and starts[1][0] <= 0:
+            starts.pop(0)
+        return chunk
+
+    for number, text in pages:
+        if not buffer:
+            text = (text or "").lstrip()
+        if not text:
+            continue
+        if buffer:
+            buffer += "\n"
+        starts.append((len(buffer), number))
+        buffer += text
+        # Only emit windows that can't be the last one (trailing whitespace
+        # may still be stripped).
+        while len(buffer) > chunk_size and not buffer[chunk_size:].isspace():
+            yield emit()
+
+    buffer = buffer.rstrip()
+    while len(buffer) > chunk_size:
+        yield emit()
+    if buffer:
+        yield Chunk(buffer, page_at_start())
+
+
+def chunk_pages(
+    pages: Iterable[Tuple[Optional[int], str]],
+    strategy: Optional[str] = None,
+) -> Iterator[Chunk]:
+    """
+    Stream chunks from (page_number, text) pieces with the given strategy
+    (default CHUNK_STRATEGY).
+    """
+    strategy = (strategy or CHUNK_STRATEGY).lower()
+    if strategy == "token":
+        return token_chunks(pages)
+    if strategy == "structure":
+        return sentence_chunks(pages, structured=True)
+    if strategy == "chars":
+        return char_chunks(pages)
+    if strategy != "sentence":
+        print(f"⚠️ Unknown CHUNK_STRATEGY '{strategy}', using sentence.")
+    return sentence_chunks(pages)
+
+
+def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
+    return [chunk.text for chunk in char_chunks([(None, text)], chunk_size, overlap)]
@@ -2,7 +2,7 @@
 
 import os
 from sqlmodel import SQLModel, create_engine, Session
-from sqlalchemy import event
+from sqlalchemy import JSON, event, inspect, text
 
 # Default local SQLite database
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./lumeni.db")
@@ -20,9 +20,58 @@ def enable_sqlite_fk(dbapi_conn, conn_record):
     dbapi_conn.execute("PRAGMA foreign_keys=ON")
 
 
+def add_missing_columns():
+    """
+    create_all() never alters existing tables, so new nullable columns
+    added to the models are appended here with ALTER TABLE ADD COLUMN, and
+    their indexes created.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present or not column.nullable:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                print(f"Adding column {table.name}.{column.name} ({col_type})")
+                conn.execute(
+                    text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {col_type}')
+                )
+            # Indexes declared on existing tables (including the new columns).
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
+def normalize_json_nulls():
+    """
+    JSON columns declared with none_as_null used to store Python None as the
+    JSON text 'null'; turn those rows into SQL NULL so IS NULL filters see them.
+    """
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            for column in table.columns:
+                if not isinstance(column.type, JSON) or not column.type.none_as_null:
+                    continue
+                result = conn.execute(
+                    text(
+                        f'UPDATE "{table.name}" SET "{column.name}" = NULL '
+                        f'WHERE CAST("{column.name}" AS TEXT) = \'null\''
+                    )
+                )
+                if result.rowcount:
+                    print(f"Cleared {result.rowcount} JSON 'null' values in {table.name}.{column.name}")
+
+
 def create_db_and_tables():
     print("Creating SQLite DB and tables...")
     SQLModel.metadata.create_all(engine)
+    add_missing_columns()
+    normalize_json_nulls()
 
 
 def get_db():  # <-- THIS IS THE FIX (Renamed from get_session)
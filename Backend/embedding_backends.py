@@ -0,0 +1,148 @@
+# embedding_backends.py
+#
+# Pluggable CPU inference backends for the sentence embedding model.
+#
+#   EMBEDDING_BACKEND=torch      fp32 PyTorch (default)
+#   EMBEDDING_BACKEND=int8       PyTorch with dynamic int8 quantisation of Linear layers
+#   EMBEDDING_BACKEND=onnx       ONNX Runtime (needs `optimum[onnxruntime]`)
+#   EMBEDDING_BACKEND=onnx-int8  ONNX Runtime with the hub's pre-quantised int8 graph
+#
+# The ONNX backends run inference in ONNX Runtime but are still loaded
+# through SentenceTransformer, so torch is imported either way; they save
+# encode time, not the torch import or its memory.
+#
+# Parity check against the torch backend:
+#   python embedding_backends.py --backend onnx-int8
+
+import argparse
+import os
+import time
+from typing import Any, List, NamedTuple
+
+import numpy as np
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+# Quantised graph shipped in the sentence-transformers model repos.
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_quint8_avx2.onnx")
+
+BACKENDS = ("torch", "int8", "onnx", "onnx-int8")
+
+PARITY_TEXTS = [
+    "What is the derivative of x squared?",
+    "Explain photosynthesis in simple terms.",
+    "Introduction to Python lists and dictionaries",
+    "Supply and demand curves in microeconomics",
+    "How do I balance a redox reaction?",
+    "Eigenvalues and eigenvectors of a 2x2 matrix",
+    "Newton's second law of motion worked examples",
+    "Binary search trees: insertion and deletion",
+]
+
+
+class LoadedModel(NamedTuple):
+    model: Any  # SentenceTransformer-compatible
+    backend: str  # the backend actually loaded
+
+
+def load_model(model_name: str, backend: str = EMBEDDING_BACKEND, strict: bool = False) -> LoadedModel:
+    """
+    Loads the model with the requested backend. Unavailable backends fall
+    back to plain torch with a warning (reported in LoadedModel.backend), or
+    raise with strict=True.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend not in BACKENDS:
+        if strict:
+            raise ValueError(f"Unknown embedding backend '{backend}'")
+        print(f"⚠️ Unknown EMBEDDING_BACKEND '{backend}', using torch.")
+        backend = "torch"
+
+    try:
+        if backend == "int8":
+            import torch
+
+            model = SentenceTransformer(model_name, device="cpu")
+            torch.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+            )
+            return LoadedModel(model, backend)
+
+        if backend == "onnx":
+            return LoadedModel(SentenceTransformer(model_name, device="cpu", backend="onnx"), backend)
+
+        if backend == "onnx-int8":
+            model = SentenceTransformer(
+                model_name,
+                device="cpu",
+                backend="onnx",
+                model_kwargs={"file_name": EMBEDDING_ONNX_FILE},
+            )
+            return LoadedModel(model, backend)
+    except Exception as e:
+        if strict:
+            raise
+        print(f"⚠️ Could not load '{backend}' embedding backend ({e}); falling back to torch.")
+
+    return LoadedModel(SentenceTransformer(model_name, device="cpu"), "torch")
+
+
+def check_parity(
+    model_name: str,
+    backend: str,
+    texts: List[str] = PARITY_TEXTS,
+    repeats: int = 3,
+) -> dict:
+    """
+    Encodes `texts` with the torch reference and the candidate backend and
+    reports per-text cosine drift plus average encode latency. The candidate
+    is loaded strictly, so a backend that fails to load is an error rather
+    than torch compared with itself.
+    """
+
+    def timed_encode(model) -> tuple:
+        model.encode(texts)  # warm-up
+        started = time.perf_counter()
+        for _ in range(repeats):
+            vectors = model.encode(texts)
+        elapsed = (time.perf_counter() - started) / repeats
+        return np.asarray(vectors, dtype=np.float32), elapsed
+
+    reference, ref_seconds = timed_encode(load_model(model_name, "torch").model)
+    candidate, cand_seconds = timed_encode(load_model(model_name, backend, strict=True).model)
+
+    ref_norm = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    cand_norm = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosines = np.sum(ref_norm * cand_norm, axis=1)
+
+    return {
+        "backend": backend,
+        "texts": len(texts),
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "max_drift": float(1.0 - cosines.min()),
+        "torch_ms": round(ref_seconds * 1000, 2),
+        "backend_ms": round(cand_seconds * 1000, 2),
+        "speedup": round(ref_seconds / cand_seconds, 2) if cand_seconds else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare an embedding backend against torch.")
+    parser.add_argument("--backend", choices=BACKENDS, default=EMBEDDING_BACKEND)
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2"))
+    parser.add_argument("--max-drift", type=float, default=0.02)
+    args = parser.parse_args()
+
+    try:
+        report = check_parity(args.model, args.backend)
+    except Exception as e:
+        print(f"❌ Could not load the '{args.backend}' backend: {e}")
+        raise SystemExit(1)
+    for key, value in report.items():
+        print(f"{key:>12}: {value}")
+
+    if report["max_drift"] > args.max_drift:
+        print(f"❌ Cosine drift {report['max_drift']:.4f} exceeds {args.max_drift}")
+        raise SystemExit(1)
+    print("✅ Backend within parity tolerance.")
@@ -0,0 +1,127 @@
+# embedding_batcher.py
+#
+# Micro-batching dispatcher for embedding requests. Texts submitted from any
+# thread (or coroutine) are gathered for a few milliseconds, encoded with one
+# batched model call, and handed back through per-caller futures.
+
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EncodeFn = Callable[[List[str]], Sequence[np.ndarray]]
+
+# Longest a caller waits for its vector (covers a lazy model load on first use).
+EMBEDDING_BATCH_TIMEOUT = float(os.getenv("EMBEDDING_BATCH_TIMEOUT", "120"))
+
+
+class EmbeddingBatcher:
+    def __init__(
+        self,
+        encode_fn: EncodeFn,
+        max_batch: int = 32,
+        max_wait_ms: float = 5.0,
+        timeout: float = EMBEDDING_BATCH_TIMEOUT,
+    ):
+        self.encode_fn = encode_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.timeout = timeout
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self.batches = 0
+        self.items = 0
+        self.failed = 0
+        self.restarts = 0
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                # Threads don't survive fork(), so a forked worker starts its
+                # own; the inherited queue only holds the parent's requests.
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+            elif self._thread is not None:
+                # Same process, dead dispatcher: the new one drains the same
+                # queue, so requests already waiting are still answered.
+                self.restarts += 1
+            self._thread = threading.Thread(
+                target=self._run, name="embedding-batcher", daemon=True
+            )
+            self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def encode(self, text: str, timeout: Optional[float] = None) -> np.ndarray:
+        future = self.submit(text)
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    async def encode_async(self, text: str, timeout: Optional[float] = None) -> np.ndarray:
+        return await asyncio.wait_for(asyncio.wrap_future(self.submit(text)), timeout or self.timeout)
+
+    def _collect(self) -> List[Tuple[str, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            pending = [(text, fut) for text, fut in batch if fut.set_running_or_notify_cancel()]
+            if not pending:
+                continue
+
+            try:
+                vectors = self.encode_fn([text for text, _ in pending])
+                if len(vectors) != len(pending):
+                    raise ValueError(f"encoder returned {len(vectors)} vectors for {len(pending)} texts")
+                results = [np.asarray(vec, dtype=np.float32) for vec in vectors]
+            except BaseException as e:
+                self.failed += len(pending)
+                for _, fut in pending:
+                    fut.set_exception(e)
+                if not isinstance(e, Exception):
+                    raise
+                continue
+
+            self.batches += 1
+            self.items += len(pending)
+            for (_, fut), vec in zip(pending, results):
+                fut.set_result(vec)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": (self.items / self.batches) if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+            "failed": self.failed,
+            "restarts": self.restarts,
+        }
@@ -0,0 +1,155 @@
+# embedding_sidecar.py
+#
+# Serves sentence embeddings from a single process over a Unix socket so that
+# web workers don't each hold their own copy of the model (and torch).
+#
+#   python embedding_sidecar.py --socket /tmp/lumeni-embed.sock
+#   EMBEDDING_SIDECAR_SOCKET=/tmp/lumeni-embed.sock gunicorn -c gunicorn.conf.py main:app
+#
+# Wire format (all integers big-endian uint32):
+#   request:  <len><utf-8 JSON list of texts>
+#   response: <rows><dim><rows*dim float32 bytes>
+#             or <0xFFFFFFFF><len><utf-8 error message>
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+from typing import List
+
+import numpy as np
+
+ERROR_MARKER = 0xFFFFFFFF
+HEADER = struct.Struct(">I")
+SHAPE = struct.Struct(">II")
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ConnectionError("Embedding sidecar connection closed")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+class SidecarEmbeddingClient:
+    """
+    Drop-in stand-in for SentenceTransformer.encode() that forwards texts to
+    the sidecar. One connection is kept per thread and reopened on failure.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 30.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None or getattr(self._local, "pid", None) != os.getpid():
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+            self._local.pid = os.getpid()
+        return sock
+
+    def _close(self) -> None:
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        self._local.sock = None
+
+    def _roundtrip(self, texts: List[str]) -> np.ndarray:
+        sock = self._connect()
+        payload = json.dumps(texts).encode("utf-8")
+        sock.sendall(HEADER.pack(len(payload)) + payload)
+
+        rows, dim = SHAPE.unpack(_recv_exact(sock, SHAPE.size))
+        if rows == ERROR_MARKER:
+            message = _recv_exact(sock, dim).decode("utf-8", errors="replace")
+            raise RuntimeError(f"Embedding sidecar error: {message}")
+
+        data = _recv_exact(sock, rows * dim * 4)
+        return np.frombuffer(data, dtype=np.float32).reshape(rows, dim)
+
+    def encode(self, texts, **kwargs) -> np.ndarray:
+        texts = [texts] if isinstance(texts, str) else list(texts)
+        try:
+            return self._roundtrip(texts)
+        except (ConnectionError, OSError):
+            # Stale connection (sidecar restarted): retry once on a fresh socket.
+            self._close()
+            return self._roundtrip(texts)
+
+
+class _EmbeddingRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        while True:
+            try:
+                (size,) = HEADER.unpack(_recv_exact(self.request, HEADER.size))
+                texts = json.loads(_recv_exact(self.request, size).decode("utf-8"))
+            except (ConnectionError, OSError):
+                return
+
+            if not texts:
+                self.request.sendall(SHAPE.pack(0, 0))
+                continue
+
+            try:
+                futures = [self.server.batcher.submit(text) for text in texts]
+                vectors = np.asarray([f.result() for f in futures], dtype=np.float32)
+                if vectors.ndim != 2:
+                    vectors = vectors.reshape(len(texts), -1)
+                self.request.sendall(SHAPE.pack(*vectors.shape) + vectors.tobytes())
+            except Exception as e:
+                message = str(e).encode("utf-8")
+                self.request.sendall(SHAPE.pack(ERROR_MARKER, len(message)) + message)
+
+
+class EmbeddingSidecarServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, batcher):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.batcher = batcher
+        super().__init__(socket_path, _EmbeddingRequestHandler)
+
+
+def serve(socket_path: str) -> None:
+    # Imported here so the client side never pulls in the model stack.
+    from vector_embeddings import embedding_batcher, get_embedding_model
+
+    model = get_embedding_model()
+    model.encode(["warm up"])
+
+    # Requests from all workers share one micro-batcher.
+    with EmbeddingSidecarServer(socket_path, embedding_batcher) as server:
+        os.chmod(socket_path, 0o660)
+        print(f"✅ Embedding sidecar listening on {socket_path}")
+        try:
+            server.serve_forever()
+        finally:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve sentence embeddings over a Unix socket.")
+    parser.add_argument(
+        "--socket",
+        default=os.getenv("EMBEDDING_SIDECAR_SOCKET", "/tmp/lumeni-embed.sock"),
+    )
+    args = parser.parse_args()
+
+    # The sidecar itself must load the real model, not connect to itself.
+    os.environ.pop("EMBEDDING_SIDECAR_SOCKET", None)
+    serve(args.socket)
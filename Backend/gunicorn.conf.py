@@ -0,0 +1,32 @@
+# gunicorn.conf.py
+#
+#   gunicorn -c gunicorn.conf.py main:app
+#
+# Memory options for the embedding model (pick one):
+#   EMBEDDING_PRELOAD=1          load the model once in the master; workers share
+#                                the weights copy-on-write after fork.
+#   EMBEDDING_SIDECAR_SOCKET=... workers call embedding_sidecar.py over a Unix
+#                                socket and never load torch themselves.
+
+import gc
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+preload_app = os.getenv("EMBEDDING_PRELOAD", "0") == "1"
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+
+    from vector_embeddings import preload_embedding_model
+
+    preload_embedding_model()
+    # Move everything allocated so far out of the GC's reach, so collections in
+    # the workers don't touch (and un-share) the master's pages.
+    gc.freeze()
+    server.log.info("Embedding model preloaded in master for copy-on-write sharing")
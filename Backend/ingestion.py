@@ -1,7 +1,10 @@
+import hashlib
 import os
+import sqlite3
+import threading
+from itertools import chain
 from pathlib import Path
-from typing import List
-from uuid import uuid4
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 try:
     import chromadb
@@ -15,8 +18,9 @@ import docx
 from sqlmodel import Session, select
 
 from database import engine
+from chunking import CHUNK_STRATEGY, chunk_pages
 from models import ModuleMaterial
-from vector_embeddings import generate_embeddings_for_texts, generate_embedding_for_text
+from vector_embeddings import EMBEDDING_MODEL_NAME, generate_embeddings_for_texts, embed_query
 
 CHROMA_DIR = Path(os.getenv("CHROMA_DIR", "chroma_store")).resolve()
 CHROMA_COLLECTION = os.getenv("CHROMA_COLLECTION", "module_materials")
@@ -24,72 +28,351 @@ FACULTY_UPLOAD_DIR = Path(
     os.getenv("FACULTY_UPLOAD_DIR", "faculty_uploads")
 ).resolve()
 
+# Chunks embedded and written to Chroma per step; bounds peak memory.
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "64"))
+DOCX_PARAGRAPHS_PER_BLOCK = 200
+TXT_BLOCK_CHARS = 64 * 1024
 
-def get_collection():
+
+# One client and one handle per collection per process, opened on first use.
+_chroma_client = None
+_chroma_pid: Optional[int] = None
+_collections: Dict[str, "chromadb.Collection"] = {}
+_chroma_lock = threading.Lock()
+
+
+def get_chroma_client():
+    global _chroma_client, _chroma_pid
     if not CHROMA_AVAILABLE:
         return None
+    # Handles opened before a fork (gunicorn preload) must not be shared.
+    if _chroma_client is not None and _chroma_pid == os.getpid():
+        return _chroma_client
 
-    client = chromadb.PersistentClient(path=str(CHROMA_DIR))
-    return client.get_or_create_collection(name=CHROMA_COLLECTION)
+    with _chroma_lock:
+        if _chroma_client is None or _chroma_pid != os.getpid():
+            _collections.clear()
+            _chroma_client = chromadb.PersistentClient(path=str(CHROMA_DIR))
+            _chroma_pid = os.getpid()
+    return _chroma_client
 
 
-def read_text_from_file(path: Path) -> str:
+def get_collection(name: str = CHROMA_COLLECTION):
+    if not CHROMA_AVAILABLE:
+        return None
+
+    client = get_chroma_client()
+    collection = _collections.get(name)
+    if collection is not None:
+        return collection
+
+    with _chroma_lock:
+        collection = _collections.get(name)
+        if collection is None:
+            collection = client.get_or_create_collection(name=name)
+            _collections[name] = collection
+    return collection
+
+
+def reset_chroma_client() -> None:
+    """
+    Drop the cached client and collection handles; the next call reopens them.
+    """
+    global _chroma_client, _chroma_pid
+    with _chroma_lock:
+        _collections.clear()
+        _chroma_client = None
+        _chroma_pid = None
+
+
+def _stale_handle_errors() -> tuple:
+    # Exception names moved between chromadb releases.
+    errors = [ConnectionError, sqlite3.OperationalError]
+    chroma_errors = getattr(chromadb, "errors", None)
+    for name in ("InvalidCollectionException", "NotFoundError"):
+        error = getattr(chroma_errors, name, None)
+        if isinstance(error, type):
+            errors.append(error)
+    return tuple(errors)
+
+
+def is_stale_handle_error(error: Exception) -> bool:
+    """
+    Whether an error means the cached client or collection handle is no
+    longer usable (store unreachable, collection dropped and recreated),
+    rather than a problem with the request itself.
+    """
+    if isinstance(error, _stale_handle_errors()):
+        return True
+    # Older chromadb raises a bare ValueError for a vanished collection.
+    return isinstance(error, ValueError) and "does not exist" in str(error)
+
+
+def _with_collection(operation: Callable, name: str = CHROMA_COLLECTION):
+    """
+    Run operation(collection), reopening the store once if the cached handle
+    went stale (e.g. the collection was dropped and recreated on disk).
+    Any other error is the caller's and is raised as is.
+    """
+    collection = get_collection(name)
+    if collection is None:
+        return None
+    try:
+        return operation(collection)
+    except Exception as e:
+        if not is_stale_handle_error(e):
+            raise
+        print(f"⚠️ Chroma handle went stale, reopening the store: {e}")
+        reset_chroma_client()
+        collection = get_collection(name)
+        return operation(collection) if collection is not None else None
+
+
+def chroma_health() -> dict:
+    """
+    Read-only probe of this process's store handle. It never opens or resets
+    the shared client (requests may be using it); a stale handle is reopened
+    by _with_collection on its next use.
+    """
+    if not CHROMA_AVAILABLE:
+        return {"state": "unavailable"}
+    client = _chroma_client
+    if client is None or _chroma_pid != os.getpid():
+        return {"state": "idle"}
+    try:
+        client.heartbeat()
+        return {"state": "ok", "open_collections": len(_collections)}
+    except Exception as e:
+        return {"state": "failed", "error": str(e)}
+
+
+def count_pages(path: Path) -> Optional[int]:
+    """
+    Page count for progress reporting (PDF only; None when unknown).
+    """
+    if path.suffix.lower() != ".pdf" or not path.exists():
+        return None
+    try:
+        return len(pypdf.PdfReader(str(path)).pages)
+    except Exception:
+        return None
+
+
+def iter_document_pages(path: Path) -> Iterator[Tuple[Optional[int], str]]:
+    """
+    Yield (page_number, text) one page at a time. PDFs yield real 1-based
+    pages; DOCX and TXT have no pages and yield blocks with page None.
+    """
     if not path.exists():
-        return ""
+        return
 
     suffix = path.suffix.lower()
     try:
         if suffix == ".pdf":
             reader = pypdf.PdfReader(str(path))
-            parts: List[str] = []
-            for page in reader.pages:
-                parts.append(page.extract_text() or "")
-            return "\n".join(parts)
+            for number, page in enumerate(reader.pages, start=1):
+                yield number, page.extract_text() or ""
 
-        if suffix == ".docx":
+        elif suffix == ".docx":
             document = docx.Document(str(path))
-            return "\n".join([para.text for para in document.paragraphs])
+            block: List[str] = []
+            for para in document.paragraphs:
+                block.append(para.text)
+                if len(block) >= DOCX_PARAGRAPHS_PER_BLOCK:
+                    yield None, "\n".join(block)
+                    block = []
+            if block:
+                yield None, "\n".join(block)
+
+        elif suffix == ".txt":
+            with path.open("r", encoding="utf-8", errors="replace") as handle:
+                while True:
+                    block = handle.read(TXT_BLOCK_CHARS)
+                    if not block:
+                        break
+                    yield None, block
+    except Exception as e:
+        # A corrupt tail shouldn't discard the pages already extracted.
+        print(f"⚠️ Stopped reading {path.name}: {e}")
+        return
 
-        if suffix == ".txt":
-            return path.read_text(encoding="utf-8", errors="replace")
 
-        return ""
-    except Exception:
-        return ""
+def extract_pdf_pages(path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """
+    Text of PDF pages [start, end) (0-based), as (1-based page, text).
+    Top-level so a process pool can run it.
+    """
+    reader = pypdf.PdfReader(path)
+    end = min(end, len(reader.pages))
+    return [(number + 1, reader.pages[number].extract_text() or "") for number in range(start, end)]
 
 
-def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
-    normalized = (text or "").strip()
-    if not normalized:
-        return []
+def read_text_from_file(path: Path) -> str:
+    return "\n".join(text for _, text in iter_document_pages(path))
 
-    chunks: List[str] = []
-    start = 0
-    length = len(normalized)
-    while start < length:
-        end = min(start + chunk_size, length)
-        chunks.append(normalized[start:end])
-        if end == length:
-            break
-        start = max(0, end - overlap)
 
-    return chunks
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 
 def delete_material_vectors(material_id: int) -> None:
-    collection = get_collection()
-    if not collection:
-        return
-
     try:
-        collection.delete(where={"material_id": material_id})
+        _with_collection(lambda collection: collection.delete(where={"material_id": material_id}))
     except Exception:
         return
 
 
-def ingest_material(material_id: int) -> None:
+# material_id -> latest progress dict, for this process
+_ingest_progress: Dict[int, dict] = {}
+
+
+def get_ingest_progress(material_id: int) -> Optional[dict]:
+    return _ingest_progress.get(material_id)
+
+
+def file_sha256(path: Path) -> Optional[str]:
+    if not path.exists():
+        return None
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def _column(result: Optional[dict], key: str) -> list:
+    # Chroma returns numpy arrays for embeddings; never test them for truth.
+    value = (result or {}).get(key)
+    return [] if value is None else list(value)
+
+
+def _chunk_metadata(
+    material: ModuleMaterial,
+    index: int,
+    page: Optional[int],
+    section: Optional[str],
+    digest: str,
+) -> dict:
+    metadata = {
+        "module_id": material.module_id,
+        "material_id": material.id,
+        "tag": material.tag,
+        "source": material.original_filename,
+        "chunk_index": index,
+        "chunk_hash": digest,
+        "content_hash": material.content_hash,
+        "embedding_model": EMBEDDING_MODEL_NAME,
+    }
+    if page is not None:
+        metadata["page"] = page
+    if section:
+        metadata["section"] = section
+    return metadata
+
+
+def _stored_chunks(collection, material_id: int) -> Dict[str, dict]:
+    """id -> metadata of every chunk Chroma holds for a material."""
+    result = collection.get(where={"material_id": material_id}, include=["metadatas"])
+    return dict(zip(_column(result, "ids"), _column(result, "metadatas")))
+
+
+def _reusable_embeddings(collection, digests: Iterable[str]) -> Dict[str, list]:
+    """
+    chunk_hash -> embedding for chunks already embedded by the current model,
+    in any material.
+    """
+    digests = sorted(set(digests))
+    if not digests:
+        return {}
+    result = collection.get(
+        where={"$and": [{"chunk_hash": {"$in": digests}}, {"embedding_model": EMBEDDING_MODEL_NAME}]},
+        include=["embeddings", "metadatas"],
+    )
+    found: Dict[str, list] = {}
+    for metadata, embedding in zip(_column(result, "metadatas"), _column(result, "embeddings")):
+        found.setdefault(metadata["chunk_hash"], [float(x) for x in embedding])
+    return found
+
+
+def _ingested_twin(session: Session, material: ModuleMaterial) -> Optional[int]:
+    """Another fully ingested material with byte-identical content."""
+    if not material.content_hash:
+        return None
+    return session.exec(
+        select(ModuleMaterial.id).where(
+            ModuleMaterial.content_hash == material.content_hash,
+            ModuleMaterial.id != material.id,
+            ModuleMaterial.ingest_status == "done",
+        )
+    ).first()
+
+
+def _twin_batches(collection, source_id: int) -> Iterator[list]:
+    """
+    A twin's chunks in document order as (chunk, page, section, embedding) batches,
+    read straight from Chroma instead of re-parsing the file. Embeddings from
+    another model are left out (None), so those chunks are embedded again.
+    """
+    stored = _stored_chunks(collection, source_id)
+    ordered = sorted(stored, key=lambda chunk_id: stored[chunk_id].get("chunk_index", 0))
+    for ids in _batched(ordered, INGEST_EMBED_BATCH):
+        result = collection.get(ids=ids, include=["documents", "embeddings", "metadatas"])
+        rows = {
+            chunk_id: (
+                document,
+                metadata.get("page"),
+                metadata.get("section"),
+                [float(x) for x in embedding] if metadata.get("embedding_model") == EMBEDDING_MODEL_NAME else None,
+            )
+            for chunk_id, document, metadata, embedding in zip(
+                _column(result, "ids"),
+                _column(result, "documents"),
+                _column(result, "metadatas"),
+                _column(result, "embeddings"),
+            )
+        }
+        yield [rows[chunk_id] for chunk_id in ids if chunk_id in rows]
+
+
+def ingest_material(
+    material_id: int,
+    progress: Optional[Callable[[dict], None]] = None,
+    pages: Optional[Callable[[Path], Iterable[Tuple[Optional[int], str]]]] = None,
+    embed: Optional[Callable[[List[str]], List[List[float]]]] = None,
+) -> int:
+    """
+    Stream a material into Chroma: pages are extracted, chunked and embedded
+    INGEST_EMBED_BATCH chunks at a time, and each batch is written before the
+    next page is read, so memory stays flat for any document size. Returns
+    the number of chunks in the material.
+
+    Chunk ids are "<material>-<chunk hash>-<occurrence>", so re-ingesting a
+    changed file only embeds chunks whose text changed; unchanged chunks just
+    get their metadata refreshed and vanished ones are deleted at the end.
+    New chunks reuse any embedding Chroma already holds for the same text,
+    and a file identical to an already ingested one is copied from that
+    material without parsing it again.
+
+    `pages` (path -> page iterator) and `embed` (texts -> vectors) default
+    to in-thread extraction and generate_embeddings_for_texts; the
+    ingestion executor swaps in its process pool and shared embedder.
+    """
+    pages = pages or iter_document_pages
+    embed = embed or generate_embeddings_for_texts
+
     if not CHROMA_AVAILABLE:
-        return
+        return 0
 
     with Session(engine) as session:
         material = session.exec(
@@ -97,44 +380,157 @@ def ingest_material(material_id: int) -> None:
         ).first()
 
         if not material:
-            return
+            return 0
 
         storage_path = FACULTY_UPLOAD_DIR / material.storage_filename
-        text = read_text_from_file(storage_path)
-        chunks = chunk_text(text)
-        if not chunks:
-            return
-
-        delete_material_vectors(material_id)
-
-        embeddings = generate_embeddings_for_texts(chunks)
-        collection = get_collection()
-        if not collection:
-            return
+        if material.content_hash is None:
+            # Uploaded before hashing existed.
+            material.content_hash = file_sha256(storage_path)
+            session.add(material)
+            session.commit()
+            session.refresh(material)
+        twin_id = _ingested_twin(session, material)
+        session.expunge(material)
 
+    collection = get_collection()
+    if not collection:
+        return 0
+
+    state = {
+        "material_id": material_id,
+        "pages_total": None if twin_id else count_pages(storage_path),
+        "pages_done": 0,
+        "chunks_done": 0,
+        "stage": "parsing",
+        "done": False,
+    }
+
+    def report() -> None:
+        _ingest_progress[material_id] = dict(state)
+        if progress is not None:
+            progress(dict(state))
+
+    def counted_pages() -> Iterator[Tuple[Optional[int], str]]:
+        for page in pages(storage_path):
+            yield page
+            state["pages_done"] += 1
+
+    batches: Iterator[list] = iter(())
+    if twin_id is not None:
+        batches = _twin_batches(collection, twin_id)
+    first = next(batches, None)
+    if first is None:
+        batches = (
+            [(chunk.text, chunk.page, chunk.section, None) for chunk in batch]
+            for batch in _batched(chunk_pages(counted_pages()), INGEST_EMBED_BATCH)
+        )
+        first = next(batches, None)
+    stored = _stored_chunks(collection, material_id)
+    if first is None:
+        # Nothing extractable: keep what was indexed for this same file, but
+        # not the vectors of a file it replaced.
+        outdated = sorted(
+            chunk_id for chunk_id, metadata in stored.items()
+            if metadata.get("content_hash") != material.content_hash
+        )
+        if outdated:
+            collection.delete(ids=outdated)
+        state["stage"] = "done"
+        state["done"] = True
+        report()
+        return 0
+
+    # Chunks embedded by another model are re-embedded, not kept.
+    existing = {
+        chunk_id
+        for chunk_id, metadata in stored.items()
+        if metadata.get("embedding_model") == EMBEDDING_MODEL_NAME
+    }
+    seen: set = set()
+    occurrences: Dict[str, int] = {}
+
+    state["stage"] = "embedding"
+    report()
+
+    index = 0
+    embedded = 0
+    for batch in chain([first], batches):
         ids: List[str] = []
         metadatas: List[dict] = []
-        documents: List[str] = []
-
-        for index, chunk in enumerate(chunks):
-            ids.append(f"{material_id}-{index}-{uuid4().hex}")
-            metadatas.append(
-                {
-                    "module_id": material.module_id,
-                    "material_id": material.id,
-                    "tag": material.tag,
-                    "source": material.original_filename,
-                    "chunk_index": index,
-                }
+        for chunk, page, section, _ in batch:
+            digest = chunk_hash(chunk)
+            occurrence = occurrences.get(digest, 0)
+            occurrences[digest] = occurrence + 1
+            ids.append(f"{material_id}-{digest}-{occurrence}")
+            metadatas.append(_chunk_metadata(material, index, page, section, digest))
+            index += 1
+        seen.update(ids)
+
+        kept = [i for i, chunk_id in enumerate(ids) if chunk_id in existing]
+        if kept:
+            collection.update(ids=[ids[i] for i in kept], metadatas=[metadatas[i] for i in kept])
+
+        fresh = [i for i, chunk_id in enumerate(ids) if chunk_id not in existing]
+        if fresh:
+            vectors = {i: batch[i][3] for i in fresh if batch[i][3] is not None}
+            missing = [i for i in fresh if i not in vectors]
+            reusable = _reusable_embeddings(collection, (metadatas[i]["chunk_hash"] for i in missing))
+            for i in missing:
+                if metadatas[i]["chunk_hash"] in reusable:
+                    vectors[i] = reusable[metadatas[i]["chunk_hash"]]
+            to_embed = [i for i in fresh if i not in vectors]
+            if to_embed:
+                vectors.update(zip(to_embed, embed([batch[i][0] for i in to_embed])))
+                embedded += len(to_embed)
+
+            collection.upsert(
+                ids=[ids[i] for i in fresh],
+                documents=[batch[i][0] for i in fresh],
+                metadatas=[metadatas[i] for i in fresh],
+                embeddings=[vectors[i] for i in fresh],
             )
-            documents.append(chunk)
+        state["chunks_done"] = index
+        report()
+
+    # Everything not rewritten above: vanished chunks, chunks from before
+    # hash-based ids and chunks left by another embedding model.
+    stale = sorted(set(stored) - seen)
+    if stale:
+        collection.delete(ids=stale)
+
+    print(
+        f"📚 Material {material_id}: {index} chunks ({CHUNK_STRATEGY}), "
+        f"{embedded} embedded, {len(stale)} removed"
+    )
+    state["stage"] = "done"
+    state["done"] = True
+    report()
+    return index
 
-        collection.add(
-            ids=ids,
-            documents=documents,
-            metadatas=metadatas,
-            embeddings=embeddings,
-        )
+
+def update_material_metadata(material_id: int) -> int:
+    """
+    Push a material's tag/filename/module to its chunks in Chroma without
+    re-embedding anything. Returns the number of chunks updated.
+    """
+    with Session(engine) as session:
+        material = session.get(ModuleMaterial, material_id)
+        if not material:
+            return 0
+        fields = {
+            "module_id": material.module_id,
+            "tag": material.tag,
+            "source": material.original_filename,
+        }
+
+    def apply(collection) -> int:
+        stored = _stored_chunks(collection, material_id)
+        if stored:
+            ids = list(stored)
+            collection.update(ids=ids, metadatas=[{**stored[chunk_id], **fields} for chunk_id in ids])
+        return len(stored)
+
+    return _with_collection(apply) or 0
 
 
 def query_module_chunks(query: str, module_id: int, limit: int = 5) -> tuple[List[str], List[dict]]:
@@ -145,20 +541,48 @@ def query_module_chunks(query: str, module_id: int, limit: int = 5) -> tuple[Lis
     if not cleaned:
         return [], []
 
-    embedding = generate_embedding_for_text(cleaned)
+    embedding = embed_query(cleaned)
     if not embedding:
         return [], []
 
-    collection = get_collection()
-    if not collection:
-        return [], []
-    results = collection.query(
-        query_embeddings=[embedding],
-        n_results=limit,
-        where={"module_id": module_id},
-        include=["documents", "metadatas"],
+    results = _with_collection(
+        lambda collection: collection.query(
+            query_embeddings=[embedding],
+            n_results=limit,
+            where={"module_id": module_id},
+            include=["documents", "metadatas"],
+        )
     )
+    if not results:
+        return [], []
 
     documents = results.get("documents", [[]])[0]
     metadatas = results.get("metadatas", [[]])[0]
     return documents or [], metadatas or []
+
+
+def query_module_candidates(embedding: List[float], module_id: int, limit: int) -> List[Tuple[str, dict, list]]:
+    """
+    Nearest chunks of a module as (document, metadata, embedding), for
+    re-ranking by the caller.
+    """
+    if not CHROMA_AVAILABLE or not embedding:
+        return []
+
+    results = _with_collection(
+        lambda collection: collection.query(
+            query_embeddings=[embedding],
+            n_results=limit,
+            where={"module_id": module_id},
+            include=["documents", "metadatas", "embeddings"],
+        )
+    )
+    if not results:
+        return []
+
+    documents = _column(results, "documents")
+    metadatas = _column(results, "metadatas")
+    embeddings = _column(results, "embeddings")
+    if not documents:
+        return []
+    return list(zip(documents[0] or [], metadatas[0] or [], list(embeddings[0]) if embeddings else []))
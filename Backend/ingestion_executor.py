@@ -0,0 +1,349 @@
+# ingestion_executor.py
+#
+# Dedicated executor for module-material ingestion.
+#
+#   upload -> ingest_material job (job_queue) -> dispatcher threads -> ingest_material()
+#                                                   |- PDF page text: process pool (CPU bound)
+#                                                   '- embeddings: one shared micro-batcher
+#
+# Jobs live in the durable BackgroundJob table, so queued work survives a
+# restart and a crashed run is retried once its lease expires (running
+# jobs renew it as they progress). Only one job per material runs at a time.
+# The queue is bounded: when INGEST_QUEUE_SIZE jobs are waiting, uploads are
+# refused with 503 rather than piling up unbounded work. Each material's
+# stage is written to ModuleMaterial.ingest_status so any worker process can
+# report it.
+
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import update
+from sqlmodel import Session, func, select
+
+from database import engine
+from embedding_batcher import EmbeddingBatcher
+from ingestion import (
+    FACULTY_UPLOAD_DIR,
+    INGEST_EMBED_BATCH,
+    count_pages,
+    extract_pdf_pages,
+    ingest_material,
+    iter_document_pages,
+)
+from job_queue import (
+    INGEST_MATERIAL,
+    JOB_POLL_SECONDS,
+    JOB_WORKER,
+    claim_jobs,
+    complete_job,
+    enqueue,
+    has_pending_job,
+    has_running_job,
+    renew_lease,
+)
+from models import BackgroundJob, ModuleMaterial
+from retrieval import bump_materials_version
+from vector_embeddings import encode_texts
+
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "200"))
+# Materials processed concurrently (dispatcher threads).
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "2"))
+# Processes extracting PDF text; 0 extracts in the dispatcher thread.
+INGEST_PARSE_PROCESSES = int(os.getenv("INGEST_PARSE_PROCESSES", str(min(4, os.cpu_count() or 1))))
+# PDF pages per process-pool task, and tasks kept in flight per material.
+INGEST_PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "16"))
+INGEST_TASKS_AHEAD = 2
+# Minimum seconds between lease renewals of a running job.
+INGEST_LEASE_RENEW_SECONDS = 30
+
+IN_PROGRESS_STATUSES = ("queued", "parsing", "embedding")
+
+
+def set_ingest_status(material_id: int, status: str, error: Optional[str] = None) -> None:
+    with Session(engine) as session:
+        session.exec(
+            update(ModuleMaterial)
+            .where(ModuleMaterial.id == material_id)
+            .values(ingest_status=status, ingest_error=error)
+        )
+        session.commit()
+
+
+def release_upload(session: Session, material_id: int, filename: str) -> None:
+    """
+    Delete an upload the material no longer uses (call after committing the
+    change). A running ingestion may still be reading it page by page; then
+    the run deletes it when it finishes.
+    """
+    if not has_running_job(session, INGEST_MATERIAL, material_id):
+        (FACULTY_UPLOAD_DIR / filename).unlink(missing_ok=True)
+
+
+def _encode_chunks(texts: List[str]) -> np.ndarray:
+    return encode_texts(texts, batch_size=INGEST_EMBED_BATCH)
+
+
+class IngestionExecutor:
+    def __init__(
+        self,
+        queue_size: int = INGEST_QUEUE_SIZE,
+        concurrency: int = INGEST_CONCURRENCY,
+        parse_processes: int = INGEST_PARSE_PROCESSES,
+    ):
+        self.queue_size = queue_size
+        self.concurrency = max(1, concurrency)
+        self.parse_processes = parse_processes
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._active = 0
+        self.completed = 0
+        self.failed = 0
+        self.recovered = 0
+        # Chunks from all materials in flight are merged into full encode batches.
+        self.embedder = EmbeddingBatcher(_encode_chunks, max_batch=INGEST_EMBED_BATCH, max_wait_ms=20)
+
+    def start(self) -> None:
+        """
+        Re-queue materials left mid-ingestion without a job (e.g. queued
+        in memory before a restart) and start the dispatcher threads.
+        Processes with JOB_WORKER=0 only enqueue.
+        """
+        if not JOB_WORKER:
+            return
+        # Threads and pools don't survive fork(); a forked worker starts its own.
+        with self._lock:
+            if self._threads and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._pool = None
+            self._stop.clear()
+            self.recover()
+            self._threads = [
+                threading.Thread(target=self._run, name=f"ingest-{i}", daemon=True)
+                for i in range(self.concurrency)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            threads, self._threads = self._threads, []
+        # A job cut short here is retried when its lease expires.
+        for thread in threads:
+            thread.join(timeout)
+
+    def recover(self) -> int:
+        with Session(engine) as session:
+            jobs = select(BackgroundJob.target_id).where(
+                BackgroundJob.kind == INGEST_MATERIAL,
+                BackgroundJob.status.in_(("pending", "running")),
+            )
+            orphans = session.exec(
+                select(ModuleMaterial.id).where(
+                    ModuleMaterial.ingest_status.in_(IN_PROGRESS_STATUSES),
+                    ModuleMaterial.id.not_in(jobs),
+                )
+            ).all()
+            for material_id in orphans:
+                enqueue(session, INGEST_MATERIAL, material_id)
+            session.exec(
+                update(ModuleMaterial)
+                .where(ModuleMaterial.id.in_(list(orphans)))
+                .values(ingest_status="queued")
+            )
+            session.commit()
+        if orphans:
+            print(f"🔁 Re-queued ingestion of {len(orphans)} unfinished materials.")
+        self.recovered += len(orphans)
+        return len(orphans)
+
+    def _parse_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.parse_processes <= 0:
+            return None
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.parse_processes,
+                    mp_context=get_context("spawn"),  # never fork a process running torch
+                )
+            return self._pool
+
+    # --- submission ---
+
+    def pending(self, session: Session) -> int:
+        return session.exec(
+            select(func.count(BackgroundJob.id)).where(
+                BackgroundJob.kind == INGEST_MATERIAL,
+                BackgroundJob.status == "pending",
+            )
+        ).one()
+
+    def has_capacity(self, session: Session) -> bool:
+        return self.pending(session) < self.queue_size
+
+    def submit(self, session: Session, material: ModuleMaterial) -> None:
+        """
+        Queue a flushed material in the caller's transaction (not committed);
+        call wake() after the commit. A run already in progress finishes
+        first, then the material is ingested again.
+        """
+        enqueue(session, INGEST_MATERIAL, material.id)
+        material.ingest_status = "queued"
+        material.ingest_error = None
+        session.add(material)
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    # --- processing ---
+
+    def _pages(self, path: Path) -> Iterator[Tuple[Optional[int], str]]:
+        """
+        PDF pages extracted by the process pool in INGEST_PAGES_PER_TASK
+        slices, a couple of slices ahead, yielded in order.
+        """
+        pool = self._parse_pool()
+        total = count_pages(path) if pool is not None else None
+        if not total:
+            yield from iter_document_pages(path)
+            return
+
+        starts = iter(range(0, total, INGEST_PAGES_PER_TASK))
+        in_flight = []
+        for start in starts:
+            in_flight.append(pool.submit(extract_pdf_pages, str(path), start, start + INGEST_PAGES_PER_TASK))
+            if len(in_flight) > INGEST_TASKS_AHEAD:
+                break
+        while in_flight:
+            pages = in_flight.pop(0).result()
+            start = next(starts, None)
+            if start is not None:
+                in_flight.append(pool.submit(extract_pdf_pages, str(path), start, start + INGEST_PAGES_PER_TASK))
+            yield from pages
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        futures = [self.embedder.submit(text) for text in texts]
+        return [np.asarray(f.result(timeout=self.embedder.timeout), dtype=float).tolist() for f in futures]
+
+    def _process(self, job: BackgroundJob) -> None:
+        material_id = job.target_id
+        set_ingest_status(material_id, "parsing")
+        stage = {"current": "parsing", "renewed": time.monotonic()}
+
+        def on_progress(state: dict) -> None:
+            if state["stage"] != stage["current"] and state["stage"] == "embedding":
+                stage["current"] = state["stage"]
+                set_ingest_status(material_id, "embedding")
+            if time.monotonic() - stage["renewed"] >= INGEST_LEASE_RENEW_SECONDS:
+                stage["renewed"] = time.monotonic()
+                renew_lease(job)
+
+        ingest_material(
+            material_id,
+            progress=on_progress,
+            pages=lambda path: (
+                self._pages(path) if path.suffix.lower() == ".pdf" else iter_document_pages(path)
+            ),
+            embed=self._embed,
+        )
+        with Session(engine) as session:
+            # An edit made meanwhile has queued the next run.
+            again = has_pending_job(session, INGEST_MATERIAL, material_id)
+        set_ingest_status(material_id, "queued" if again else "done")
+        with Session(engine) as session:
+            material = session.get(ModuleMaterial, material_id)
+            if material is not None:
+                # Chat conversations must not keep re-ranking the old chunks.
+                bump_materials_version(session, material.module_id)
+                session.commit()
+
+    def _storage_filename(self, material_id: int) -> Optional[str]:
+        with Session(engine) as session:
+            material = session.get(ModuleMaterial, material_id)
+            return material.storage_filename if material is not None else None
+
+    def _release_replaced_upload(self, material_id: int, filename: Optional[str]) -> None:
+        """
+        After a run: delete the file it read if the material was replaced or
+        deleted meanwhile (release_upload() leaves that to the run).
+        """
+        if filename and self._storage_filename(material_id) != filename:
+            (FACULTY_UPLOAD_DIR / filename).unlink(missing_ok=True)
+
+    def _finish(self, job: BackgroundJob, error: Optional[str]) -> None:
+        with Session(engine) as session:
+            final = complete_job(session, job, error)
+            session.commit()
+        if error is not None:
+            # Retried jobs show as queued, with the last error.
+            set_ingest_status(job.target_id, "failed" if final else "queued", error[:1000])
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                jobs = claim_jobs(1, kinds=(INGEST_MATERIAL,))
+            except Exception as e:
+                print(f"⚠️ Ingestion dispatcher error: {e}")
+                jobs = []
+            if not jobs:
+                self._wake.wait(JOB_POLL_SECONDS)
+                self._wake.clear()
+                continue
+
+            job = jobs[0]
+            with self._lock:
+                self._active += 1
+            filename = None
+            try:
+                # Read once the job is running, so an edit either sees it
+                # running or commits before this read.
+                filename = self._storage_filename(job.target_id)
+                self._process(job)
+                self.completed += 1
+                error = None
+            except Exception as e:
+                self.failed += 1
+                print(f"⚠️ Ingestion of material {job.target_id} failed: {e}")
+                error = str(e) or type(e).__name__
+            finally:
+                with self._lock:
+                    self._active -= 1
+            try:
+                self._finish(job, error)
+                # Only once the job no longer shows as running.
+                self._release_replaced_upload(job.target_id, filename)
+            except Exception as e:
+                print(f"⚠️ Could not record ingestion of material {job.target_id}: {e}")
+
+    def stats(self) -> dict:
+        with Session(engine) as session:
+            queued = self.pending(session)
+        return {
+            "queued": queued,
+            "queue_size": self.queue_size,
+            "active": self._active,
+            "concurrency": self.concurrency,
+            "parse_processes": self.parse_processes,
+            "completed": self.completed,
+            "failed": self.failed,
+            "recovered": self.recovered,
+            "embedder": self.embedder.stats(),
+        }
+
+
+ingestion_executor = IngestionExecutor()
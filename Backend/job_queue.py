@@ -0,0 +1,405 @@
+# job_queue.py
+#
+# Durable background jobs stored in the BackgroundJob table (SQLite).
+#
+# Request handlers only insert a job row in the same transaction as their own
+# write; a worker thread in each API process claims pending jobs in batches,
+# runs them and deletes them. Enqueueing a job that is already pending for
+# the same target is a no-op, so repeated edits coalesce into one run, and a
+# pending job is not claimed while the same target is still running.
+# Claims are leases: a job left "running" by a crashed process is retried
+# after JOB_LEASE_SECONDS (long jobs renew theirs with renew_lease()).
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import update
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, delete, func, select
+
+from database import engine
+from models import BackgroundJob, Video, utc_now
+
+# Set JOB_WORKER=0 on processes that should only enqueue.
+JOB_WORKER = os.getenv("JOB_WORKER", "1") == "1"
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "32"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "600"))
+
+# Concurrent YouTube caption requests per batch (network bound).
+TRANSCRIPT_FETCH_THREADS = int(os.getenv("TRANSCRIPT_FETCH_THREADS", "4"))
+
+EMBED_VIDEO = "embed_video"
+FETCH_TRANSCRIPT = "fetch_transcript"
+VIDEO_JOB_KINDS = (EMBED_VIDEO, FETCH_TRANSCRIPT)
+# Claimed by ingestion_executor's own threads, not by JobWorker.
+INGEST_MATERIAL = "ingest_material"
+
+# kind -> handler(session, target_ids) returning {target_id: error} for failures
+JobHandler = Callable[[Session, List[int]], Dict[int, str]]
+_handlers: Dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str):
+    def register(fn: JobHandler) -> JobHandler:
+        _handlers[kind] = fn
+        return fn
+    return register
+
+
+# --- enqueueing (inside the caller's transaction) ---
+
+def enqueue(session: Session, kind: str, target_id: int) -> None:
+    """
+    Add a pending job unless one is already waiting. Not committed.
+    """
+    pending = session.exec(
+        select(BackgroundJob.id).where(
+            BackgroundJob.kind == kind,
+            BackgroundJob.target_id == target_id,
+            BackgroundJob.status == "pending",
+        )
+    ).first()
+    if pending is None:
+        session.add(BackgroundJob(kind=kind, target_id=target_id))
+
+
+def enqueue_video_jobs(session: Session, video: Video, embed: bool = True, transcript: bool = False) -> None:
+    """
+    Queue (re-)embedding and/or caption fetching for a flushed Video.
+    """
+    if embed:
+        enqueue(session, EMBED_VIDEO, video.id)
+    if transcript:
+        enqueue(session, FETCH_TRANSCRIPT, video.id)
+    video.embedding_status = "pending"
+    session.add(video)
+
+
+def cancel_video_jobs(session: Session, video_id: int) -> None:
+    session.exec(
+        delete(BackgroundJob).where(
+            BackgroundJob.target_id == video_id,
+            BackgroundJob.kind.in_(VIDEO_JOB_KINDS),
+        )
+    )
+
+
+def cancel_material_jobs(session: Session, material_id: int) -> None:
+    session.exec(
+        delete(BackgroundJob).where(
+            BackgroundJob.target_id == material_id,
+            BackgroundJob.kind == INGEST_MATERIAL,
+            BackgroundJob.status != "running",
+        )
+    )
+
+
+def _has_job(session: Session, kind: str, target_id: int, status: str) -> bool:
+    return session.exec(
+        select(BackgroundJob.id).where(
+            BackgroundJob.kind == kind,
+            BackgroundJob.target_id == target_id,
+            BackgroundJob.status == status,
+        )
+    ).first() is not None
+
+
+def has_pending_job(session: Session, kind: str, target_id: int) -> bool:
+    return _has_job(session, kind, target_id, "pending")
+
+
+def has_running_job(session: Session, kind: str, target_id: int) -> bool:
+    return _has_job(session, kind, target_id, "running")
+
+
+# --- claiming / completing ---
+
+def claim_jobs(
+    limit: int = JOB_BATCH_SIZE,
+    kinds: Optional[Sequence[str]] = None,
+    exclude_kinds: Sequence[str] = (),
+) -> List[BackgroundJob]:
+    token = uuid.uuid4().hex
+    now = utc_now()
+    with Session(engine) as session:
+        # Expired leases go back to the queue.
+        session.exec(
+            update(BackgroundJob)
+            .where(
+                BackgroundJob.status == "running",
+                BackgroundJob.updated_at < now - timedelta(seconds=JOB_LEASE_SECONDS),
+            )
+            .values(status="pending", claimed_by=None)
+        )
+        pending = aliased(BackgroundJob)
+        running = aliased(BackgroundJob)
+        # One job per target at a time: later edits wait for the running one.
+        busy = (
+            select(running.id)
+            .where(
+                running.kind == pending.kind,
+                running.target_id == pending.target_id,
+                running.status == "running",
+            )
+            .exists()
+        )
+        oldest = select(pending.id).where(pending.status == "pending", ~busy)
+        if kinds is not None:
+            oldest = oldest.where(pending.kind.in_(list(kinds)))
+        if exclude_kinds:
+            oldest = oldest.where(pending.kind.not_in(list(exclude_kinds)))
+        oldest = oldest.order_by(pending.id).limit(limit)
+        # The status check makes the claim safe against another process.
+        session.exec(
+            update(BackgroundJob)
+            .where(BackgroundJob.id.in_(oldest.scalar_subquery()), BackgroundJob.status == "pending")
+            .values(
+                status="running",
+                claimed_by=token,
+                attempts=BackgroundJob.attempts + 1,
+                updated_at=now,
+            )
+        )
+        session.commit()
+        jobs = session.exec(
+            select(BackgroundJob).where(BackgroundJob.claimed_by == token, BackgroundJob.status == "running")
+        ).all()
+        for job in jobs:
+            session.expunge(job)
+        return list(jobs)
+
+
+def renew_lease(job: BackgroundJob) -> None:
+    """Push back the lease expiry of a job that is still being worked on."""
+    with Session(engine) as session:
+        session.exec(
+            update(BackgroundJob)
+            .where(BackgroundJob.id == job.id, BackgroundJob.claimed_by == job.claimed_by)
+            .values(updated_at=utc_now())
+        )
+        session.commit()
+
+
+def complete_job(session: Session, job: BackgroundJob, error: Optional[str] = None) -> bool:
+    """
+    Delete a finished job, or record its failure: back to pending, or
+    "failed" once JOB_MAX_ATTEMPTS is reached. Returns True for a final
+    failure. Not committed.
+    """
+    if error is None:
+        session.exec(delete(BackgroundJob).where(BackgroundJob.id == job.id))
+        return False
+    print(f"⚠️ Job {job.kind} #{job.target_id} failed (attempt {job.attempts}): {error}")
+    final = job.attempts >= JOB_MAX_ATTEMPTS
+    session.exec(
+        update(BackgroundJob)
+        .where(BackgroundJob.id == job.id)
+        .values(
+            status="failed" if final else "pending",
+            claimed_by=None,
+            last_error=error[:1000],
+            updated_at=utc_now(),
+        )
+    )
+    return final
+
+
+def _set_video_status(session: Session, video_ids: Sequence[int], status: str) -> None:
+    if video_ids:
+        session.exec(update(Video).where(Video.id.in_(list(video_ids))).values(embedding_status=status))
+
+
+def run_jobs(jobs: List[BackgroundJob]) -> int:
+    """
+    Run claimed jobs grouped by kind (duplicates run once) and record the
+    outcome. Returns the number of failed jobs.
+    """
+    by_kind: Dict[str, List[int]] = {}
+    for job in jobs:
+        targets = by_kind.setdefault(job.kind, [])
+        if job.target_id not in targets:
+            targets.append(job.target_id)
+
+    with Session(engine) as session:
+        video_ids = {job.target_id for job in jobs if job.kind in VIDEO_JOB_KINDS}
+        _set_video_status(session, video_ids, "processing")
+        session.commit()
+
+        errors: Dict[tuple, str] = {}
+        for kind, targets in by_kind.items():
+            handler = _handlers.get(kind)
+            if handler is None:
+                errors.update({(kind, t): f"no handler for {kind}" for t in targets})
+                continue
+            try:
+                failures = handler(session, targets) or {}
+            except Exception as e:
+                session.rollback()
+                failures = {t: str(e) for t in targets}
+            errors.update({(kind, t): err for t, err in failures.items()})
+
+        failed_videos = set()
+        for job in jobs:
+            final = complete_job(session, job, errors.get((job.kind, job.target_id)))
+            if final and job.kind in VIDEO_JOB_KINDS:
+                failed_videos.add(job.target_id)
+
+        # A video is ready once nothing is queued or running for it any more.
+        busy = set(session.exec(
+            select(BackgroundJob.target_id).where(
+                BackgroundJob.target_id.in_(list(video_ids)),
+                BackgroundJob.kind.in_(VIDEO_JOB_KINDS),
+                BackgroundJob.status.in_(("pending", "running")),
+            )
+        ).all())
+        _set_video_status(session, failed_videos, "failed")
+        _set_video_status(session, video_ids - busy - failed_videos, "ready")
+        _set_video_status(session, busy - failed_videos, "pending")
+        session.commit()
+
+    return len(errors)
+
+
+def queue_stats(session: Session) -> List[dict]:
+    rows = session.exec(
+        select(BackgroundJob.kind, BackgroundJob.status, func.count(BackgroundJob.id))
+        .group_by(BackgroundJob.kind, BackgroundJob.status)
+    ).all()
+    return [{"kind": kind, "status": status, "count": count} for kind, status, count in rows]
+
+
+# --- handlers ---
+
+@job_handler(EMBED_VIDEO)
+def _embed_videos(session: Session, video_ids: List[int]) -> Dict[int, str]:
+    from vector_embeddings import (
+        VideoMeta,
+        embeddings_enabled,
+        encode_texts,
+        set_video_embedding,
+        video_embedding_text,
+        video_index,
+    )
+
+    if not embeddings_enabled():
+        return {}
+
+    videos = session.exec(select(Video).where(Video.id.in_(video_ids))).all()
+    texts = {v.id: video_embedding_text(v.title, v.description) for v in videos}
+    encodable = [v for v in videos if texts[v.id]]
+    # One batched encode for the whole claim instead of one per request.
+    vectors = encode_texts([texts[v.id] for v in encodable]) if encodable else []
+    by_id = {v.id: vec for v, vec in zip(encodable, vectors)}
+
+    for video in videos:
+        set_video_embedding(video, by_id.get(video.id))
+        session.add(video)
+    session.commit()
+
+    for video in videos:
+        vector = by_id.get(video.id)
+        if vector is not None:
+            video_index.upsert(video.id, vector, VideoMeta.from_video(video))
+        else:
+            video_index.remove(video.id)
+    return {}
+
+
+@job_handler(FETCH_TRANSCRIPT)
+def _fetch_transcripts(session: Session, video_ids: List[int]) -> Dict[int, str]:
+    try:
+        from transcripts import fetch_transcript_segments, transcript_text_from_segments
+    except ImportError:
+        print("⚠️ Transcript library missing; skipping caption fetch.")
+        return {}
+    from transcript_chunks import embed_video_transcript
+
+    videos = session.exec(select(Video).where(Video.id.in_(video_ids), Video.video_url.is_not(None))).all()
+    with ThreadPoolExecutor(max_workers=TRANSCRIPT_FETCH_THREADS) as pool:
+        fetched = list(pool.map(lambda v: fetch_transcript_segments(v.video_url), videos))
+
+    failures: Dict[int, str] = {}
+    for video, segments in zip(videos, fetched):
+        if not segments:
+            continue  # No captions available is not an error.
+        try:
+            video.transcript_text = transcript_text_from_segments(segments)
+            session.add(video)
+            # Commits the transcript text together with the chunks.
+            embed_video_transcript(video, session, segments)
+        except Exception as e:
+            session.rollback()
+            failures[video.id] = str(e)
+    return failures
+
+
+# --- worker ---
+
+class JobWorker:
+    """
+    Daemon thread that drains the queue in batches, sleeping between polls
+    unless woken by an enqueue in this process.
+    """
+
+    def __init__(self, batch_size: int = JOB_BATCH_SIZE, poll_seconds: float = JOB_POLL_SECONDS):
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self.processed = 0
+        self.failed = 0
+        self.last_batch_seconds: Optional[float] = None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._stop.clear()
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="job-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                jobs = claim_jobs(self.batch_size, exclude_kinds=(INGEST_MATERIAL,))
+                if jobs:
+                    started = time.monotonic()
+                    self.failed += run_jobs(jobs)
+                    self.processed += len(jobs)
+                    self.last_batch_seconds = round(time.monotonic() - started, 3)
+                    continue
+            except Exception as e:
+                print(f"⚠️ Job worker error: {e}")
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def stats(self) -> dict:
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "processed": self.processed,
+            "failed": self.failed,
+            "last_batch_seconds": self.last_batch_seconds,
+            "batch_size": self.batch_size,
+        }
+
+
+job_worker = JobWorker()
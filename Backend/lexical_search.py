@@ -0,0 +1,164 @@
+# lexical_search.py
+#
+# BM25 keyword search over Video title/description/transcript_text using a
+# SQLite FTS5 external-content table. Triggers keep the index in sync with
+# every write to `video` (API, playlist importer, curate.py), so there is no
+# per-process state to maintain. Non-SQLite databases fall back to ILIKE.
+
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import column, literal_column, table, text
+from sqlmodel import Session, col, func, select
+
+from models import Video
+
+FTS_TABLE = "video_fts"
+
+# Per-column BM25 weights: title, description, transcript_text.
+BM25_WEIGHTS = (10.0, 3.0, 1.0)
+
+# Rank constant for reciprocal rank fusion (60 is the value from the RRF paper).
+RRF_K = 60
+
+_FTS_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, description, transcript_text,
+        content='video', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON video BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description, transcript_text)
+        VALUES (new.id, new.title, new.description, new.transcript_text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON video BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, transcript_text)
+        VALUES ('delete', old.id, old.title, old.description, old.transcript_text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+    AFTER UPDATE OF title, description, transcript_text ON video BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, transcript_text)
+        VALUES ('delete', old.id, old.title, old.description, old.transcript_text);
+        INSERT INTO {FTS_TABLE}(rowid, title, description, transcript_text)
+        VALUES (new.id, new.title, new.description, new.transcript_text);
+    END
+    """,
+]
+
+_fts_ready: Optional[bool] = None
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+fts = table(FTS_TABLE, column("rowid"))
+
+
+def ensure_video_fts(engine) -> bool:
+    """
+    Create the FTS5 table + triggers if missing, and backfill it once.
+    Returns False when the database can't provide FTS5.
+    """
+    global _fts_ready
+    if engine.dialect.name != "sqlite":
+        _fts_ready = False
+        return False
+
+    try:
+        with engine.begin() as conn:
+            existed = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"),
+                {"name": FTS_TABLE},
+            ).first()
+            for ddl in _FTS_DDL:
+                conn.execute(text(ddl))
+            if not existed:
+                print("Building video full-text index...")
+                conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        _fts_ready = True
+    except Exception as e:
+        print(f"⚠️ Full-text search unavailable, using LIKE fallback: {e}")
+        _fts_ready = False
+    return _fts_ready
+
+
+def fts_available(session: Session) -> bool:
+    global _fts_ready
+    if _fts_ready is None:
+        bind = session.get_bind()
+        if bind.dialect.name != "sqlite":
+            _fts_ready = False
+        else:
+            _fts_ready = session.connection().execute(
+                text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"),
+                {"name": FTS_TABLE},
+            ).first() is not None
+    return _fts_ready
+
+
+def build_match_query(q: str, prefix_last: bool = False) -> str:
+    """
+    Turns free text into an FTS5 OR-query of quoted tokens, so user input
+    can never be parsed as FTS syntax. BM25 ranks docs matching more terms higher.
+    """
+    tokens = TOKEN_RE.findall((q or "").lower())
+    if not tokens:
+        return ""
+    quoted = [f'"{token}"' for token in tokens]
+    if prefix_last:
+        quoted[-1] += "*"
+    return " OR ".join(quoted)
+
+
+def lexical_video_hits(
+    session: Session,
+    q: str,
+    limit: int = 20,
+    filters=None,
+) -> List[Tuple[int, float]]:
+    """
+    Returns (video_id, bm25_score) pairs, best first (higher is better).
+    """
+    if fts_available(session):
+        match = build_match_query(q)
+        if not match:
+            return []
+        rank = func.bm25(literal_column(FTS_TABLE), *BM25_WEIGHTS)
+        stmt = (
+            select(Video.id, rank.label("rank"))
+            .select_from(fts)
+            .join(Video, Video.id == fts.c.rowid)
+            .where(literal_column(FTS_TABLE).op("MATCH")(match))
+        )
+        if filters is not None:
+            stmt = filters.apply(stmt)
+        rows = session.exec(stmt.order_by(rank).limit(limit)).all()
+        # SQLite's bm25() is negative, lower = better.
+        return [(video_id, -score) for video_id, score in rows]
+
+    term = (q or "").strip()
+    if not term:
+        return []
+    stmt = select(Video.id).where(
+        col(Video.title).ilike(f"%{term}%") | col(Video.description).ilike(f"%{term}%")
+    )
+    if filters is not None:
+        stmt = filters.apply(stmt)
+    rows = session.exec(stmt.limit(limit)).all()
+    return [(video_id, 0.0) for video_id in rows]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> List[int]:
+    """
+    Fuse several best-first id lists: score(d) = sum 1 / (k + rank_i(d)).
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)
@@ -1,5 +1,6 @@
 # main.py
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware 
 import uvicorn
@@ -7,14 +8,27 @@ from contextlib import asynccontextmanager
 import os
 
 from routers import auth, chat, videos, admin, notifications, playlists, storage, watch_history, faculty, modules, help_requests
-from database import create_db_and_tables
+from database import create_db_and_tables, engine
 from notifications import notification_manager
 from search import router as search_router
+from vector_embeddings import start_model_warmup, embedding_model_status
+from lexical_search import ensure_video_fts
+from job_queue import JOB_WORKER, job_worker
+from ingestion import chroma_health
+from ingestion_executor import ingestion_executor
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     create_db_and_tables()
+    ensure_video_fts(engine)
+    # Loads the embedding model off the event loop when EMBEDDING_MODEL_LOAD=eager.
+    start_model_warmup()
+    if JOB_WORKER:
+        job_worker.start()
+    ingestion_executor.start()
     yield
+    job_worker.stop()
+    ingestion_executor.shutdown()
 
 app = FastAPI(
     title="Lumeni API",
@@ -84,7 +98,22 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "version": "0.6.0"}
+    model_status = embedding_model_status()
+    if not model_status["ready"] and model_status["state"] != "failed":
+        # Tell the load balancer to hold traffic until the model is warm.
+        return JSONResponse(
+            status_code=503,
+            content={"status": "starting", "version": "0.6.0", "embedding_model": model_status},
+        )
+    vector_store = chroma_health()
+    degraded = model_status["state"] == "failed" or vector_store["state"] == "failed"
+    status = "degraded" if degraded else "healthy"
+    return {
+        "status": status,
+        "version": "0.6.0",
+        "embedding_model": model_status,
+        "vector_store": vector_store,
+    }
 
 if __name__ == "__main__":
     # Respect platform-assigned port when running directly.
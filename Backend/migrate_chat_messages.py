@@ -0,0 +1,63 @@
+# migrate_chat_messages.py
+#
+# Moves chat conversations from the ChatHistory.messages JSON column into
+# ChatMessage rows (one per message):
+#   python migrate_chat_messages.py               # clears the JSON copy
+#   python migrate_chat_messages.py --keep-json   # leave the JSON column untouched
+#
+# Safe to re-run: chats already migrated (message_count set) are skipped.
+# Chats that are not migrated here are converted on their first load.
+
+import argparse
+
+from sqlalchemy import text
+from sqlmodel import Session, select
+
+from chat_store import migrate_chat
+from database import engine, create_db_and_tables
+from models import ChatHistory
+
+
+def migrate_chat_messages(batch_size: int = 200, keep_json: bool = False) -> int:
+    # Makes sure ChatMessage / message_count exist on older databases.
+    create_db_and_tables()
+
+    chats = 0
+    messages = 0
+    last_id = 0
+    with Session(engine) as session:
+        while True:
+            batch = session.exec(
+                select(ChatHistory)
+                .where(ChatHistory.id > last_id, ChatHistory.message_count.is_(None))
+                .order_by(ChatHistory.id)
+                .limit(batch_size)
+            ).all()
+            if not batch:
+                break
+
+            for chat in batch:
+                messages += migrate_chat(session, chat, keep_json=keep_json)
+            session.commit()
+            chats += len(batch)
+
+            last_id = batch[-1].id
+            session.expunge_all()
+            print(f"  migrated {chats} chats / {messages} messages (last id {last_id})")
+
+    if not keep_json and chats:
+        # Reclaim the space previously used by the JSON text.
+        with engine.connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+
+    return messages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move chat messages from JSON into ChatMessage rows.")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--keep-json", action="store_true")
+    args = parser.parse_args()
+
+    total = migrate_chat_messages(args.batch_size, args.keep_json)
+    print(f"✅ Migrated {total} chat messages.")
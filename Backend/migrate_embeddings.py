@@ -0,0 +1,72 @@
+# migrate_embeddings.py
+#
+# Converts JSON-list Video embeddings into the compact binary format:
+#   python migrate_embeddings.py                 # float32, clears the JSON copy
+#   python migrate_embeddings.py --dtype float16
+#   python migrate_embeddings.py --keep-json     # leave the JSON column untouched
+
+import argparse
+
+from sqlalchemy import text, update
+from sqlmodel import Session, select
+
+from database import engine, create_db_and_tables
+from models import Video
+from vector_embeddings import BLOB_DTYPES, encode_embedding
+
+
+def migrate_embeddings(dtype: str = "float32", batch_size: int = 500, keep_json: bool = False) -> int:
+    # Makes sure embedding_blob / embedding_dtype exist on older databases.
+    create_db_and_tables()
+
+    converted = 0
+    last_id = 0
+    with Session(engine) as session:
+        while True:
+            rows = session.exec(
+                select(Video.id, Video.embedding)
+                .where(Video.id > last_id, Video.embedding.is_not(None))
+                .order_by(Video.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+
+            updates = []
+            for video_id, embedding in rows:
+                if not embedding:
+                    continue
+                values = {
+                    "id": video_id,
+                    "embedding_blob": encode_embedding(embedding, dtype),
+                    "embedding_dtype": dtype,
+                }
+                if not keep_json:
+                    values["embedding"] = None
+                updates.append(values)
+
+            if updates:
+                session.exec(update(Video), params=updates)
+                session.commit()
+                converted += len(updates)
+
+            last_id = rows[-1][0]
+            print(f"  converted {converted} embeddings (last id {last_id})")
+
+    if not keep_json and converted:
+        # Reclaim the space previously used by the JSON text.
+        with engine.connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+
+    return converted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert JSON video embeddings to binary blobs.")
+    parser.add_argument("--dtype", choices=sorted(BLOB_DTYPES), default="float32")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--keep-json", action="store_true")
+    args = parser.parse_args()
+
+    total = migrate_embeddings(args.dtype, args.batch_size, args.keep_json)
+    print(f"✅ Migrated {total} video embeddings to {args.dtype} blobs.")
@@ -0,0 +1,131 @@
+# model_cache.py
+#
+# Process-wide cache of chat model objects, keyed by a hash of the full
+# system instruction (tutor constitution + a module's guidelines). Modules
+# with the same guidelines share one entry, and edited guidelines hash to a
+# new key, so a stale model is never served and nothing has to be
+# invalidated; the old entry simply ages out.
+#
+# Entries that expire or are evicted are released (their discard callback,
+# e.g. deleting a Gemini context cache) only after MODEL_CACHE_DISCARD_GRACE,
+# so requests that picked the model up just before can still finish.
+
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+from cachetools import TTLCache
+
+MODEL_CACHE_SIZE = int(os.getenv("MODEL_CACHE_SIZE", "64"))
+# Entries are rebuilt after this long; with the grace period it must stay
+# below the Gemini context cache TTL when that is enabled.
+MODEL_CACHE_TTL = float(os.getenv("MODEL_CACHE_TTL", "3000"))
+MODEL_CACHE_DISCARD_GRACE = float(os.getenv("MODEL_CACHE_DISCARD_GRACE", "300"))
+
+# (model, discard callback or None)
+Entry = Tuple[Any, Optional[Callable[[Any], None]]]
+
+
+def instruction_key(system_instruction: str) -> str:
+    return hashlib.sha256(system_instruction.encode("utf-8")).hexdigest()
+
+
+class _EvictingTTLCache(TTLCache):
+    """A TTLCache that reports every entry it expires or evicts."""
+
+    def __init__(self, maxsize: int, ttl: float, on_evict: Callable[[Entry], None]):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self._on_evict = on_evict
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for _, entry in expired:
+            self._on_evict(entry)
+        return expired
+
+    def popitem(self):
+        key, entry = super().popitem()
+        self._on_evict(entry)
+        return key, entry
+
+
+class ModelCache:
+    def __init__(
+        self,
+        maxsize: int = MODEL_CACHE_SIZE,
+        ttl: float = MODEL_CACHE_TTL,
+        grace: float = MODEL_CACHE_DISCARD_GRACE,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.grace = grace
+        self._models = _EvictingTTLCache(maxsize, ttl, self._retire)
+        # (retired at, entry) waiting out the grace period
+        self._retired: List[Tuple[float, Entry]] = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+
+    def _retire(self, entry: Entry) -> None:
+        # Called by the cache, under self._lock.
+        if entry[1] is not None:
+            self._retired.append((time.monotonic(), entry))
+
+    def get_or_build(self, system_instruction: str, build: Callable[[], Entry]) -> Any:
+        """
+        The cached model for this instruction, or build() -> (model, discard)
+        on a miss. discard(model) runs once the entry has left the cache.
+        """
+        key = instruction_key(system_instruction)
+        try:
+            with self._lock:
+                self._models.expire()
+                entry = self._models.get(key)
+                if entry is not None:
+                    self.hits += 1
+                    return entry[0]
+                self.misses += 1
+
+            # Build outside the lock; a concurrent miss at worst builds twice.
+            entry = build()
+            with self._lock:
+                previous = self._models.get(key)
+                if previous is not None:
+                    self._retire(entry)
+                    return previous[0]
+                self._models[key] = entry
+            return entry[0]
+        finally:
+            self._discard_retired()
+
+    def _discard_retired(self) -> None:
+        cutoff = time.monotonic() - self.grace
+        with self._lock:
+            due = [entry for retired_at, entry in self._retired if retired_at <= cutoff]
+            self._retired = [item for item in self._retired if item[0] > cutoff]
+        for model, discard in due:
+            try:
+                discard(model)
+                self.discarded += 1
+            except Exception as e:
+                print(f"⚠️ Could not release cached model: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._models),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "retired": len(self._retired),
+                "discarded": self.discarded,
+            }
+
+
+model_cache = ModelCache()
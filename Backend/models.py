@@ -1,6 +1,7 @@
 # models.py
 
 from sqlmodel import SQLModel, Field, JSON, Column, Relationship
+from sqlalchemy import Index, LargeBinary
 from pydantic import EmailStr, BaseModel
 from typing import Optional, List
 from datetime import datetime, timezone # <--- Import specific class
@@ -41,6 +42,9 @@ class Module(SQLModel, table=True):
     system_prompt: Optional[str] = None
     institution_id: int = Field(foreign_key="institution.id")
     created_at: datetime = Field(default_factory=utc_now)
+    # Bumped whenever the module's searchable materials change, so every
+    # worker can tell its cached retrieval pools are stale.
+    materials_version: Optional[int] = None
 
     institution: "Institution" = Relationship(back_populates="modules")
     users: List["User"] = Relationship(back_populates="modules", link_model=UserModule)
@@ -92,13 +96,51 @@ class Video(SQLModel, table=True):
 
     transcript_text: Optional[str] = None
 
-    # SQLite: Use JSON instead of pgvector
-    embedding: Optional[List[float]] = Field(default=None, sa_column=Column(JSON))
+    # SQLite: Use JSON instead of pgvector. None is stored as SQL NULL (not the
+    # JSON text 'null') so "no embedding" filters can use IS NULL.
+    embedding: Optional[List[float]] = Field(default=None, sa_column=Column(JSON(none_as_null=True)))
+    # Compact storage: raw vector bytes ("float32" or "float16" in embedding_dtype)
+    embedding_blob: Optional[bytes] = Field(default=None, sa_column=Column(LargeBinary))
+    embedding_dtype: Optional[str] = None
+    # Background embedding progress: "pending" | "processing" | "ready" | "failed"
+    embedding_status: Optional[str] = None
 
     uploader: "User" = Relationship(back_populates="videos")
     watch_history_entries: List["WatchHistory"] = Relationship(back_populates="video")
 
 
+# ================================
+# VIDEO TRANSCRIPT CHUNKS
+# ================================
+class VideoTranscriptChunk(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    video_id: int = Field(foreign_key="video.id", index=True)
+    seq: int = 0
+
+    # Position in the video, in seconds (None when only plain text was available)
+    start_seconds: Optional[float] = None
+    end_seconds: Optional[float] = None
+    text: str
+
+    embedding_blob: Optional[bytes] = Field(default=None, sa_column=Column(LargeBinary))
+    embedding_dtype: Optional[str] = None
+
+
+# ================================
+# BACKGROUND JOBS
+# ================================
+class BackgroundJob(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str = Field(index=True)  # e.g. "embed_video", "fetch_transcript"
+    target_id: int = Field(index=True)
+    status: str = Field(default="pending", index=True)  # pending | running | failed
+    attempts: int = 0
+    claimed_by: Optional[str] = None
+    last_error: Optional[str] = None
+    created_at: datetime = Field(default_factory=utc_now)
+    updated_at: datetime = Field(default_factory=utc_now)
+
+
 # ================================
 # PLAYLIST TABLE
 # ================================
@@ -124,16 +166,38 @@ class Message(SQLModel):
 
 
 class ChatHistory(SQLModel, table=True):
+    # Backs the newest-first, cursor-paginated chat list of a user.
+    __table_args__ = (Index("ix_chathistory_user_id_last_updated", "user_id", "last_updated"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str
     # FIX: Use 'datetime' directly
     last_updated: datetime = Field(default_factory=utc_now)
     user_id: int = Field(foreign_key="user.id")
+    # Legacy JSON copy of the conversation; turns now live in ChatMessage.
+    # Emptied by migrate_chat_messages.py (or lazily on first load).
     messages: List[Message] = Field(default_factory=list, sa_column=Column(JSON))
+    # Number of ChatMessage rows, i.e. the next seq.
+    message_count: Optional[int] = None
+    # Rolling summary of messages with seq < summary_seq (see chat_summary.py).
+    summary: Optional[str] = None
+    summary_seq: Optional[int] = None
 
     user: User = Relationship(back_populates="chats")
 
 
+class ChatMessage(SQLModel, table=True):
+    """One message of a ChatHistory; rows are only ever appended."""
+    __table_args__ = (Index("ix_chatmessage_chat_id_seq", "chat_id", "seq", unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    chat_id: int = Field(foreign_key="chathistory.id")
+    seq: int
+    role: str  # "user" or "bot"
+    content: str
+    timestamp: str
+
+
 # ================================
 # BROADCAST NOTIFICATION
 # ================================
@@ -186,6 +250,11 @@ class ModuleMaterial(SQLModel, table=True):
     tag: str
     created_at: datetime = Field(default_factory=utc_now)
     updated_at: datetime = Field(default_factory=utc_now)
+    # sha256 of the uploaded file; identical uploads share chunks and embeddings
+    content_hash: Optional[str] = Field(default=None, index=True)
+    # Ingestion progress: "queued" | "parsing" | "embedding" | "done" | "failed"
+    ingest_status: Optional[str] = None
+    ingest_error: Optional[str] = None
 
     module: "Module" = Relationship(back_populates="materials")
     uploader: "User" = Relationship()
@@ -229,6 +298,16 @@ class ModuleMaterialPublic(SQLModel):
     tag: str
     created_at: datetime
     updated_at: datetime
+    ingest_status: Optional[str] = None
+    ingest_error: Optional[str] = None
+
+class MaterialIngestStatus(BaseModel):
+    material_id: int
+    status: Optional[str] = None
+    error: Optional[str] = None
+    pages_done: Optional[int] = None
+    pages_total: Optional[int] = None
+    chunks_done: Optional[int] = None
 
 class HelpRequestPublic(SQLModel):
     id: int
@@ -247,6 +326,13 @@ class VideoPublic(SQLModel):
     duration: int
     views: int
     tutor_name: Optional[str] = None
+    embedding_status: Optional[str] = None
+
+class VideoSearchResult(VideoPublic):
+    # Transcript segment that matched the query, if any
+    match_start_seconds: Optional[float] = None
+    match_end_seconds: Optional[float] = None
+    match_text: Optional[str] = None
 
 class VideoCreate(SQLModel):
     title: str
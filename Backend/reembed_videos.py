@@ -0,0 +1,285 @@
+# reembed_videos.py
+#
+# Bulk (re-)embedding of the video catalogue, e.g. after switching
+# EMBEDDING_MODEL_NAME or to backfill videos that have no embedding yet.
+#
+# Videos are streamed in keyset-paginated batches, encoded by a pool of
+# worker processes (one model copy each) and written back with bulk UPDATEs.
+# The last fully written id is checkpointed, so an interrupted run resumes
+# where it stopped.
+#
+#   python reembed_videos.py                          # everything, one worker
+#   python reembed_videos.py --workers 4 --batch-size 256
+#   python reembed_videos.py --only-missing           # backfill only
+#   python reembed_videos.py --transcripts            # also transcript chunks
+#   python reembed_videos.py --restart                # ignore the checkpoint
+
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import insert, update
+from sqlmodel import Session, select
+
+from database import create_db_and_tables, engine
+from models import Video, VideoTranscriptChunk
+from transcript_chunks import TRANSCRIPT_MAX_CHUNKS, chunk_transcript
+from vector_embeddings import (
+    BLOB_DTYPES,
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_STORAGE,
+    embedding_columns,
+    embeddings_enabled,
+    encode_embedding,
+    encode_texts,
+    get_embedding_model,
+    video_embedding_text,
+)
+from embedding_backends import EMBEDDING_BACKEND
+
+CHECKPOINT_PATH = Path(
+    os.getenv("REEMBED_CHECKPOINT", "vector_index/reembed_checkpoint.json")
+).resolve()
+
+# Texts per model.encode() mini-batch inside a worker.
+ENCODE_BATCH = 64
+
+
+# --- worker process ---
+
+def _init_worker(threads: int) -> None:
+    try:
+        import torch
+
+        # N workers x all cores each would just thrash.
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    get_embedding_model()
+
+
+def _encode_job(job: dict) -> dict:
+    """
+    Encode one batch: video texts, existing chunk texts and freshly chunked
+    transcripts, all in a single batched encode.
+    """
+    new_chunks: Dict[int, list] = {
+        video_id: chunk_transcript(text=transcript)[:TRANSCRIPT_MAX_CHUNKS]
+        for video_id, transcript in job["transcripts"]
+    }
+
+    texts = [text for _, text in job["videos"]]
+    texts += [text for _, text in job["chunks"]]
+    for chunks in new_chunks.values():
+        texts += [chunk.text for chunk in chunks]
+
+    vectors = encode_texts(texts, batch_size=ENCODE_BATCH) if texts else np.zeros((0, 0), np.float32)
+
+    pos = 0
+    videos = {}
+    for video_id, _ in job["videos"]:
+        videos[video_id] = vectors[pos]
+        pos += 1
+    chunks = {}
+    for chunk_id, _ in job["chunks"]:
+        chunks[chunk_id] = vectors[pos]
+        pos += 1
+    fresh = {}
+    for video_id, video_chunks in new_chunks.items():
+        fresh[video_id] = [(chunk, vectors[pos + i]) for i, chunk in enumerate(video_chunks)]
+        pos += len(video_chunks)
+
+    return {"last_id": job["last_id"], "videos": videos, "chunks": chunks, "new_chunks": fresh}
+
+
+# --- checkpoint ---
+
+def _run_signature(only_missing: bool, transcripts: bool) -> dict:
+    return {
+        "model": EMBEDDING_MODEL_NAME,
+        "backend": EMBEDDING_BACKEND,
+        "storage": EMBEDDING_STORAGE,
+        "only_missing": only_missing,
+        "transcripts": transcripts,
+    }
+
+
+def load_checkpoint(signature: dict) -> Tuple[int, int]:
+    """
+    Returns (last_id, done) from a checkpoint written by the same kind of run.
+    """
+    if not CHECKPOINT_PATH.exists():
+        return 0, 0
+    try:
+        data = json.loads(CHECKPOINT_PATH.read_text())
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Ignoring unreadable checkpoint: {e}")
+        return 0, 0
+    if data.get("signature") != signature:
+        print("⚠️ Checkpoint was written with different settings; starting over.")
+        return 0, 0
+    return int(data.get("last_id", 0)), int(data.get("done", 0))
+
+
+def save_checkpoint(signature: dict, last_id: int, done: int) -> None:
+    CHECKPOINT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = CHECKPOINT_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"signature": signature, "last_id": last_id, "done": done}))
+    os.replace(tmp, CHECKPOINT_PATH)
+
+
+# --- main process ---
+
+def _next_job(session: Session, last_id: int, batch_size: int, only_missing: bool, transcripts: bool) -> Optional[dict]:
+    stmt = select(Video.id, Video.title, Video.description).where(Video.id > last_id)
+    if only_missing:
+        stmt = stmt.where(Video.embedding_blob.is_(None), Video.embedding.is_(None))
+    rows = session.exec(stmt.order_by(Video.id).limit(batch_size)).all()
+    if not rows:
+        return None
+
+    job = {
+        "last_id": rows[-1][0],
+        "videos": [],
+        "chunks": [],
+        "transcripts": [],
+    }
+    for video_id, title, description in rows:
+        text = video_embedding_text(title, description)
+        if text:
+            job["videos"].append((video_id, text))
+
+    if transcripts:
+        ids = [row[0] for row in rows]
+        chunk_rows = session.exec(
+            select(VideoTranscriptChunk.id, VideoTranscriptChunk.video_id, VideoTranscriptChunk.text)
+            .where(VideoTranscriptChunk.video_id.in_(ids))
+        ).all()
+        # Existing chunks keep their timestamps and are re-encoded in place;
+        # videos that only have plain transcript text get chunked here.
+        job["chunks"] = [(chunk_id, text) for chunk_id, _, text in chunk_rows]
+        chunked = {video_id for _, video_id, _ in chunk_rows}
+        unchunked = [video_id for video_id in ids if video_id not in chunked]
+        if unchunked:
+            job["transcripts"] = [
+                (video_id, transcript)
+                for video_id, transcript in session.exec(
+                    select(Video.id, Video.transcript_text).where(
+                        Video.id.in_(unchunked), Video.transcript_text.is_not(None)
+                    )
+                ).all()
+            ]
+    return job
+
+
+def _write_result(session: Session, result: dict) -> int:
+    chunk_storage = EMBEDDING_STORAGE if EMBEDDING_STORAGE in BLOB_DTYPES else "float32"
+
+    if result["videos"]:
+        session.exec(
+            update(Video),
+            params=[{"id": video_id, **embedding_columns(vec)} for video_id, vec in result["videos"].items()],
+        )
+    if result["chunks"]:
+        session.exec(
+            update(VideoTranscriptChunk),
+            params=[
+                {"id": chunk_id, "embedding_blob": encode_embedding(vec, chunk_storage), "embedding_dtype": chunk_storage}
+                for chunk_id, vec in result["chunks"].items()
+            ],
+        )
+    new_rows = [
+        {
+            "video_id": video_id,
+            "seq": seq,
+            "start_seconds": chunk.start_seconds,
+            "end_seconds": chunk.end_seconds,
+            "text": chunk.text,
+            "embedding_blob": encode_embedding(vec, chunk_storage),
+            "embedding_dtype": chunk_storage,
+        }
+        for video_id, pairs in result["new_chunks"].items()
+        for seq, (chunk, vec) in enumerate(pairs)
+    ]
+    if new_rows:
+        session.exec(insert(VideoTranscriptChunk), params=new_rows)
+    session.commit()
+    return len(result["videos"])
+
+
+def reembed_videos(
+    batch_size: int = 256,
+    workers: int = 1,
+    only_missing: bool = False,
+    transcripts: bool = False,
+    restart: bool = False,
+) -> int:
+    if not embeddings_enabled():
+        raise SystemExit("Embeddings are disabled (EMBEDDING_MODEL_LOAD=disabled).")
+
+    create_db_and_tables()
+    signature = _run_signature(only_missing, transcripts)
+    last_id, done = (0, 0) if restart else load_checkpoint(signature)
+    if last_id:
+        print(f"↩️ Resuming after video id {last_id} ({done} already done)")
+
+    threads = max(1, (os.cpu_count() or 1) // max(1, workers))
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=get_context("spawn"),  # no fork() after torch has started threads
+        initializer=_init_worker,
+        initargs=(threads,),
+    ) if workers > 1 else None
+
+    started = time.monotonic()
+    pending = deque()
+    exhausted = False
+    with Session(engine) as session:
+        try:
+            while True:
+                # Keep every worker busy plus one batch queued, reading ahead by id.
+                while not exhausted and len(pending) < max(1, workers) + 1:
+                    job = _next_job(session, last_id if not pending else pending[-1][0], batch_size, only_missing, transcripts)
+                    if job is None:
+                        exhausted = True
+                        break
+                    future = pool.submit(_encode_job, job) if pool else None
+                    pending.append((job["last_id"], future, job))
+                if not pending:
+                    break
+
+                # Results are written in id order so the checkpoint stays a prefix.
+                _, future, job = pending.popleft()
+                result = future.result() if future else _encode_job(job)
+                done += _write_result(session, result)
+                last_id = result["last_id"]
+                save_checkpoint(signature, last_id, done)
+
+                rate = done / max(time.monotonic() - started, 1e-9)
+                print(f"  {done} videos embedded (last id {last_id}, {rate:.1f}/s)")
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+
+    CHECKPOINT_PATH.unlink(missing_ok=True)
+    return done
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-embed all videos in resumable batches.")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--only-missing", action="store_true", help="skip videos that already have an embedding")
+    parser.add_argument("--transcripts", action="store_true", help="also (re-)embed transcript chunks")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    total = reembed_videos(args.batch_size, args.workers, args.only_missing, args.transcripts, args.restart)
+    print(f"✅ Re-embedded {total} videos. Running servers pick them up within VIDEO_INDEX_MAX_AGE.")
@@ -0,0 +1,266 @@
+# retrieval.py
+#
+# Module-material context for chat messages.
+#
+#   query -> embedding -> conversation cache hit? -> MMR over the cached pool
+#                      '-> Chroma top RETRIEVAL_CANDIDATES -> MMR -> prompt
+#
+# Follow-up messages in a conversation are usually about the same passages,
+# so each conversation remembers its last candidate pools. A new query whose
+# embedding is close enough to a remembered one re-ranks that pool instead
+# of querying Chroma again. MMR keeps the few chunks sent to Gemini relevant
+# but not redundant, and drops near-duplicates (overlapping windows, the same
+# file uploaded twice).
+#
+# Pools are tagged with the module's materials_version. Ingestion, retagging
+# and deletion bump it in the database, so every worker process stops
+# reusing pools built from the old materials.
+
+import os
+import threading
+import time
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+from cachetools import TTLCache
+from sqlalchemy import func, update
+from sqlmodel import Session, select
+
+from database import engine
+from ingestion import query_module_candidates
+from models import Module
+from vector_embeddings import embed_query
+
+# Chunks fetched from Chroma per query, and chunks that reach the prompt.
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "12"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+# "mmr" re-ranks the candidates; "none" keeps Chroma's top RETRIEVAL_TOP_K.
+RETRIEVAL_RERANK = os.getenv("RETRIEVAL_RERANK", "mmr").lower()
+# 1.0 is pure relevance, 0.0 pure diversity.
+RETRIEVAL_MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", "0.7"))
+# Candidates this similar to an already selected chunk are dropped.
+RETRIEVAL_DEDUP_SIMILARITY = float(os.getenv("RETRIEVAL_DEDUP_SIMILARITY", "0.95"))
+
+# Reuse a conversation's pool when the new query is at least this similar.
+RETRIEVAL_CACHE_SIMILARITY = float(os.getenv("RETRIEVAL_CACHE_SIMILARITY", "0.85"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "900"))
+RETRIEVAL_CACHE_CONVERSATIONS = int(os.getenv("RETRIEVAL_CACHE_CONVERSATIONS", "2048"))
+# Pools remembered per conversation.
+RETRIEVAL_CACHE_POOLS = 4
+
+
+class RetrievedChunk(NamedTuple):
+    document: str
+    metadata: dict
+    score: float
+
+
+class CandidatePool(NamedTuple):
+    module_id: int
+    version: int  # Module.materials_version the pool was fetched at
+    query: np.ndarray
+    documents: List[str]
+    metadatas: List[dict]
+    vectors: np.ndarray  # unit rows
+    created_at: float
+
+
+class Retrieval(NamedTuple):
+    chunks: List[RetrievedChunk]
+    pool: Optional[CandidatePool] = None
+    cached: bool = False
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector, axis=-1, keepdims=True)
+    return vector / np.where(norm == 0, 1.0, norm)
+
+
+def mmr(
+    query: np.ndarray,
+    vectors: np.ndarray,
+    k: int,
+    lambda_: float = RETRIEVAL_MMR_LAMBDA,
+    dedup_similarity: float = RETRIEVAL_DEDUP_SIMILARITY,
+) -> List[int]:
+    """
+    Maximal marginal relevance over unit vectors: repeatedly pick the row
+    maximising lambda * sim(query) - (1 - lambda) * max sim(selected).
+    Returns row indices, best first.
+    """
+    if not len(vectors) or k <= 0:
+        return []
+    relevance = vectors @ query
+    pairwise = vectors @ vectors.T
+    selected: List[int] = []
+    redundancy = np.zeros(len(vectors), dtype=np.float32)
+    available = np.ones(len(vectors), dtype=bool)
+
+    while len(selected) < k and available.any():
+        scores = lambda_ * relevance - (1 - lambda_) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, pairwise[best])
+        available &= pairwise[best] < dedup_similarity
+    return selected
+
+
+def _select(pool: CandidatePool, query: np.ndarray, k: int) -> List[RetrievedChunk]:
+    if RETRIEVAL_RERANK == "mmr":
+        order = mmr(query, pool.vectors, k)
+    else:
+        order = list(np.argsort(-(pool.vectors @ query))[:k])
+    return [
+        RetrievedChunk(pool.documents[i], pool.metadatas[i], float(pool.vectors[i] @ query))
+        for i in order
+    ]
+
+
+class RetrievalCache:
+    """
+    Per-conversation candidate pools (LRU + TTL over conversations), with
+    hit/miss counters.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = RETRIEVAL_CACHE_CONVERSATIONS,
+        ttl: float = RETRIEVAL_CACHE_TTL,
+        similarity: float = RETRIEVAL_CACHE_SIMILARITY,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.similarity = similarity
+        self._pools: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(
+        self, conversation_id: Optional[int], module_id: int, version: int, query: np.ndarray
+    ) -> Optional[CandidatePool]:
+        if conversation_id is None:
+            return None
+        with self._lock:
+            best, best_similarity = None, self.similarity
+            for pool in self._pools.get(conversation_id, ()):
+                if pool.module_id != module_id or pool.version != version:
+                    continue
+                if time.monotonic() - pool.created_at > self.ttl:
+                    continue
+                similarity = float(pool.query @ query)
+                if similarity >= best_similarity:
+                    best, best_similarity = pool, similarity
+            if best is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return best
+
+    def remember(self, conversation_id: Optional[int], pool: Optional[CandidatePool]) -> None:
+        if conversation_id is None or pool is None:
+            return
+        with self._lock:
+            pools = [p for p in self._pools.get(conversation_id, ()) if p is not pool]
+            self._pools[conversation_id] = (pools + [pool])[-RETRIEVAL_CACHE_POOLS:]
+
+    def invalidate_module(self, module_id: int) -> None:
+        """
+        Free this process's pools of a module whose materials changed. Other
+        processes notice through bump_materials_version().
+        """
+        with self._lock:
+            for conversation_id, pools in list(self._pools.items()):
+                kept = [p for p in pools if p.module_id != module_id]
+                if kept:
+                    self._pools[conversation_id] = kept
+                else:
+                    del self._pools[conversation_id]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pools.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "conversations": len(self._pools),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "similarity": self.similarity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+retrieval_cache = RetrievalCache()
+
+
+def module_materials_version(module_id: int) -> int:
+    with Session(engine) as session:
+        version = session.exec(select(Module.materials_version).where(Module.id == module_id)).first()
+    return version or 0
+
+
+def bump_materials_version(session: Session, module_id: int) -> None:
+    """
+    Mark a module's materials as changed (committed with the session), so no
+    worker reuses retrieval pools fetched before the change.
+    """
+    session.exec(
+        update(Module)
+        .where(Module.id == module_id)
+        .values(materials_version=func.coalesce(Module.materials_version, 0) + 1)
+        .execution_options(synchronize_session=False)
+    )
+    retrieval_cache.invalidate_module(module_id)
+
+
+def retrieve_module_context(
+    query: str,
+    module_id: int,
+    conversation_id: Optional[int] = None,
+    k: int = RETRIEVAL_TOP_K,
+) -> Retrieval:
+    """
+    The k best module chunks for a chat message. Blocking; run it in a
+    threadpool. Pass the result's pool to retrieval_cache.remember() once
+    the conversation id is known.
+    """
+    cleaned = (query or "").strip()
+    if not cleaned:
+        return Retrieval([])
+
+    embedding = embed_query(cleaned)
+    if not embedding:
+        return Retrieval([])
+    query_vector = _unit(embedding)
+
+    # Read before querying Chroma: a pool fetched across a bump gets the old
+    # version and is not reused.
+    version = module_materials_version(module_id)
+    pool = retrieval_cache.lookup(conversation_id, module_id, version, query_vector)
+    if pool is not None:
+        return Retrieval(_select(pool, query_vector, k), pool, cached=True)
+
+    candidates = query_module_candidates(embedding, module_id, max(k, RETRIEVAL_CANDIDATES))
+    if not candidates:
+        return Retrieval([])
+    documents, metadatas, vectors = zip(*candidates)
+    pool = CandidatePool(
+        module_id=module_id,
+        version=version,
+        query=query_vector,
+        documents=list(documents),
+        metadatas=list(metadatas),
+        vectors=_unit(np.stack([np.asarray(v, dtype=np.float32) for v in vectors])),
+        created_at=time.monotonic(),
+    )
+    return Retrieval(_select(pool, query_vector, k), pool)
@@ -7,6 +7,12 @@ from pydantic import BaseModel
 
 from database import get_db
 import models, security, youtube_utils 
+from vector_embeddings import query_cache, embedding_batcher
+from autocomplete import title_autocomplete
+from job_queue import enqueue_video_jobs, job_worker, queue_stats
+from ingestion_executor import ingestion_executor
+from retrieval import retrieval_cache
+from model_cache import model_cache
 from models import (
     UserCreate, UserPublic, PlaylistImportRequest,
     ActiveUsersStat, UserSignupStat, BroadcastNotification,
@@ -42,6 +48,68 @@ class ContentMetricsStat(BaseModel):
     total_students: int
     total_help_requests: int
 
+class EmbeddingCacheStat(BaseModel):
+    size: int
+    maxsize: int
+    ttl: float
+    hits: int
+    misses: int
+    hit_rate: float
+
+class EmbeddingBatcherStat(BaseModel):
+    batches: int
+    items: int
+    avg_batch_size: float
+    queued: int
+    failed: int
+    restarts: int
+
+class IngestionStat(BaseModel):
+    queued: int
+    queue_size: int
+    active: int
+    concurrency: int
+    parse_processes: int
+    completed: int
+    failed: int
+    recovered: int
+    embedder: EmbeddingBatcherStat
+
+class RetrievalCacheStat(BaseModel):
+    conversations: int
+    maxsize: int
+    ttl: float
+    similarity: float
+    hits: int
+    misses: int
+    hit_rate: float
+
+class ModelCacheStat(BaseModel):
+    size: int
+    maxsize: int
+    ttl: float
+    hits: int
+    misses: int
+    hit_rate: float
+    retired: int
+    discarded: int
+
+class JobQueueCount(BaseModel):
+    kind: str
+    status: str
+    count: int
+
+class JobWorkerStat(BaseModel):
+    running: bool
+    processed: int
+    failed: int
+    last_batch_seconds: Optional[float] = None
+    batch_size: int
+
+class JobQueueStat(BaseModel):
+    queue: List[JobQueueCount]
+    worker: JobWorkerStat
+
 class ActivityItem(BaseModel):
     type: str
     summary: str
@@ -275,9 +343,15 @@ def import_youtube_playlist(
                 uploader_id=admin.id,
             )
             db.add(new_video)
+            db.flush()
+            enqueue_video_jobs(db, new_video, transcript=True)
             added_count += 1
 
     db.commit()
+    if added_count:
+        # Bulk insert: cheaper to rebuild the suggest trie once than per video.
+        title_autocomplete.invalidate()
+        job_worker.wake()
     return {
         "message": f"Successfully imported {added_count} new videos out of {len(videos_data)} total."
     }
@@ -341,6 +415,36 @@ def get_content_metrics(db: Session = Depends(get_db)):
     }
 
 
+@router.get("/stats/embedding_cache", response_model=EmbeddingCacheStat)
+def get_embedding_cache_stats():
+    return query_cache.stats()
+
+
+@router.get("/stats/embedding_batcher", response_model=EmbeddingBatcherStat)
+def get_embedding_batcher_stats():
+    return embedding_batcher.stats()
+
+
+@router.get("/stats/ingestion", response_model=IngestionStat)
+def get_ingestion_stats():
+    return ingestion_executor.stats()
+
+
+@router.get("/stats/retrieval", response_model=RetrievalCacheStat)
+def get_retrieval_cache_stats():
+    return retrieval_cache.stats()
+
+
+@router.get("/stats/models", response_model=ModelCacheStat)
+def get_model_cache_stats():
+    return model_cache.stats()
+
+
+@router.get("/stats/jobs", response_model=JobQueueStat)
+def get_job_queue_stats(db: Session = Depends(get_db)):
+    return {"queue": queue_stats(db), "worker": job_worker.stats()}
+
+
 @router.get("/stats/recent_activity", response_model=List[ActivityItem])
 def get_recent_activity(limit: int = 20, db: Session = Depends(get_db)):
     materials = (
@@ -3,19 +3,22 @@ import io
 import logging
 import datetime
 import asyncio
-from typing import Optional, List, Dict, Any
+import json
+from typing import Optional, List, Dict, Any, AsyncIterator, NamedTuple, Tuple
 
 from fastapi import (
     APIRouter, Depends, HTTPException, status, 
-    UploadFile, File, Form
+    UploadFile, File, Form, Query
 )
 from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from sqlmodel import Session, select, SQLModel, col
+from sqlmodel import Session, select, SQLModel
 from dotenv import load_dotenv
 
 # Google Generative AI
 import google.generativeai as genai
+from google.generativeai import caching
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
 
 # File Parsing Libraries
@@ -26,9 +29,14 @@ import pptx
 # --- LOCAL IMPORTS ---
 # We need 'engine' to create a session inside the tool function
 from database import get_db, engine 
-from models import User, ChatHistory, Video, Module, UserModule
+from models import User, ChatHistory, ChatMessage, Module, UserModule
 from security import get_current_user
-from ingestion import query_module_chunks
+from retrieval import Retrieval, retrieval_cache, retrieve_module_context
+from chat_store import CHAT_HISTORY_MESSAGES, append_messages, message_page, recent_messages
+from chat_summary import fit_prompt, maybe_schedule_summary
+from lexical_search import lexical_video_hits
+from model_cache import model_cache
+from vector_embeddings import fetch_videos_in_order
 
 # Setup Logging
 logging.basicConfig(level=logging.INFO)
@@ -57,20 +65,16 @@ def search_videos(topic: str):
     
     # We create a new session here because tools run outside the main dependency injection flow
     with Session(engine) as session:
-        # Search logic: Check title or description for the keyword
-        statement = select(Video).where(
-            (col(Video.title).ilike(f"%{topic}%")) | 
-            (col(Video.description).ilike(f"%{topic}%"))
-        ).limit(3) # Limit to top 3 results to not overwhelm context
-        
-        videos = session.exec(statement).all()
+        # Search logic: BM25 over title/description/transcript (LIKE fallback without FTS5)
+        hits = lexical_video_hits(session, topic, limit=3) # Limit to top 3 results to not overwhelm context
+        videos = fetch_videos_in_order(session, [video_id for video_id, _ in hits])
         
         if not videos:
             return "No specific videos found in the database for this topic. Try explaining it with a metaphor instead."
         
         results = []
         for v in videos:
-            results.append(f"Title: {v.title}\nURL: /video/{v.id}\nDescription: {v.description[:100]}...")
+            results.append(f"Title: {v.title}\nURL: /video/{v.id}\nDescription: {(v.description or '')[:100]}...")
             
         return "Here are the relevant videos found:\n" + "\n---\n".join(results)
 
@@ -167,7 +171,19 @@ GENERATION_CONFIG = {
     "max_output_tokens": 4096,
 }
 
-def build_model(module_guidelines: Optional[str]) -> genai.GenerativeModel:
+GEMINI_MODEL_NAME = "gemini-2.5-flash"
+
+# Opt-in explicit context caching: the system instruction and tool schema are
+# stored once on Gemini's side and requests only reference them. Prompts below
+# the API's minimum cache size fall back to a normal model (Gemini 2.5 still
+# caches repeated prefixes implicitly). Each process creates its own cache
+# entries and deletes them once model_cache lets the model go, so keep
+# MODEL_CACHE_TTL + MODEL_CACHE_DISCARD_GRACE below this TTL.
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "0") == "1"
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+
+
+def system_instruction_for(module_guidelines: Optional[str]) -> str:
     system_instruction = TUTOR_CONSTITUTION
     if module_guidelines:
         system_instruction = (
@@ -176,14 +192,49 @@ def build_model(module_guidelines: Optional[str]) -> genai.GenerativeModel:
             + module_guidelines
             + "\n\nWhen using module materials, cite sources as 'Source: <name>'."
         )
+    return system_instruction
+
+
+def _delete_context_cache(cached_content) -> None:
+    cached_content.delete()
+
 
-    return genai.GenerativeModel(
-        model_name="gemini-2.5-flash",
+def create_model(system_instruction: str):
+    """(model, discard callback) for model_cache."""
+    if GEMINI_CONTEXT_CACHE:
+        try:
+            cached_content = caching.CachedContent.create(
+                model=f"models/{GEMINI_MODEL_NAME}",
+                system_instruction=system_instruction,
+                tools=[search_videos],
+                ttl=datetime.timedelta(seconds=GEMINI_CONTEXT_CACHE_TTL),
+            )
+            model = genai.GenerativeModel.from_cached_content(
+                cached_content=cached_content,
+                safety_settings=SAFETY_SETTINGS,
+                generation_config=GENERATION_CONFIG,
+            )
+            return model, lambda _: _delete_context_cache(cached_content)
+        except Exception as e:
+            logger.warning(f"Gemini context cache unavailable, using a plain model: {e}")
+
+    model = genai.GenerativeModel(
+        model_name=GEMINI_MODEL_NAME,
         system_instruction=system_instruction,
         safety_settings=SAFETY_SETTINGS,
         generation_config=GENERATION_CONFIG,
         tools=[search_videos],
     )
+    return model, None
+
+
+def build_model(module_guidelines: Optional[str]) -> genai.GenerativeModel:
+    """
+    The tutor model for these guidelines, shared between requests (models
+    are stateless; each request starts its own chat session).
+    """
+    system_instruction = system_instruction_for(module_guidelines)
+    return model_cache.get_or_build(system_instruction, lambda: create_model(system_instruction))
 
 router = APIRouter(
     prefix="/api/chat",
@@ -209,6 +260,23 @@ class ChatHistoryPublic(BaseModel):
     title: str
     last_updated: str
 
+class ChatHistoryPage(BaseModel):
+    chats: List[ChatHistoryPublic]
+    # Pass next_before / next_before_id as ?before= / ?before_id= for the next page.
+    has_more: bool = False
+    next_before: Optional[str] = None
+    next_before_id: Optional[int] = None
+
+class ChatDetail(BaseModel):
+    id: int
+    title: str
+    last_updated: datetime.datetime
+    user_id: int
+    messages: List[MessageSchema]
+    # Pass next_before_seq as ?before_seq= to load the previous page.
+    has_more: bool = False
+    next_before_seq: Optional[int] = None
+
 # --- 3. HELPER FUNCTIONS ---
 
 def parse_file_sync(file_bytes: bytes, filename: str, content_type: str) -> str:
@@ -273,108 +341,136 @@ def get_module_for_user(module_id: int, user: User, session: Session) -> Module:
 
 # --- 4. ENDPOINTS ---
 
-@router.get("/history", response_model=List[ChatHistoryPublic])
+@router.get("/history", response_model=ChatHistoryPage)
 def get_chat_history(
     session: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[datetime.datetime] = Query(None, description="next_before of the page already loaded"),
+    before_id: Optional[int] = Query(None, description="next_before_id of the page already loaded"),
 ):
-    statement = select(ChatHistory).where(
+    """
+    Newest chats first, `limit` at a time; older pages via the returned
+    `next_before`/`next_before_id` cursor.
+    """
+    statement = select(ChatHistory.id, ChatHistory.title, ChatHistory.last_updated).where(
         ChatHistory.user_id == current_user.id
-    ).order_by(ChatHistory.last_updated.desc())
+    )
+    if before is not None:
+        if before_id is not None:
+            statement = statement.where(
+                (ChatHistory.last_updated < before)
+                | ((ChatHistory.last_updated == before) & (ChatHistory.id < before_id))
+            )
+        else:
+            statement = statement.where(ChatHistory.last_updated < before)
+    statement = statement.order_by(ChatHistory.last_updated.desc(), ChatHistory.id.desc()).limit(limit + 1)
     
-    chats = session.exec(statement).all()
+    rows = session.exec(statement).all()
+    has_more = len(rows) > limit
+    chats = rows[:limit]
     
-    return [
-        ChatHistoryPublic(
-            id=c.id, 
-            title=c.title, 
-            last_updated=c.last_updated.isoformat()
-        ) 
-        for c in chats
-    ]
-
-@router.get("/{chat_id}", response_model=ChatHistory)
+    return ChatHistoryPage(
+        chats=[
+            ChatHistoryPublic(
+                id=chat_id, 
+                title=title, 
+                last_updated=last_updated.isoformat()
+            ) 
+            for chat_id, title, last_updated in chats
+        ],
+        has_more=has_more,
+        next_before=chats[-1][2].isoformat() if has_more else None,
+        next_before_id=chats[-1][0] if has_more else None,
+    )
+
+@router.get("/{chat_id}", response_model=ChatDetail)
 def get_single_chat(
     chat_id: int,
     session: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    limit: int = Query(50, ge=1, le=200),
+    before_seq: Optional[int] = Query(None, description="next_before_seq of the page already loaded"),
 ):
+    """
+    The newest `limit` messages of a chat (oldest first); older pages via
+    `before_seq`.
+    """
     chat = session.get(ChatHistory, chat_id)
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
     if chat.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
-    return chat
+    messages, has_more = message_page(session, chat, before_seq, limit)
+    return ChatDetail(
+        id=chat.id,
+        title=chat.title,
+        last_updated=chat.last_updated,
+        user_id=chat.user_id,
+        messages=[MessageSchema(role=m.role, content=m.content, timestamp=m.timestamp) for m in messages],
+        has_more=has_more,
+        next_before_seq=messages[0].seq if has_more and messages else None,
+    )
 
-@router.post("/send", response_model=ChatResponse)
-async def send_chat_message(
-    session: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
-    message: str = Form(""),  # Default to empty string if only file is sent
-    chat_id: Optional[int] = Form(None),
-    module_id: Optional[int] = Form(None),
-    files: List[UploadFile] = File([])
-):
+class PreparedTurn(NamedTuple):
+    chat: Optional[ChatHistory]
+    model: genai.GenerativeModel
+    history: List[dict]
+    content_parts: List[Any]
+    citations: List[str]
+    retrieved: Optional[Retrieval]
+
+
+async def prepare_chat_turn(
+    session: Session,
+    current_user: User,
+    message: str,
+    chat_id: Optional[int],
+    module_id: Optional[int],
+    files: List[UploadFile],
+) -> PreparedTurn:
+    """
+    Everything needed before calling Gemini: stored history, module context
+    and the parsed inputs. Raises HTTPException for invalid requests.
+    """
     chat_history_db: Optional[ChatHistory] = None
-    previous_messages: List[MessageSchema] = []
+    previous_messages: List[ChatMessage] = []
     
-    # 1. Retrieve Existing History
+    # 1. Retrieve Existing History: the messages after the rolling summary
     if chat_id:
         statement = select(ChatHistory).where(
             ChatHistory.id == chat_id,
             ChatHistory.user_id == current_user.id,
         )
         chat_history_db = session.exec(statement).first()
-        if chat_history_db and chat_history_db.messages:
-            previous_messages = [MessageSchema(**msg) for msg in chat_history_db.messages]
-
-    # 2. Build SDK History
-    sdk_history = []
-    for msg in previous_messages[-20:]: 
-        role = "model" if msg.role == "bot" else "user"
-        if msg.content:
-            sdk_history.append({"role": role, "parts": [msg.content]})
+        if chat_history_db:
+            previous_messages = recent_messages(
+                session, chat_history_db, CHAT_HISTORY_MESSAGES, since_seq=chat_history_db.summary_seq
+            )
 
     module_guidelines: Optional[str] = None
-    module_context: Optional[str] = None
+    retrieved: Optional[Retrieval] = None
+    context_chunks: List[str] = []
     citations: List[str] = []
 
     if module_id:
         module = get_module_for_user(module_id, current_user, session)
         module_guidelines = module.system_prompt
 
-        docs, metas = query_module_chunks(message, module_id)
-        context_parts: List[str] = []
-        for doc, meta in zip(docs, metas):
+        retrieved = await run_in_threadpool(
+            retrieve_module_context, message, module_id, chat_history_db.id if chat_history_db else None
+        )
+        for doc, meta, _ in retrieved.chunks:
             source = meta.get("source") or "Module material"
             tag = meta.get("tag") or "Material"
             label = f"{source} ({tag})"
             citations.append(label)
-            context_parts.append(f"[Source: {label}]\n{doc}")
-
-        if context_parts:
-            module_context = (
-                "[System: Module context follows. Use it to answer, and cite sources as 'Source: <name>'.]\n"
-                + "\n\n".join(context_parts)
-            )
+            context_chunks.append(f"[Source: {label}]\n{doc}")
 
     model = build_model(module_guidelines)
 
-    # Start the session with automatic function calling enabled
-    chat_session = model.start_chat(
-        history=sdk_history,
-        enable_automatic_function_calling=True 
-    )
-
-    # 3. Process Current Inputs
-    content_parts = []
-    
-    if module_context:
-        content_parts.append(module_context)
-
-    if message.strip():
-        content_parts.append(message)
-
+    # 2. Process Current Inputs
+    file_parts: List[Any] = []
     for file in files:
         content_type = file.content_type or "application/octet-stream"
         filename = file.filename or "unknown_file"
@@ -382,7 +478,7 @@ async def send_chat_message(
         file_bytes = await file.read()
         
         if content_type.startswith("image/"):
-            content_parts.append({
+            file_parts.append({
                 "mime_type": content_type,
                 "data": file_bytes
             })
@@ -393,27 +489,52 @@ async def send_chat_message(
                 filename, 
                 content_type
             )
-            content_parts.append(extracted_text)
+            file_parts.append(extracted_text)
 
-    if not content_parts:
+    if not message.strip() and not file_parts:
         raise HTTPException(status_code=400, detail="Cannot send an empty message.")
 
-    # 4. Call Gemini (Async)
+    # 3. Fit history and inputs into the per-request token budget
     try:
-        # The SDK will now automatically call search_videos() if the model decides to,
-        # run the function, feed the result back to the model, and generate the final response.
-        response = await chat_session.send_message_async(content_parts)
-        assistant_text = response.text
-        if citations:
-            citations_block = "\n\nSources:\n" + "\n".join(
-                [f"- {label}" for label in citations]
-            )
-            assistant_text = assistant_text + citations_block
-    except Exception as e:
-        logger.error(f"Gemini SDK Error: {e}")
-        raise HTTPException(status_code=502, detail=f"AI Service Error: {str(e)}")
+        fitted = fit_prompt(
+            chat_history_db.summary if chat_history_db else None,
+            previous_messages,
+            message if message.strip() else "",
+            context_chunks,
+            file_parts,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    sdk_history = fitted.history
+    # Only chunks that made it into the prompt are cited.
+    citations = citations[: len(fitted.context_chunks)]
+    content_parts = fitted.content_parts()
+
+    if not content_parts:
+        raise HTTPException(status_code=400, detail="Cannot send an empty message.")
+
+    return PreparedTurn(chat_history_db, model, sdk_history, content_parts, citations, retrieved)
+
+
+def citations_block(citations: List[str]) -> str:
+    if not citations:
+        return ""
+    return "\n\nSources:\n" + "\n".join([f"- {label}" for label in citations])
+
+
+def persist_chat_turn(
+    session: Session,
+    current_user: User,
+    turn: PreparedTurn,
+    message: str,
+    assistant_text: str,
+) -> Tuple[ChatHistory, MessageSchema, Optional[str]]:
+    """
+    Append the user message and the reply to the chat (creating it on the
+    first turn). Returns (chat, reply message, title of a new chat).
+    """
+    chat_history_db = turn.chat
 
-    # 5. Persist to Database
     user_msg_obj = MessageSchema(
         role="user",
         content=message, 
@@ -437,17 +558,13 @@ async def send_chat_message(
                 title=new_chat_title,
                 last_updated=datetime.datetime.now(datetime.timezone.utc),
                 user_id=current_user.id,
-                messages=[user_msg_obj.model_dump(), ai_msg_obj.model_dump()],
+                message_count=0,
             )
             session.add(chat_history_db)
-        else:
-            current_msgs = chat_history_db.messages or []
-            updated_msgs = current_msgs + [user_msg_obj.model_dump(), ai_msg_obj.model_dump()]
-            
-            chat_history_db.messages = updated_msgs
-            chat_history_db.last_updated = datetime.datetime.now(datetime.timezone.utc)
-            session.add(chat_history_db)
+            session.flush()
 
+        # Two appended rows, whatever the length of the conversation.
+        append_messages(session, chat_history_db, [user_msg_obj.model_dump(), ai_msg_obj.model_dump()])
         session.commit()
         session.refresh(chat_history_db)
 
@@ -456,9 +573,175 @@ async def send_chat_message(
         logger.error(f"Database Commit Error: {e}")
         raise HTTPException(status_code=500, detail="Failed to save chat history.")
 
+    # Follow-ups in this chat can re-rank the same candidates.
+    if turn.retrieved is not None:
+        retrieval_cache.remember(chat_history_db.id, turn.retrieved.pool)
+
+    # Older turns are folded into the summary in the background.
+    maybe_schedule_summary(session, chat_history_db)
+
+    return chat_history_db, ai_msg_obj, new_chat_title
+
+
+@router.post("/send", response_model=ChatResponse)
+async def send_chat_message(
+    session: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    message: str = Form(""),  # Default to empty string if only file is sent
+    chat_id: Optional[int] = Form(None),
+    module_id: Optional[int] = Form(None),
+    files: List[UploadFile] = File([])
+):
+    turn = await prepare_chat_turn(session, current_user, message, chat_id, module_id, files)
+
+    # Tool calls are run by generate_reply rather than the SDK's automatic
+    # function calling, which a context-cached model can't use.
+    chat_session = turn.model.start_chat(history=turn.history)
+
+    # 4. Call Gemini (Async)
+    try:
+        pieces = [
+            value
+            async for kind, value in generate_reply(chat_session, turn.content_parts, stream=False)
+            if kind == "text"
+        ]
+    except Exception as e:
+        logger.error(f"Gemini SDK Error: {e}")
+        raise HTTPException(status_code=502, detail=f"AI Service Error: {str(e)}")
+    if not pieces:
+        raise HTTPException(status_code=502, detail="AI Service Error: empty response")
+    assistant_text = "".join(pieces) + citations_block(turn.citations)
+
+    # 5. Persist to Database
+    chat_history_db, ai_msg_obj, new_chat_title = persist_chat_turn(
+        session, current_user, turn, message, assistant_text
+    )
+
     return ChatResponse(
         chat_id=chat_history_db.id, 
         new_message=ai_msg_obj,
         chat_title=new_chat_title,
-        citations=citations or None
-    )
\ No newline at end of file
+        citations=turn.citations or None
+    )
+
+
+# --- REPLY GENERATION & STREAMING ---
+
+# Model -> tool -> model round trips allowed within one reply.
+MAX_TOOL_ROUNDS = 3
+CHAT_TOOLS = {"search_videos": search_videos}
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _response_chunks(response, stream: bool):
+    if stream:
+        async for chunk in response:
+            yield chunk
+    else:
+        yield response
+
+
+async def generate_reply(chat_session, content, stream: bool = True) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Yields ("text", fragment) as Gemini generates (one fragment per round
+    with stream=False), and ("tool", call) when it requests a tool. Requested
+    tools are run here and their results sent back as the next request: the
+    SDK can't combine stream=True or cached content with automatic function
+    calling.
+    """
+    for _ in range(MAX_TOOL_ROUNDS + 1):
+        response = await chat_session.send_message_async(content, stream=stream)
+        calls = []
+        async for chunk in _response_chunks(response, stream):
+            parts = chunk.candidates[0].content.parts if chunk.candidates else []
+            for part in parts:
+                if "function_call" in part:
+                    calls.append(part.function_call)
+                elif part.text:
+                    yield "text", part.text
+        if not calls:
+            return
+
+        results = []
+        for call in calls:
+            args = dict(call.args)
+            yield "tool", {"name": call.name, "args": args}
+            tool = CHAT_TOOLS.get(call.name)
+            try:
+                result = await run_in_threadpool(tool, **args) if tool else f"Unknown tool '{call.name}'."
+            except Exception as e:
+                logger.error(f"Tool {call.name} failed: {e}")
+                result = f"The tool failed: {e}"
+            results.append(genai.protos.Part(
+                function_response=genai.protos.FunctionResponse(name=call.name, response={"result": result})
+            ))
+        content = genai.protos.Content(role="user", parts=results)
+
+    yield "text", "\n\n(I had to stop looking things up here — could you rephrase your question?)"
+
+
+@router.post("/send/stream")
+async def stream_chat_message(
+    session: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    message: str = Form(""),
+    chat_id: Optional[int] = Form(None),
+    module_id: Optional[int] = Form(None),
+    files: List[UploadFile] = File([])
+):
+    """
+    /send as Server-Sent Events: "token" events carry text as it is
+    generated, "tool" events announce tool calls, and a final "done" event
+    carries the ChatResponse once the turn is saved ("error" on failure).
+    """
+    # Validation errors still come back as normal HTTP errors.
+    turn = await prepare_chat_turn(session, current_user, message, chat_id, module_id, files)
+    chat_session = turn.model.start_chat(history=turn.history)
+
+    async def events() -> AsyncIterator[str]:
+        pieces: List[str] = []
+        try:
+            async for kind, value in generate_reply(chat_session, turn.content_parts):
+                if kind == "text":
+                    pieces.append(value)
+                    yield sse_event("token", {"text": value})
+                else:
+                    yield sse_event("tool", value)
+        except Exception as e:
+            logger.error(f"Gemini SDK Error: {e}")
+            yield sse_event("error", {"detail": f"AI Service Error: {str(e)}"})
+            return
+        if not pieces:
+            # Same as /send: an empty reply is an error and is not saved.
+            yield sse_event("error", {"detail": "AI Service Error: empty response"})
+            return
+
+        sources = citations_block(turn.citations)
+        if sources:
+            yield sse_event("token", {"text": sources})
+
+        # History is written once, after the whole reply has been streamed.
+        try:
+            chat_history_db, ai_msg_obj, new_chat_title = persist_chat_turn(
+                session, current_user, turn, message, "".join(pieces) + sources
+            )
+        except HTTPException as e:
+            yield sse_event("error", {"detail": e.detail})
+            return
+
+        done = ChatResponse(
+            chat_id=chat_history_db.id,
+            new_message=ai_msg_obj,
+            chat_title=new_chat_title,
+            citations=turn.citations or None,
+        )
+        yield sse_event("done", done.model_dump())
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,7 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
 from sqlmodel import Session, select
 from typing import List, Optional
 from pathlib import Path
+import hashlib
 import os
 from uuid import uuid4
 
@@ -11,12 +13,16 @@ from models import (
     ModulePublic,
     ModuleMaterial,
     ModuleMaterialPublic,
+    MaterialIngestStatus,
     UserModule,
     User,
 )
 from security import require_role
 from models import utc_now
-from ingestion import ingest_material, delete_material_vectors
+from ingestion import delete_material_vectors, get_ingest_progress, update_material_metadata
+from ingestion_executor import IN_PROGRESS_STATUSES, ingestion_executor, release_upload
+from job_queue import cancel_material_jobs
+from retrieval import bump_materials_version
 
 router = APIRouter(prefix="/api/faculty", tags=["Faculty Studio"])
 
@@ -66,6 +72,16 @@ def validate_upload(file: UploadFile) -> str:
     return suffix
 
 
+def ensure_ingest_capacity(session: Session) -> None:
+    # Refuse before the file is written, so a full queue costs nothing.
+    if not ingestion_executor.has_capacity(session):
+        raise HTTPException(
+            status_code=503,
+            detail="Too many materials are being processed. Please retry shortly.",
+            headers={"Retry-After": "30"},
+        )
+
+
 @router.get("/modules", response_model=List[ModulePublic], dependencies=[Depends(require_role("admin", "lecturer"))])
 def list_modules(
     session: Session = Depends(get_db),
@@ -119,7 +135,6 @@ def list_module_materials(
 @router.post("/modules/{module_id}/materials", response_model=ModuleMaterialPublic, dependencies=[Depends(require_role("admin", "lecturer"))])
 async def upload_module_material(
     module_id: int,
-    background_tasks: BackgroundTasks,
     tag: str = Form(...),
     file: UploadFile = File(...),
     session: Session = Depends(get_db),
@@ -128,6 +143,7 @@ async def upload_module_material(
     ensure_module_access(module_id, current_user, session)
 
     suffix = validate_upload(file)
+    ensure_ingest_capacity(session)
     FACULTY_UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
     storage_filename = f"{uuid4().hex}{suffix}"
@@ -138,6 +154,7 @@ async def upload_module_material(
         target.write(contents)
 
     material = ModuleMaterial(
+        content_hash=hashlib.sha256(contents).hexdigest(),
         module_id=module_id,
         uploader_id=current_user.id,
         original_filename=file.filename,
@@ -149,10 +166,12 @@ async def upload_module_material(
     )
 
     session.add(material)
+    session.flush()
+    # Committed together with the material, so the job survives a restart.
+    ingestion_executor.submit(session, material)
     session.commit()
     session.refresh(material)
-
-    background_tasks.add_task(ingest_material, material.id)
+    ingestion_executor.wake()
 
     return ModuleMaterialPublic.model_validate(material)
 
@@ -160,7 +179,6 @@ async def upload_module_material(
 @router.put("/materials/{material_id}", response_model=ModuleMaterialPublic, dependencies=[Depends(require_role("admin", "lecturer"))])
 async def update_module_material(
     material_id: int,
-    background_tasks: BackgroundTasks,
     tag: Optional[str] = Form(None),
     file: Optional[UploadFile] = File(None),
     session: Session = Depends(get_db),
@@ -175,22 +193,40 @@ async def update_module_material(
     if tag:
         material.tag = tag
 
+    # Only new file content is re-ingested; tag or filename changes are
+    # pushed to the existing chunks' metadata. An unfinished or failed
+    # ingestion is (re)queued so the new metadata isn't lost: a queued job
+    # absorbs the edit, and a running one finishes before the next starts.
+    reingest = material.ingest_status == "failed" or material.ingest_status in IN_PROGRESS_STATUSES
+    content_hash = None
     if file:
         suffix = validate_upload(file)
-        FACULTY_UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+        contents = await file.read()
+        content_hash = hashlib.sha256(contents).hexdigest()
+        if content_hash == material.content_hash:
+            content_hash = None  # same bytes: keep the stored file and vectors
+        else:
+            reingest = True
+
+    if reingest:
+        ensure_ingest_capacity(session)
+        ingestion_executor.submit(session, material)
 
-        new_storage_filename = f"{uuid4().hex}{suffix}"
-        new_storage_path = FACULTY_UPLOAD_DIR / new_storage_filename
+    replaced_filename = None
+    if file:
+        if content_hash:
+            FACULTY_UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+
+            new_storage_filename = f"{uuid4().hex}{suffix}"
+            new_storage_path = FACULTY_UPLOAD_DIR / new_storage_filename
 
-        with new_storage_path.open("wb") as target:
-            contents = await file.read()
-            target.write(contents)
+            with new_storage_path.open("wb") as target:
+                target.write(contents)
 
-        old_path = FACULTY_UPLOAD_DIR / material.storage_filename
-        if old_path.exists():
-            old_path.unlink()
+            replaced_filename = material.storage_filename
+            material.storage_filename = new_storage_filename
+            material.content_hash = content_hash
 
-        material.storage_filename = new_storage_filename
         material.original_filename = file.filename
         material.content_type = file.content_type or "application/octet-stream"
 
@@ -200,11 +236,42 @@ async def update_module_material(
     session.commit()
     session.refresh(material)
 
-    background_tasks.add_task(ingest_material, material.id)
+    if replaced_filename:
+        release_upload(session, material.id, replaced_filename)
+    if reingest:
+        ingestion_executor.wake()
+    else:
+        await run_in_threadpool(update_material_metadata, material.id)
+        bump_materials_version(session, material.module_id)
+        session.commit()
 
     return ModuleMaterialPublic.model_validate(material)
 
 
+@router.get("/materials/{material_id}/status", response_model=MaterialIngestStatus, dependencies=[Depends(require_role("admin", "lecturer"))])
+def get_material_ingest_status(
+    material_id: int,
+    session: Session = Depends(get_db),
+    current_user: User = Depends(require_role("admin", "lecturer")),
+):
+    material = session.get(ModuleMaterial, material_id)
+    if not material:
+        raise HTTPException(status_code=404, detail="Material not found")
+
+    ensure_module_access(material.module_id, current_user, session)
+
+    # Page/chunk counters exist only in the process doing the ingestion.
+    progress = get_ingest_progress(material_id) or {}
+    return MaterialIngestStatus(
+        material_id=material_id,
+        status=material.ingest_status,
+        error=material.ingest_error,
+        pages_done=progress.get("pages_done"),
+        pages_total=progress.get("pages_total"),
+        chunks_done=progress.get("chunks_done"),
+    )
+
+
 @router.delete("/materials/{material_id}", status_code=204, dependencies=[Depends(require_role("admin", "lecturer"))])
 def delete_module_material(
     material_id: int,
@@ -217,12 +284,14 @@ def delete_module_material(
 
     ensure_module_access(material.module_id, current_user, session)
 
-    storage_path = FACULTY_UPLOAD_DIR / material.storage_filename
-    if storage_path.exists():
-        storage_path.unlink()
-
+    module_id = material.module_id
+    storage_filename = material.storage_filename
+    cancel_material_jobs(session, material_id)
     session.delete(material)
     session.commit()
+    release_upload(session, material_id, storage_filename)
 
     delete_material_vectors(material_id)
+    bump_materials_version(session, module_id)
+    session.commit()
     return
@@ -13,20 +13,19 @@ from models import (
 )
 # Import these inside the function or safely to prevent import crashes
 from security import get_current_user, get_admin_user 
+from autocomplete import title_autocomplete
 
 # Try importing these safely
 try:
-    from vector_embeddings import generate_embedding_for_video
+    from vector_embeddings import VideoMeta, get_video_embedding, video_index
+    from transcript_chunks import delete_video_transcript, transcript_index
     EMBEDDINGS_AVAILABLE = True
 except ImportError:
     print("⚠️ Vector embeddings library missing. Semantic search will be disabled.")
     EMBEDDINGS_AVAILABLE = False
 
-try:
-    from transcripts import fetch_transcript_text 
-except ImportError:
-    print("⚠️ Transcript library missing.")
-    def fetch_transcript_text(url): return None
+# Transcript fetching and embedding run in the background job worker.
+from job_queue import cancel_video_jobs, enqueue_video_jobs, job_worker
 
 router = APIRouter(prefix="/api/videos", tags=["Videos"])
 
@@ -61,40 +60,26 @@ def upload_video(
     """
     print(f"📝 Processing upload for: {video_data.title} (ID: {video_data.video_url})")
 
-    # 1. SAFE TRANSCRIPT FETCHING
-    transcript = None
+    # 1. SAVE TO DATABASE (video row + its background jobs in one transaction)
     try:
-        # Only attempt if we have a valid-looking ID or URL
-        if video_data.video_url and len(video_data.video_url) > 5:
-            transcript = fetch_transcript_text(video_data.video_url)
-    except Exception as e:
-        print(f"⚠️ Warning: Could not fetch transcript: {e}")
-        # Continue without transcript - DO NOT CRASH
-
-    # 2. SAVE TO DATABASE
-    try:
-        new_video = Video.model_validate(video_data)
-        new_video.uploader_id = user.id
-        new_video.transcript_text = transcript
+        # uploader_id is required on the table model, so supply it while validating.
+        new_video = Video.model_validate(video_data, update={"uploader_id": user.id})
         new_video.views = 0 
 
         session.add(new_video)
+        session.flush()
+        has_url = bool(video_data.video_url and len(video_data.video_url) > 5)
+        enqueue_video_jobs(session, new_video, transcript=has_url)
         session.commit()
         session.refresh(new_video)
     except Exception as e:
         print(f"❌ Database Error: {e}")
         raise HTTPException(status_code=500, detail="Database error while saving video.")
 
-    # 3. SAFE EMBEDDING GENERATION
-    # This is the most likely cause of hard crashes (OOM or DLL errors)
-    if EMBEDDINGS_AVAILABLE:
-        try:
-            print("🧠 Generating AI embeddings...")
-            generate_embedding_for_video(new_video, session)
-            print("✅ Embeddings generated.")
-        except Exception as e:
-            print(f"⚠️ Failed to generate embedding (skipping): {e}")
-            # Continue - the video is already saved, so we return success
+    title_autocomplete.upsert(new_video.id, new_video.title, new_video.views)
+
+    # 2. Transcript + embeddings are picked up by the job worker
+    job_worker.wake()
 
     return VideoPublic.model_validate(new_video)
 
@@ -116,17 +101,26 @@ def update_video(
     
     for key, value in update_data.items():
         setattr(video, key, value)
+
+    # Only a title/description change needs a new embedding.
+    text_changed = "title" in update_data or "description" in update_data
+    if text_changed:
+        enqueue_video_jobs(session, video)
     
     session.add(video)
     session.commit()
     session.refresh(video)
 
-    # Re-generate embedding safely
+    title_autocomplete.upsert(video.id, video.title, video.views)
+
+    if text_changed:
+        job_worker.wake()
     if EMBEDDINGS_AVAILABLE:
-        try:
-            generate_embedding_for_video(video, session)
-        except Exception as e:
-            print(f"⚠️ Failed to update embedding: {e}")
+        # Keep the in-memory filter metadata in step with the row.
+        meta = VideoMeta.from_video(video)
+        transcript_index.set_video_meta(video.id, meta)
+        if not text_changed:
+            video_index.upsert(video.id, get_video_embedding(video), meta)
 
     return VideoPublic.model_validate(video)
 
@@ -148,9 +142,18 @@ def delete_video(
     ).all()
     for entry in history_entries:
         session.delete(entry)
+
+    cancel_video_jobs(session, video_id)
+    if EMBEDDINGS_AVAILABLE:
+        delete_video_transcript(video_id, session)
     
     session.delete(video)
     session.commit()
+
+    title_autocomplete.remove(video_id)
+
+    if EMBEDDINGS_AVAILABLE:
+        video_index.remove(video_id)
     return
 
 
@@ -1,15 +1,15 @@
 # search.py
 
-from fastapi import APIRouter, Depends, Query, HTTPException
-from sqlmodel import Session, select
-from typing import List
+from fastapi import APIRouter, Depends, Query
+from sqlmodel import Session
+from typing import List, Optional
 
 from database import get_db
-from models import Video, VideoPublic
-from vector_embeddings import (
-    generate_embedding_for_text,
-    semantic_search_videos,
-)
+from models import VideoSearchResult
+from vector_embeddings import VideoSearchFilters, embed_query, fetch_videos_in_order
+from transcript_chunks import fetch_chunks, semantic_video_matches
+from lexical_search import lexical_video_hits, reciprocal_rank_fusion
+from autocomplete import title_autocomplete
 
 router = APIRouter(prefix="/api/search", tags=["Search"])
 
@@ -20,47 +20,72 @@ def suggest_queries(
     q: str = Query(..., min_length=1),
     session: Session = Depends(get_db),
 ):
-    stmt = (
-        select(Video.title)
-        .where(Video.title.ilike(f"%{q}%"))
-        .limit(10)
-    )
-    results = session.exec(stmt).all()
-    # results is list of tuples -> flatten
-    return [title for (title,) in results]
+    # Prefix-trie lookup; the trie is (re)built from the DB only when stale.
+    title_autocomplete.ensure_built(session)
+    return title_autocomplete.suggest(q, limit=10)
+
 
+# Each ranker contributes this many candidates to the fused list.
+CANDIDATES_PER_RANKER = 50
 
-# ---------- 2. Semantic Search for Videos ----------
-@router.get("/videos", response_model=List[VideoPublic])
+
+# ---------- 2. Hybrid (BM25 + Semantic) Search for Videos ----------
+@router.get("/videos", response_model=List[VideoSearchResult])
 def search_videos(
     q: str = Query(..., min_length=1),
+    category: Optional[str] = Query(None),
+    tutor_name: Optional[str] = Query(None),
+    min_duration: Optional[int] = Query(None, ge=0),
+    max_duration: Optional[int] = Query(None, ge=0),
+    uploader_id: Optional[int] = Query(None),
+    mode: str = Query("hybrid", pattern="^(hybrid|semantic|lexical)$"),
+    limit: int = Query(20, gt=0, le=100),
     session: Session = Depends(get_db),
 ):
     q = q.strip()
     if not q:
         return []
 
-    # Step 1: Try semantic search
-    try:
-        query_embedding = generate_embedding_for_text(q)
-        semantic_results = semantic_search_videos(
-            session=session,
-            query_embedding=query_embedding,
-            limit=20,
-        )
-        if semantic_results:
-            # [FIX] Use model_validate for Pydantic V2/SQLModel compatibility
-            return [VideoPublic.model_validate(v) for v in semantic_results]
-    except Exception as e:
-        # Don't crash search if embeddings fail
-        print("Semantic search failed:", e)
-
-    # Step 2: Fallback — keyword search
-    fallback_stmt = (
-        select(Video)
-        .where(Video.title.ilike(f"%{q}%"))
-        .limit(20)
+    filters = VideoSearchFilters(
+        category=category,
+        tutor_name=tutor_name,
+        min_duration=min_duration,
+        max_duration=max_duration,
+        uploader_id=uploader_id,
     )
-    fallback_results = session.exec(fallback_stmt).all()
-    # [FIX] Use model_validate here as well
-    return [VideoPublic.model_validate(v) for v in fallback_results]
\ No newline at end of file
+    depth = max(limit, CANDIDATES_PER_RANKER)
+    rankings: List[List[int]] = []
+    matched_chunk = {}
+
+    # Step 1: Semantic ranking (title/description and transcript chunks, max-pooled)
+    if mode in ("hybrid", "semantic"):
+        try:
+            query_embedding = embed_query(q)
+            matches = semantic_video_matches(session, query_embedding, limit=depth, filters=filters)
+            rankings.append([m.video_id for m in matches])
+            matched_chunk = {m.video_id: m.chunk_id for m in matches if m.chunk_id is not None}
+        except Exception as e:
+            # Don't crash search if embeddings fail
+            print("Semantic search failed:", e)
+
+    # Step 2: Lexical (BM25) ranking
+    if mode in ("hybrid", "lexical") or not any(rankings):
+        hits = lexical_video_hits(session, q, limit=depth, filters=filters)
+        rankings.append([video_id for video_id, _ in hits])
+
+    # Step 3: Reciprocal rank fusion
+    ids = reciprocal_rank_fusion(rankings)[:limit]
+    videos = fetch_videos_in_order(session, ids)
+    chunks = fetch_chunks(session, [matched_chunk[i] for i in ids if i in matched_chunk])
+
+    results = []
+    for v in videos:
+        # [FIX] Use model_validate for Pydantic V2/SQLModel compatibility
+        result = VideoSearchResult.model_validate(v)
+        chunk = chunks.get(matched_chunk.get(v.id))
+        if chunk is not None:
+            result.match_start_seconds = chunk.start_seconds
+            result.match_end_seconds = chunk.end_seconds
+            result.match_text = chunk.text
+        results.append(result)
+    return results
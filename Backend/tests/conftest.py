@@ -0,0 +1,41 @@
+# Shared fixtures. Run from Backend/: python -m pytest tests
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# Modules import each other as top-level names (`from models import ...`).
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# Keep module-level engines away from the real lumeni.db.
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy.pool import StaticPool  # noqa: E402
+from sqlmodel import Session, SQLModel, create_engine  # noqa: E402
+
+import models  # noqa: E402
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    with Session(engine) as session:
+        yield session
+
+
+@pytest.fixture
+def uploader(session):
+    user = models.User(email="tutor@example.com", full_name="Tutor", role="lecturer", hashed_password="x")
+    session.add(user)
+    session.commit()
+    return user
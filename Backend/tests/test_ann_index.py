@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+import vector_embeddings
+from ann_index import IVFPartitions, vector_fingerprints
+from vector_embeddings import VideoVectorIndex
+
+
+@pytest.fixture(autouse=True)
+def small_ivf(monkeypatch):
+    monkeypatch.setattr(vector_embeddings, "VIDEO_ANN", "ivf")
+    monkeypatch.setattr(vector_embeddings, "VIDEO_ANN_MIN_SIZE", 0)
+    monkeypatch.setattr(vector_embeddings, "VIDEO_ANN_NLIST", 8)
+    monkeypatch.setattr(vector_embeddings, "VIDEO_ANN_NPROBE", 1)
+
+
+def _unit(rows):
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def _clustered(n_clusters=8, per_cluster=40, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = _unit(rng.normal(size=(n_clusters, dim)))
+    vectors = np.repeat(centres, per_cluster, axis=0) + 0.05 * rng.normal(size=(n_clusters * per_cluster, dim))
+    return centres, _unit(vectors).astype(np.float32)
+
+
+def _recall(index, query, limit=10):
+    approx = {video_id for video_id, _ in index.search(query, limit=limit)}
+    exact = {video_id for video_id, _ in index.search(query, limit=limit, exact=True)}
+    return len(approx & exact) / len(exact)
+
+
+def _move_video(vectors, row, centre):
+    moved = vectors.copy()
+    moved[row] = centre
+    return moved
+
+
+def test_rebuild_places_changed_vectors_again(tmp_path):
+    centres, vectors = _clustered()
+    ids = list(range(1, len(vectors) + 1))
+    index = VideoVectorIndex(snapshot=tmp_path / "ivf.npz")
+    index.load(ids, list(vectors))
+
+    # Video 1 is re-embedded into another cluster; its old partition is stale.
+    moved = _move_video(vectors, 0, centres[-1])
+    index.load(ids, list(moved))
+
+    hits = [video_id for video_id, _ in index.search(centres[-1], limit=5)]
+    assert 1 in hits
+    assert _recall(index, centres[-1]) == 1.0
+
+
+def test_cold_start_snapshot_ignores_changed_vectors(tmp_path):
+    centres, vectors = _clustered()
+    ids = list(range(1, len(vectors) + 1))
+    VideoVectorIndex(snapshot=tmp_path / "ivf.npz").load(ids, list(vectors))
+
+    moved = _move_video(vectors, 0, centres[-1])
+    index = VideoVectorIndex(snapshot=tmp_path / "ivf.npz")
+    index.load(ids, list(moved))
+
+    assert 1 in [video_id for video_id, _ in index.search(centres[-1], limit=5)]
+
+
+def test_snapshot_of_another_model_is_not_reused(tmp_path, monkeypatch):
+    _, vectors = _clustered()
+    ids = list(range(1, len(vectors) + 1))
+    VideoVectorIndex(snapshot=tmp_path / "ivf.npz").load(ids, list(vectors))
+    assert VideoVectorIndex(snapshot=tmp_path / "ivf.npz")._previous_partitions(vectors.shape[1]) is not None
+
+    monkeypatch.setattr(vector_embeddings, "EMBEDDING_MODEL_NAME", "another-model")
+    assert VideoVectorIndex(snapshot=tmp_path / "ivf.npz")._previous_partitions(vectors.shape[1]) is None
+
+
+def test_centroids_are_retrained_when_the_catalogue_grows(tmp_path, monkeypatch):
+    _, vectors = _clustered(per_cluster=20)
+    index = VideoVectorIndex(snapshot=tmp_path / "ivf.npz")
+    index.load(list(range(1, 41)), list(vectors[:40]))
+    assert index._ann.trained_size == 40
+
+    index.load(list(range(1, 61)), list(vectors[:60]))
+    assert index._ann.trained_size == 40
+
+    index.load(list(range(1, len(vectors) + 1)), list(vectors))
+    assert index._ann.trained_size == len(vectors)
+
+    monkeypatch.setattr(vector_embeddings, "VIDEO_ANN_NLIST", 4)
+    index.load(list(range(1, len(vectors) + 1)), list(vectors))
+    assert index._ann.nlist == 4
+
+
+def test_fingerprints_change_with_the_vector():
+    _, vectors = _clustered()
+    fingerprints = vector_fingerprints(vectors)
+    assert len(set(fingerprints.tolist())) == len(vectors)
+    changed = vectors.copy()
+    changed[3, 5] = np.nextafter(changed[3, 5], np.float32(2))
+    assert vector_fingerprints(changed)[3] != fingerprints[3]
+    assert (vector_fingerprints(changed)[4:] == fingerprints[4:]).all()
+
+
+def test_snapshot_round_trip(tmp_path):
+    _, vectors = _clustered()
+    ids = np.arange(1, len(vectors) + 1)
+    ann = IVFPartitions(vectors[:8], trained_size=len(vectors), model="m")
+    ann.assign_all(range(len(vectors)), np.argmax(vectors @ vectors[:8].T, axis=1))
+    ann.save(tmp_path / "ivf.npz", ids, vector_fingerprints(vectors))
+
+    snapshot = IVFPartitions.load(tmp_path / "ivf.npz")
+    assert snapshot.model == "m" and snapshot.trained_size == len(vectors)
+    assert snapshot.known[1] == (ann.partition_of(0), int(vector_fingerprints(vectors)[0]))
+    assert list(tmp_path.iterdir()) == [tmp_path / "ivf.npz"]
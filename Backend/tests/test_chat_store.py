@@ -0,0 +1,70 @@
+from sqlmodel import Session, select
+
+import models
+from chat_store import append_messages, recent_messages
+
+
+def _turn(text):
+    return [
+        {"role": "user", "content": text, "timestamp": "t"},
+        {"role": "bot", "content": f"re: {text}", "timestamp": "t"},
+    ]
+
+
+def _seqs(session, chat_id):
+    rows = session.exec(
+        select(models.ChatMessage).where(models.ChatMessage.chat_id == chat_id).order_by(models.ChatMessage.seq)
+    ).all()
+    return [(row.seq, row.content) for row in rows]
+
+
+def _chat(session, uploader, **fields):
+    chat = models.ChatHistory(title="Chat", user_id=uploader.id, **fields)
+    session.add(chat)
+    session.commit()
+    return chat
+
+
+def test_append_reserves_consecutive_seqs(session, uploader):
+    chat = _chat(session, uploader, message_count=0)
+
+    append_messages(session, chat, _turn("a"))
+    append_messages(session, chat, _turn("b"))
+    session.commit()
+    session.refresh(chat)
+
+    assert chat.message_count == 4
+    assert _seqs(session, chat.id) == [(0, "a"), (1, "re: a"), (2, "b"), (3, "re: b")]
+
+
+def test_stale_chat_does_not_reuse_seqs(engine, session, uploader):
+    chat = _chat(session, uploader, message_count=0)
+    stale = session.get(models.ChatHistory, chat.id)  # message_count read as 0
+
+    # Another request appends to the same chat in the meantime.
+    with Session(engine) as other:
+        append_messages(other, other.get(models.ChatHistory, chat.id), _turn("first"))
+        other.commit()
+
+    append_messages(session, stale, _turn("second"))
+    session.commit()
+
+    assert [seq for seq, _ in _seqs(session, chat.id)] == [0, 1, 2, 3]
+    assert [content for _, content in _seqs(session, chat.id)][2] == "second"
+
+
+def test_legacy_chat_is_migrated_before_appending(session, uploader):
+    legacy = [
+        {"role": "user", "content": "old question", "timestamp": "t"},
+        {"role": "bot", "content": "old answer", "timestamp": "t"},
+    ]
+    chat = _chat(session, uploader, messages=legacy, message_count=None)
+
+    append_messages(session, chat, _turn("new"))
+    session.commit()
+    session.refresh(chat)
+
+    assert chat.message_count == 4
+    assert chat.messages == []
+    assert [content for _, content in _seqs(session, chat.id)] == ["old question", "old answer", "new", "re: new"]
+    assert [m.content for m in recent_messages(session, chat, limit=2)] == ["new", "re: new"]
@@ -0,0 +1,177 @@
+import itertools
+
+import pytest
+from sqlmodel import select
+
+import chat_summary
+import models
+from chat_store import append_messages
+from chat_summary import (
+    IMAGE_TOKENS,
+    _plan_summary,
+    _store_summary,
+    build_history,
+    estimate_tokens,
+    fit_prompt,
+    history_tokens,
+    needs_summary,
+    prompt_tokens,
+    truncate_to_tokens,
+)
+
+
+def _messages(count, chars=400, first_role="user"):
+    roles = itertools.cycle(["user", "bot"] if first_role == "user" else ["bot", "user"])
+    return [
+        models.ChatMessage(chat_id=1, seq=seq, role=next(roles), content=f"{seq}:" + "x" * chars, timestamp="t")
+        for seq in range(count)
+    ]
+
+
+IMAGE = {"mime_type": "image/png", "data": b"\x89PNG"}
+
+
+def test_truncate_respects_the_limit():
+    text = "word " * 1000
+    for limit in (0, 1, 5, 100):
+        assert estimate_tokens(truncate_to_tokens(text, limit)) <= limit
+    assert truncate_to_tokens("short", 10) == "short"
+
+
+@pytest.mark.parametrize("budget", [0, 50, 300, 2000])
+def test_build_history_stays_within_budget(budget):
+    history = build_history("The student is revising limits. " * 50, _messages(30), budget)
+    assert history_tokens(history) <= budget
+
+
+@pytest.mark.parametrize("budget", [120, 250, 400, 1000])
+def test_build_history_never_opens_with_a_model_turn(budget):
+    for first_role in ("user", "bot"):
+        history = build_history(None, _messages(9, first_role=first_role), budget)
+        assert not history or history[0]["role"] == "user"
+        if budget >= 400:
+            assert history
+
+
+def test_build_history_keeps_the_newest_messages_after_the_summary():
+    messages = _messages(10, chars=100)
+    history = build_history("Earlier: derivatives.", messages, 200)
+    assert history[0]["role"] == "user" and "Earlier: derivatives." in history[0]["parts"][0]
+    assert history[1]["role"] == "model"
+    assert history[-1]["parts"][0] == messages[-1].content
+
+
+@pytest.mark.parametrize(
+    "message_chars, chunks, texts, images",
+    [
+        (10, 0, 0, 0),
+        (100_000, 0, 0, 0),
+        (2_000, 6, 0, 2),
+        (2_000, 6, 4, 3),
+        (50, 20, 1, 0),
+        (60_000, 10, 5, 23),
+    ],
+)
+def test_fit_prompt_stays_within_budget(message_chars, chunks, texts, images):
+    budget = 12000
+    fitted = fit_prompt(
+        "Summary of earlier work. " * 100,
+        _messages(40, chars=3000),
+        "q" * message_chars,
+        [f"[Source: notes ({i})]\n" + "c" * 1500 for i in range(chunks)],
+        ["f" * 30_000 for _ in range(texts)] + [IMAGE] * images,
+        budget=budget,
+    )
+    assert prompt_tokens(fitted.history, fitted.content_parts()) <= budget
+    assert sum(1 for part in fitted.files if not isinstance(part, str)) == images
+
+
+def test_fit_prompt_keeps_a_prefix_of_the_context_chunks():
+    chunks = [f"chunk {i} " + "c" * 4000 for i in range(10)]
+    fitted = fit_prompt(None, [], "question", chunks, [], budget=3000)
+    assert 0 < len(fitted.context_chunks) < len(chunks)
+    assert fitted.context_chunks == chunks[: len(fitted.context_chunks)]
+
+
+def test_fit_prompt_rejects_images_that_do_not_fit():
+    with pytest.raises(ValueError, match="images"):
+        fit_prompt(None, [], "look", [], [IMAGE] * 5, budget=1000)
+
+
+def test_fit_prompt_leaves_small_prompts_alone():
+    messages = _messages(4, chars=40)
+    fitted = fit_prompt(None, messages, "What is a limit?", ["ctx"], ["file text"], budget=12000)
+    assert fitted.message == "What is a limit?"
+    assert fitted.context_chunks == ["ctx"]
+    assert fitted.files == ["file text"]
+    assert len(fitted.history) == 4
+
+
+# --- summarisation cut points ---
+
+
+@pytest.fixture
+def chat(engine, session, uploader, monkeypatch):
+    monkeypatch.setattr(chat_summary, "engine", engine)
+    monkeypatch.setattr(chat_summary, "CHAT_HISTORY_TOKEN_BUDGET", 1000)
+    chat = models.ChatHistory(title="Limits", user_id=uploader.id, message_count=0)
+    session.add(chat)
+    session.commit()
+    return chat
+
+
+def _append(session, chat, count, chars=800, first_role="user"):
+    roles = itertools.cycle(["user", "bot"] if first_role == "user" else ["bot", "user"])
+    append_messages(
+        session, chat, [{"role": next(roles), "content": "y" * chars, "timestamp": "t"} for _ in range(count)]
+    )
+    session.commit()
+    session.refresh(chat)
+
+
+def _roles(session, chat):
+    rows = session.exec(select(models.ChatMessage).where(models.ChatMessage.chat_id == chat.id).order_by(models.ChatMessage.seq))
+    return [row.role for row in rows]
+
+
+def test_plan_keeps_half_the_budget_verbatim_from_a_student_message(session, chat):
+    _append(session, chat, 20)  # 200 tokens each
+    summary, start, end, folded = _plan_summary(chat.id)
+    roles = _roles(session, chat)
+
+    assert (summary, start) == (None, 0)
+    assert [m.seq for m in folded] == list(range(end))
+    assert roles[end] == "user"
+    kept_tokens = 200 * (len(roles) - end)
+    assert kept_tokens <= chat_summary.CHAT_HISTORY_TOKEN_BUDGET // 2
+
+
+def test_plan_moves_the_cut_past_tutor_messages(session, chat):
+    _append(session, chat, 9, first_role="bot")
+    _, _, end, _ = _plan_summary(chat.id)
+    assert _roles(session, chat)[end] == "user"
+
+
+def test_plan_skips_short_chats(session, chat):
+    _append(session, chat, 2, chars=40)
+    assert _plan_summary(chat.id) is None
+
+
+def test_summary_seq_only_advances_from_the_planned_start(session, chat):
+    _append(session, chat, 20)
+    assert needs_summary(session, chat)
+    _, start, end, _ = _plan_summary(chat.id)
+
+    assert _store_summary(chat.id, start, end, "They worked on limits.")
+    # A second task planned from the same start must not overwrite it.
+    assert not _store_summary(chat.id, start, end + 2, "stale")
+
+    session.refresh(chat)
+    assert (chat.summary, chat.summary_seq) == ("They worked on limits.", end)
+    assert not needs_summary(session, chat)
+
+    # The next plan starts where the last one ended.
+    _append(session, chat, 20)
+    _, next_start, next_end, folded = _plan_summary(chat.id)
+    assert next_start == end and next_end > end
+    assert folded[0].seq == end
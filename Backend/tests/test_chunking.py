@@ -0,0 +1,112 @@
+import pytest
+
+import chunking
+from chunking import chunk_pages, char_chunks, count_tokens, sentence_chunks, token_chunks
+
+LOREM = (
+    "Gradient descent updates the weights against the gradient. "
+    "The learning rate scales every step it takes. "
+    "Too large a rate overshoots the minimum and diverges. "
+    "Too small a rate converges, but only slowly. "
+    "Momentum averages recent gradients to smooth the path. "
+)
+RUN_ON = " ".join(f"word{i}" for i in range(200))  # one sentence, no breaks
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    # Size chunks with the built-in estimate whether or not transformers is installed.
+    monkeypatch.setattr(chunking, "_tokenizer", None)
+    monkeypatch.setattr(chunking, "_tokenizer_checked", True)
+
+
+@pytest.mark.parametrize("strategy", ["sentence", "token", "structure"])
+def test_chunks_never_exceed_max_tokens(strategy):
+    pages = [(1, LOREM * 3), (2, "RESULTS\n" + RUN_ON), (3, LOREM)]
+    builders = {
+        "sentence": lambda: sentence_chunks(pages, max_tokens=24),
+        "token": lambda: token_chunks(pages, max_tokens=24, overlap=4),
+        "structure": lambda: sentence_chunks(pages, max_tokens=24, structured=True),
+    }
+
+    chunks = list(builders[strategy]())
+
+    assert len(chunks) > 5
+    assert all(0 < count_tokens(chunk.text) <= 24 for chunk in chunks)
+    # Nothing is dropped on the way.
+    text = " ".join(chunk.text for chunk in chunks)
+    assert "word0" in text and "word199" in text
+
+
+def test_char_chunks_respect_chunk_size():
+    chunks = list(char_chunks([(1, LOREM * 10), (2, LOREM * 10)], chunk_size=300, overlap=50))
+
+    assert all(len(chunk.text) <= 300 for chunk in chunks)
+    assert chunks[0].page == 1 and chunks[-1].page == 2
+
+
+def test_token_windows_overlap():
+    words = [f"w{i}" for i in range(60)]
+    chunks = list(token_chunks([(1, " ".join(words))], max_tokens=20, overlap=5))
+
+    assert len(chunks) > 2
+    for prev, nxt in zip(chunks, chunks[1:]):
+        prev_words, next_words = prev.text.split(), nxt.text.split()
+        shared = [w for w in next_words if w in prev_words]
+        assert shared and prev_words[-len(shared):] == shared
+        assert count_tokens(" ".join(shared)) <= 5
+    assert chunks[-1].text.split()[-1] == "w59"
+
+
+def test_sentence_overlap_repeats_the_last_sentence():
+    sentences = chunking.split_sentences(LOREM)
+    max_tokens = count_tokens(sentences[0]) + count_tokens(sentences[1]) + 2
+    chunks = list(sentence_chunks([(1, LOREM)], max_tokens=max_tokens, overlap_sentences=1))
+
+    assert len(chunks) > 1
+    for prev, nxt in zip(chunks, chunks[1:]):
+        last = chunking.split_sentences(prev.text)[-1]
+        assert nxt.text.startswith(last)
+
+
+def test_sentence_broken_by_a_page_end_is_carried_over():
+    pages = [
+        (1, "Vectors have a length. The dot product of two unit vectors"),
+        (2, "equals the cosine of the angle between them. Orthogonal vectors score zero."),
+    ]
+    joined = "The dot product of two unit vectors equals the cosine of the angle between them."
+
+    chunks = list(sentence_chunks(pages, max_tokens=count_tokens(joined), overlap_sentences=0))
+
+    carried = [chunk for chunk in chunks if chunk.text == joined]
+    assert len(carried) == 1
+    assert carried[0].page == 1  # the page the sentence starts on
+    assert all(chunk.text != "equals the cosine of the angle between them." for chunk in chunks)
+
+
+def test_structure_never_crosses_a_heading():
+    pages = [
+        (1, "1 Introduction\nNeural networks learn features. They stack layers.\n2 Training\nWeights follow the gradient."),
+        (2, "The loss falls over epochs.\nMETHODS AND DATA\nWe used three datasets. Each was split in two."),
+    ]
+
+    chunks = list(chunk_pages(pages, strategy="structure"))
+
+    sections = {
+        "1 Introduction": ("Neural", "stack"),
+        "2 Training": ("gradient", "epochs"),
+        "METHODS AND DATA": ("datasets", "split"),
+    }
+    for chunk in chunks:
+        assert chunk.section in sections
+        for section, words in sections.items():
+            if section != chunk.section:
+                assert not any(word in chunk.text for word in words)
+    # The heading's text continues on the next page in its own chunk.
+    assert [c.section for c in chunks if "epochs" in c.text] == ["2 Training"]
+    assert [c.page for c in chunks if "epochs" in c.text] == [2]
+
+
+def test_unknown_strategy_falls_back_to_sentence():
+    pages = [(1, LOREM)]
+    assert list(chunk_pages(pages, strategy="nope")) == list(chunk_pages(pages, strategy="sentence"))
@@ -0,0 +1,38 @@
+import sys
+import types
+
+import pytest
+
+from embedding_backends import load_model
+
+
+@pytest.fixture
+def sentence_transformers(monkeypatch):
+    """A SentenceTransformer double whose ONNX backend is unavailable."""
+
+    class SentenceTransformer:
+        def __init__(self, model_name, device="cpu", backend="torch", model_kwargs=None):
+            if backend == "onnx":
+                raise ImportError("optimum is not installed")
+            self.backend = backend
+
+    module = types.SimpleNamespace(SentenceTransformer=SentenceTransformer)
+    monkeypatch.setitem(sys.modules, "sentence_transformers", module)
+    return module
+
+
+def test_fallback_reports_the_backend_actually_loaded(sentence_transformers):
+    loaded = load_model("all-MiniLM-L6-v2", "onnx-int8")
+    assert loaded.backend == "torch"
+    assert loaded.model.backend == "torch"
+
+
+def test_unknown_backend_falls_back_to_torch(sentence_transformers):
+    assert load_model("all-MiniLM-L6-v2", "tpu").backend == "torch"
+
+
+def test_strict_load_raises_instead_of_falling_back(sentence_transformers):
+    with pytest.raises(ImportError):
+        load_model("all-MiniLM-L6-v2", "onnx", strict=True)
+    with pytest.raises(ValueError):
+        load_model("all-MiniLM-L6-v2", "tpu", strict=True)
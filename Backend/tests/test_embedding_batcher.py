@@ -0,0 +1,78 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+from embedding_batcher import EmbeddingBatcher
+
+
+def _encode(texts):
+    return [np.full(2, len(text), dtype=np.float32) for text in texts]
+
+
+def test_concurrent_texts_are_encoded_in_one_batch():
+    batcher = EmbeddingBatcher(_encode, max_batch=8, max_wait_ms=50)
+    futures = [batcher.submit("a" * n) for n in range(1, 5)]
+    assert [f.result(timeout=1)[0] for f in futures] == [1, 2, 3, 4]
+    assert batcher.stats()["batches"] == 1
+
+
+def test_encoder_errors_reach_every_caller():
+    def broken(texts):
+        raise RuntimeError("model unavailable")
+
+    batcher = EmbeddingBatcher(broken, max_wait_ms=20)
+    futures = [batcher.submit("x"), batcher.submit("y")]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="model unavailable"):
+            future.result(timeout=1)
+    assert batcher.stats()["failed"] == 2
+    # The dispatcher survives and serves the next batch.
+    batcher.encode_fn = _encode
+    assert batcher.encode("abc", timeout=1)[0] == 3
+
+
+def test_short_encoder_output_fails_the_batch():
+    batcher = EmbeddingBatcher(lambda texts: _encode(texts)[:-1], max_wait_ms=20)
+    futures = [batcher.submit("x"), batcher.submit("y")]
+    for future in futures:
+        with pytest.raises(ValueError, match="1 vectors for 2 texts"):
+            future.result(timeout=1)
+
+
+def test_restarted_dispatcher_answers_requests_already_queued():
+    batcher = EmbeddingBatcher(_encode, max_wait_ms=0)
+    batcher.encode("warm", timeout=1)
+
+    # Simulate a dispatcher that died with requests still queued.
+    dead = threading.Thread(target=lambda: None)
+    dead.start()
+    dead.join()
+    batcher._thread = dead
+    orphan: Future = Future()
+    batcher._queue.put(("orphan", orphan))
+
+    assert batcher.encode("new", timeout=1)[0] == 3
+    assert orphan.result(timeout=1)[0] == 6
+    assert batcher.stats()["restarts"] == 1
+    assert batcher._pid == os.getpid()
+
+
+def test_encode_times_out_instead_of_hanging():
+    release = threading.Event()
+
+    def stuck(texts):
+        release.wait(5)
+        return _encode(texts)
+
+    batcher = EmbeddingBatcher(stuck, max_wait_ms=0, timeout=0.05)
+    try:
+        with pytest.raises(TimeoutError):
+            batcher.encode("x")
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(batcher.encode_async("y"))
+    finally:
+        release.set()
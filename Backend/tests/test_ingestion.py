@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+import ingestion
+
+
+class _Client:
+    def __init__(self, error=None):
+        self.error = error
+
+    def heartbeat(self):
+        if self.error:
+            raise self.error
+        return 1
+
+
+@pytest.fixture
+def chroma(monkeypatch):
+    monkeypatch.setattr(ingestion, "CHROMA_AVAILABLE", True)
+    monkeypatch.setattr(ingestion, "_collections", {"module_materials": object()})
+
+    def install(client):
+        monkeypatch.setattr(ingestion, "_chroma_client", client)
+        monkeypatch.setattr(ingestion, "_chroma_pid", os.getpid() if client else None)
+
+    return install
+
+
+def test_health_does_not_open_the_store(chroma, monkeypatch):
+    chroma(None)
+    monkeypatch.setattr(ingestion, "get_chroma_client", lambda: pytest.fail("health opened the store"))
+    assert ingestion.chroma_health() == {"state": "idle"}
+
+
+def test_health_reports_a_failing_handle_without_dropping_it(chroma):
+    client = _Client(ConnectionError("store unreachable"))
+    chroma(client)
+    assert ingestion.chroma_health() == {"state": "failed", "error": "store unreachable"}
+    assert ingestion._chroma_client is client
+    assert ingestion._collections
+
+
+def test_health_ok(chroma):
+    chroma(_Client())
+    assert ingestion.chroma_health() == {"state": "ok", "open_collections": 1}
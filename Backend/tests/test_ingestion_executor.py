@@ -0,0 +1,92 @@
+import pytest
+from sqlmodel import Session
+
+import ingestion_executor as executor_module
+import job_queue
+import models
+from ingestion_executor import IngestionExecutor, release_upload
+from job_queue import INGEST_MATERIAL
+
+
+@pytest.fixture
+def uploads(engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(executor_module, "engine", engine)
+    monkeypatch.setattr(job_queue, "engine", engine)
+    monkeypatch.setattr(executor_module, "FACULTY_UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(executor_module, "bump_materials_version", lambda session, module_id: None)
+    return tmp_path
+
+
+@pytest.fixture
+def material(session, uploader, uploads):
+    institution = models.Institution(name="Uni")
+    session.add(institution)
+    session.commit()
+    module = models.Module(code="MA101", name="Maths", institution_id=institution.id)
+    session.add(module)
+    session.commit()
+    (uploads / "a.pdf").write_bytes(b"old")
+    material = models.ModuleMaterial(
+        module_id=module.id,
+        uploader_id=uploader.id,
+        original_filename="notes.pdf",
+        storage_filename="a.pdf",
+        content_type="application/pdf",
+        tag="Notes",
+        ingest_status="queued",
+    )
+    session.add(material)
+    session.commit()
+    return material
+
+
+def _replace_file(session, material, uploads):
+    (uploads / "b.pdf").write_bytes(b"new")
+    material.storage_filename = "b.pdf"
+    session.add(material)
+    session.commit()
+    release_upload(session, material.id, "a.pdf")
+
+
+def test_replaced_upload_is_deleted_when_nothing_reads_it(session, material, uploads):
+    _replace_file(session, material, uploads)
+    assert not (uploads / "a.pdf").exists()
+
+
+def test_running_ingestion_keeps_its_file_until_it_finishes(session, material, uploads):
+    job_queue.enqueue(session, INGEST_MATERIAL, material.id)
+    session.commit()
+    executor = IngestionExecutor()
+    seen = {}
+
+    def process(job):
+        # The lecturer replaces the file while this run is reading it.
+        with Session(executor_module.engine) as other:
+            _replace_file(other, other.get(models.ModuleMaterial, material.id), uploads)
+        seen["old file during run"] = (uploads / "a.pdf").exists()
+        executor._stop.set()
+
+    executor._process = process
+    executor._run()
+
+    assert seen["old file during run"]
+    assert not (uploads / "a.pdf").exists()
+    assert (uploads / "b.pdf").exists()
+
+
+def test_deleted_material_file_is_removed_after_the_run(session, material, uploads):
+    job_queue.enqueue(session, INGEST_MATERIAL, material.id)
+    session.commit()
+    executor = IngestionExecutor()
+
+    def process(job):
+        with Session(executor_module.engine) as other:
+            other.delete(other.get(models.ModuleMaterial, material.id))
+            other.commit()
+            release_upload(other, material.id, "a.pdf")
+        assert (uploads / "a.pdf").exists()
+        executor._stop.set()
+
+    executor._process = process
+    executor._run()
+    assert not (uploads / "a.pdf").exists()
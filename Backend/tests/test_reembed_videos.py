@@ -0,0 +1,34 @@
+from sqlalchemy import text
+
+import models
+from reembed_videos import _next_job
+from vector_embeddings import embedding_columns
+
+
+def _video(session, uploader, title, vector=None):
+    video = models.Video(title=title, category="maths", uploader_id=uploader.id, **embedding_columns(vector))
+    session.add(video)
+    session.commit()
+    return video
+
+
+def test_only_missing_picks_up_videos_without_an_embedding(session, uploader):
+    missing = _video(session, uploader, "Limits")
+    _video(session, uploader, "Derivatives", vector=[0.1, 0.2, 0.3])
+
+    stored = session.exec(text(f"SELECT embedding IS NULL FROM video WHERE id = {missing.id}")).one()
+    assert stored[0] == 1
+
+    job = _next_job(session, last_id=0, batch_size=10, only_missing=True, transcripts=False)
+    assert [video_id for video_id, _ in job["videos"]] == [missing.id]
+
+
+def test_only_missing_skips_json_embeddings(session, uploader):
+    _video(session, uploader, "Integrals", vector=None)
+    legacy = models.Video(title="Series", category="maths", uploader_id=uploader.id, embedding=[0.5, 0.5])
+    session.add(legacy)
+    session.commit()
+
+    job = _next_job(session, last_id=0, batch_size=10, only_missing=True, transcripts=False)
+    assert legacy.id not in [video_id for video_id, _ in job["videos"]]
+    assert len(job["videos"]) == 1
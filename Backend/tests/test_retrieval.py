@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+from sqlalchemy import text
+
+import models
+import retrieval
+from retrieval import RetrievalCache, bump_materials_version, mmr, retrieve_module_context
+
+
+def _unit(*rows):
+    rows = np.asarray(rows, dtype=np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def test_mmr_puts_the_most_relevant_row_first():
+    vectors = _unit([0.2, 1, 0], [1, 0.1, 0], [0, 0, 1])
+    assert mmr(_unit([1, 0, 0])[0], vectors, k=3)[0] == 1
+
+
+def test_mmr_prefers_a_diverse_row_over_a_near_copy():
+    query = _unit([1, 1, 0])[0]
+    vectors = _unit([1, 0.9, 0], [1, 0.8, 0.05], [0.6, 1, 0])
+    assert mmr(query, vectors, k=2, lambda_=0.5, dedup_similarity=1.1) == [0, 2]
+
+
+def test_mmr_drops_near_duplicates():
+    vectors = _unit([1, 0, 0], [1, 0.01, 0], [0, 1, 0])
+    assert mmr(_unit([1, 0, 0])[0], vectors, k=3, dedup_similarity=0.95) == [0, 2]
+
+
+def test_mmr_handles_empty_input():
+    assert mmr(_unit([1, 0])[0], np.zeros((0, 2), dtype=np.float32), k=3) == []
+
+
+@pytest.fixture
+def module(engine, session, monkeypatch):
+    monkeypatch.setattr(retrieval, "engine", engine)
+    monkeypatch.setattr(retrieval, "retrieval_cache", RetrievalCache())
+    monkeypatch.setattr(retrieval, "embed_query", lambda query: [1.0, 0.0, 0.0])
+    calls = []
+
+    def candidates(embedding, module_id, n):
+        calls.append(module_id)
+        return [(f"chunk {i}", {"source": "notes.pdf"}, [1.0, 0.1 * i, 0.0]) for i in range(3)]
+
+    monkeypatch.setattr(retrieval, "query_module_candidates", candidates)
+    institution = models.Institution(name="Uni")
+    session.add(institution)
+    session.commit()
+    module = models.Module(code="MA101", name="Maths", institution_id=institution.id)
+    session.add(module)
+    session.commit()
+    return module, calls
+
+
+def _ask(module_id, conversation_id=7):
+    result = retrieve_module_context("what is a limit?", module_id, conversation_id)
+    retrieval.retrieval_cache.remember(conversation_id, result.pool)
+    return result
+
+
+def test_pools_are_reused_until_the_materials_change(session, module):
+    module, calls = module
+    assert not _ask(module.id).cached
+    assert _ask(module.id).cached
+    assert calls == [module.id]
+
+    bump_materials_version(session, module.id)
+    session.commit()
+    assert not _ask(module.id).cached
+    assert calls == [module.id, module.id]
+
+
+def test_a_bump_from_another_worker_stops_reuse(session, module):
+    module, calls = module
+    _ask(module.id)
+    # Another process bumped the version; this process's pools are untouched.
+    session.exec(text(f"UPDATE module SET materials_version = 5 WHERE id = {module.id}"))
+    session.commit()
+    assert not _ask(module.id).cached
+    assert len(calls) == 2
+
+
+def test_no_reuse_without_a_conversation(module):
+    module, calls = module
+    _ask(module.id, conversation_id=None)
+    _ask(module.id, conversation_id=None)
+    assert len(calls) == 2
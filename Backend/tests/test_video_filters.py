@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from sqlmodel import select
+
+import models
+from vector_embeddings import VideoMeta, VideoSearchFilters, VideoVectorIndex
+
+
+@pytest.fixture
+def videos(session, uploader):
+    rows = []
+    for title, duration in [("Short", 100), ("Long", 1000), ("Zero", 0)]:
+        video = models.Video(title=title, category="maths", uploader_id=uploader.id, duration=duration)
+        session.add(video)
+        rows.append(video)
+    session.commit()
+    return rows
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        VideoSearchFilters(max_duration=500),
+        VideoSearchFilters(min_duration=0),
+        VideoSearchFilters(min_duration=50, max_duration=5000),
+        VideoSearchFilters(category="maths"),
+    ],
+)
+def test_in_memory_filters_match_sql(session, videos, filters):
+    sql_ids = set(session.exec(filters.apply(select(models.Video.id))).all())
+
+    index = VideoVectorIndex(max_age=0)
+    rng = np.random.default_rng(0)
+    vectors = [vec / np.linalg.norm(vec) for vec in rng.normal(size=(len(videos), 8)).astype(np.float32)]
+    index.load([v.id for v in videos], vectors, [VideoMeta.from_video(v) for v in videos])
+    memory_ids = {video_id for video_id, _ in index.search(vectors[0], limit=10, filters=filters)}
+
+    assert memory_ids == sql_ids
+
+
+@pytest.mark.parametrize(
+    "filters, expected",
+    [
+        (VideoSearchFilters(max_duration=500), {2}),
+        (VideoSearchFilters(min_duration=0), {2, 3}),
+        (VideoSearchFilters(category="maths"), {1, 2, 3}),
+    ],
+)
+def test_null_duration_never_matches_a_bound(filters, expected):
+    # Legacy rows can have a NULL duration, which SQL bounds never match.
+    metas = [
+        VideoMeta.from_row("maths", None, None, 1),
+        VideoMeta.from_row("maths", None, 100, 1),
+        VideoMeta.from_row("maths", None, 1000, 1),
+    ]
+    index = VideoVectorIndex(max_age=0)
+    vectors = [np.eye(4, dtype=np.float32)[i] for i in range(3)]
+    index.load([1, 2, 3], vectors, metas)
+    assert {video_id for video_id, _ in index.search(np.ones(4), limit=10, filters=filters)} == expected
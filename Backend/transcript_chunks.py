@@ -0,0 +1,336 @@
+# transcript_chunks.py
+#
+# Transcript-aware video embeddings. Captions are split into overlapping word
+# windows that remember where they sit in the video, and each window gets its
+# own vector (VideoTranscriptChunk). Search max-pools chunk scores per video,
+# so a long lecture ranks by its best passage and the result can link to it.
+#
+#   python transcript_chunks.py              # chunk + embed videos without chunks
+#   python transcript_chunks.py --refetch    # also fetch captions missing in the DB
+
+import argparse
+import os
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlmodel import Session, delete, select
+
+from models import Video, VideoTranscriptChunk
+from vector_embeddings import (
+    BLOB_DTYPES,
+    EMBEDDING_STORAGE,
+    VIDEO_INDEX_MAX_AGE,
+    VideoMeta,
+    VideoSearchFilters,
+    VideoVectorIndex,
+    _normalize,
+    _tutor_key,
+    embeddings_enabled,
+    encode_embedding,
+    get_embedding_model,
+    semantic_video_hits,
+    stored_embedding,
+)
+
+# Window size and overlap in words. all-MiniLM-L6-v2 truncates at 256 word
+# pieces, so ~120 words stays inside the window with room to spare.
+TRANSCRIPT_CHUNK_WORDS = int(os.getenv("TRANSCRIPT_CHUNK_WORDS", "120"))
+TRANSCRIPT_CHUNK_OVERLAP = int(os.getenv("TRANSCRIPT_CHUNK_OVERLAP", "24"))
+
+# Chunks per model.encode() call, and a per-video cap (~5 hours of speech).
+TRANSCRIPT_EMBED_BATCH = int(os.getenv("TRANSCRIPT_EMBED_BATCH", "64"))
+TRANSCRIPT_MAX_CHUNKS = int(os.getenv("TRANSCRIPT_MAX_CHUNKS", "300"))
+
+TRANSCRIPT_ANN_SNAPSHOT = Path(
+    os.getenv("TRANSCRIPT_ANN_SNAPSHOT", "vector_index/transcripts_ivf.npz")
+).resolve()
+
+# Chunk hits fetched per requested video, so max-pooling still fills `limit`
+# when one video owns several of the best chunks.
+CHUNK_HITS_PER_VIDEO = 4
+
+
+class TranscriptChunk(NamedTuple):
+    text: str
+    start_seconds: Optional[float] = None
+    end_seconds: Optional[float] = None
+
+
+def _timed_words(segments: Sequence[dict]) -> List[Tuple[str, float, float]]:
+    """
+    Spread each caption segment's duration evenly over its words.
+    """
+    words = []
+    for seg in segments:
+        tokens = (seg.get("text") or "").split()
+        if not tokens:
+            continue
+        start = float(seg.get("start") or 0.0)
+        step = float(seg.get("duration") or 0.0) / len(tokens)
+        for i, token in enumerate(tokens):
+            words.append((token, start + i * step, start + (i + 1) * step))
+    return words
+
+
+def chunk_transcript(
+    segments: Optional[Sequence[dict]] = None,
+    text: Optional[str] = None,
+    words: int = TRANSCRIPT_CHUNK_WORDS,
+    overlap: int = TRANSCRIPT_CHUNK_OVERLAP,
+) -> List[TranscriptChunk]:
+    """
+    Overlapping word windows over timed caption segments or, without
+    segments, over plain transcript text (chunks then have no timestamps).
+    """
+    if segments:
+        timed = _timed_words(segments)
+    else:
+        timed = [(token, None, None) for token in (text or "").split()]
+    if not timed:
+        return []
+
+    stride = max(1, words - overlap)
+    chunks = []
+    for begin in range(0, len(timed), stride):
+        window = timed[begin : begin + words]
+        chunks.append(TranscriptChunk(" ".join(w for w, _, _ in window), window[0][1], window[-1][2]))
+        if begin + words >= len(timed):
+            break
+    return chunks
+
+
+class TranscriptChunkIndex(VideoVectorIndex):
+    """
+    VideoVectorIndex over transcript chunks. Ids are VideoTranscriptChunk
+    ids and every row carries its parent video's metadata, so the usual
+    search filters apply unchanged.
+    """
+
+    def __init__(self, max_age: float = VIDEO_INDEX_MAX_AGE):
+        super().__init__(max_age, snapshot=TRANSCRIPT_ANN_SNAPSHOT)
+        self._video_of: Dict[int, int] = {}
+        self._chunks_of: Dict[int, List[int]] = {}
+
+    def build(self, session: Session) -> None:
+        rows = session.exec(
+            select(
+                VideoTranscriptChunk.id,
+                VideoTranscriptChunk.video_id,
+                VideoTranscriptChunk.embedding_blob,
+                VideoTranscriptChunk.embedding_dtype,
+                Video.category,
+                Video.tutor_name,
+                Video.duration,
+                Video.uploader_id,
+            )
+            .join(Video, Video.id == VideoTranscriptChunk.video_id)
+            .where(VideoTranscriptChunk.embedding_blob.is_not(None))
+        ).all()
+
+        ids: List[int] = []
+        vectors: List[np.ndarray] = []
+        metas: List[VideoMeta] = []
+        video_of: Dict[int, int] = {}
+        chunks_of: Dict[int, List[int]] = {}
+        for chunk_id, video_id, blob, dtype, category, tutor_name, duration, uploader_id in rows:
+            vec = _normalize(stored_embedding(blob, dtype, None))
+            if vec is None or (vectors and vec.shape[0] != vectors[0].shape[0]):
+                continue
+            ids.append(chunk_id)
+            vectors.append(vec)
+            metas.append(VideoMeta.from_row(category, tutor_name, duration, uploader_id))
+            video_of[chunk_id] = video_id
+            chunks_of.setdefault(video_id, []).append(chunk_id)
+
+        self.load(ids, vectors, metas)
+        with self._lock:
+            self._video_of = video_of
+            self._chunks_of = chunks_of
+
+    def remove_video(self, video_id: int) -> None:
+        with self._lock:
+            for chunk_id in self._chunks_of.pop(video_id, []):
+                self._video_of.pop(chunk_id, None)
+                self.remove(chunk_id)
+
+    def replace_video(
+        self,
+        video_id: int,
+        chunks: Sequence[Tuple[int, np.ndarray]],
+        meta: VideoMeta,
+    ) -> None:
+        with self._lock:
+            self.remove_video(video_id)
+            for chunk_id, vector in chunks:
+                self._video_of[chunk_id] = video_id
+                self._chunks_of.setdefault(video_id, []).append(chunk_id)
+                self.upsert(chunk_id, vector, meta)
+
+    def set_video_meta(self, video_id: int, meta: VideoMeta) -> None:
+        """
+        Re-tag a video's chunks after its category/tutor/duration changed.
+        """
+        with self._lock:
+            for chunk_id in self._chunks_of.get(video_id, []):
+                row = self._positions.get(chunk_id)
+                if row is None:
+                    continue
+                self._by_category.put(row, meta.category)
+                self._by_tutor.put(row, _tutor_key(meta.tutor_name))
+                self._durations[row] = meta.duration
+                self._uploaders[row] = meta.uploader_id
+
+    def search_videos(
+        self,
+        query_embedding,
+        limit: int = 20,
+        filters: Optional[VideoSearchFilters] = None,
+    ) -> List[Tuple[int, float, int]]:
+        """
+        (video_id, best_chunk_score, best_chunk_id), best first: chunk hits
+        max-pooled per video.
+        """
+        hits = self.search(query_embedding, limit=limit * CHUNK_HITS_PER_VIDEO, filters=filters)
+        best: Dict[int, Tuple[float, int]] = {}
+        for chunk_id, score in hits:
+            video_id = self._video_of.get(chunk_id)
+            if video_id is None or video_id in best:
+                continue
+            best[video_id] = (score, chunk_id)
+            if len(best) >= limit:
+                break
+        return [(video_id, score, chunk_id) for video_id, (score, chunk_id) in best.items()]
+
+
+transcript_index = TranscriptChunkIndex()
+
+
+def embed_video_transcript(
+    video: Video,
+    session: Session,
+    segments: Optional[Sequence[dict]] = None,
+) -> int:
+    """
+    Replace a video's transcript chunks: chunk the timed `segments` (or
+    video.transcript_text), encode them in batches and store one row per
+    chunk. Returns the number of chunks written.
+    """
+    if not embeddings_enabled():
+        return 0
+
+    chunks = chunk_transcript(segments, video.transcript_text)[:TRANSCRIPT_MAX_CHUNKS]
+    storage = EMBEDDING_STORAGE if EMBEDDING_STORAGE in BLOB_DTYPES else "float32"
+
+    session.exec(delete(VideoTranscriptChunk).where(VideoTranscriptChunk.video_id == video.id))
+
+    rows: List[VideoTranscriptChunk] = []
+    vectors: List[np.ndarray] = []
+    if chunks:
+        model = get_embedding_model()
+        for start in range(0, len(chunks), TRANSCRIPT_EMBED_BATCH):
+            batch = chunks[start : start + TRANSCRIPT_EMBED_BATCH]
+            encoded = np.asarray(model.encode([c.text for c in batch]), dtype=np.float32)
+            for offset, (chunk, vec) in enumerate(zip(batch, encoded)):
+                rows.append(
+                    VideoTranscriptChunk(
+                        video_id=video.id,
+                        seq=start + offset,
+                        start_seconds=chunk.start_seconds,
+                        end_seconds=chunk.end_seconds,
+                        text=chunk.text,
+                        embedding_blob=encode_embedding(vec, storage),
+                        embedding_dtype=storage,
+                    )
+                )
+                vectors.append(vec)
+
+    session.add_all(rows)
+    session.flush()  # assigns ids without expiring anything
+    chunk_ids = [row.id for row in rows]
+    meta = VideoMeta.from_video(video)
+    session.commit()
+
+    transcript_index.replace_video(video.id, list(zip(chunk_ids, vectors)), meta)
+    return len(rows)
+
+
+def delete_video_transcript(video_id: int, session: Session) -> None:
+    """
+    Drop a video's chunks (call before deleting the video; not committed).
+    """
+    session.exec(delete(VideoTranscriptChunk).where(VideoTranscriptChunk.video_id == video_id))
+    transcript_index.remove_video(video_id)
+
+
+class SemanticMatch(NamedTuple):
+    video_id: int
+    score: float
+    chunk_id: Optional[int] = None
+
+
+def semantic_video_matches(
+    session: Session,
+    query_embedding: List[float],
+    limit: int = 20,
+    filters: Optional[VideoSearchFilters] = None,
+) -> List[SemanticMatch]:
+    """
+    A video scores max(cos(query, title + description), best chunk cosine).
+    chunk_id is the best matching transcript chunk, when one ranked.
+    """
+    if not query_embedding:
+        return []
+
+    best: Dict[int, SemanticMatch] = {
+        video_id: SemanticMatch(video_id, score)
+        for video_id, score in semantic_video_hits(session, query_embedding, limit=limit, filters=filters)
+    }
+
+    transcript_index.ensure_built(session)
+    for video_id, score, chunk_id in transcript_index.search_videos(query_embedding, limit=limit, filters=filters):
+        current = best.get(video_id)
+        best[video_id] = SemanticMatch(video_id, max(score, current.score if current else score), chunk_id)
+
+    return sorted(best.values(), key=lambda m: m.score, reverse=True)[:limit]
+
+
+def fetch_chunks(session: Session, chunk_ids: Sequence[int]) -> Dict[int, VideoTranscriptChunk]:
+    if not chunk_ids:
+        return {}
+    chunks = session.exec(
+        select(VideoTranscriptChunk).where(VideoTranscriptChunk.id.in_(list(chunk_ids)))
+    ).all()
+    return {chunk.id: chunk for chunk in chunks}
+
+
+def backfill(refetch: bool = False) -> None:
+    from database import create_db_and_tables, engine
+    from transcripts import fetch_transcript_segments, transcript_text_from_segments
+
+    create_db_and_tables()
+    with Session(engine) as session:
+        chunked = select(VideoTranscriptChunk.video_id).distinct()
+        video_ids = session.exec(select(Video.id).where(Video.id.not_in(chunked)).order_by(Video.id)).all()
+        print(f"{len(video_ids)} videos without transcript chunks")
+
+        for video_id in video_ids:
+            video = session.get(Video, video_id)
+            segments = None
+            if refetch and video.video_url:
+                segments = fetch_transcript_segments(video.video_url)
+                if segments:
+                    video.transcript_text = transcript_text_from_segments(segments)
+                    session.add(video)
+            if not segments and not video.transcript_text:
+                continue
+            count = embed_video_transcript(video, session, segments)
+            print(f"  video {video_id}: {count} chunks")
+            session.expunge_all()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunk and embed video transcripts.")
+    parser.add_argument("--refetch", action="store_true", help="fetch timed captions from YouTube")
+    args = parser.parse_args()
+    backfill(refetch=args.refetch)
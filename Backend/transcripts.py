@@ -1,6 +1,6 @@
 # transcripts.py
 
-from typing import Optional
+from typing import List, Optional
 import re
 
 from youtube_transcript_api import (
@@ -34,10 +34,10 @@ def extract_youtube_video_id(url: str) -> Optional[str]:
     return None
 
 
-def fetch_transcript_text(video_url: str) -> Optional[str]:
+def fetch_transcript_segments(video_url: str) -> Optional[List[dict]]:
     """
-    Fetches transcript for a YouTube video (any language, fallback).
-    Returns full transcript text or None if unavailable.
+    Fetches timed caption segments for a YouTube video
+    ([{"text", "start", "duration"}, ...]) or None if unavailable.
     """
     video_id = extract_youtube_video_id(video_url)
     if not video_id:
@@ -51,11 +51,20 @@ def fetch_transcript_text(video_url: str) -> Optional[str]:
     except Exception:
         return None
 
-    # Join all caption segments into one big text
-    lines = [seg.get("text", "").strip() for seg in segments if seg.get("text")]
-    if not lines:
+    segments = [seg for seg in segments if (seg.get("text") or "").strip()]
+    return segments or None
+
+
+def transcript_text_from_segments(segments: Optional[List[dict]]) -> Optional[str]:
+    if not segments:
         return None
+    # Join all caption segments into one big text
+    return " ".join(seg["text"].strip() for seg in segments)
 
-    transcript = " ".join(lines)
-    # Optional: truncate if you ever want to limit length for embeddings
-    return transcript
+
+def fetch_transcript_text(video_url: str) -> Optional[str]:
+    """
+    Fetches transcript for a YouTube video (any language, fallback).
+    Returns full transcript text or None if unavailable.
+    """
+    return transcript_text_from_segments(fetch_transcript_segments(video_url))
@@ -1,100 +1,871 @@
 # vector_embeddings.py
 
-from typing import List, Optional
-from sqlmodel import Session, select
-from sentence_transformers import SentenceTransformer
+import asyncio
+import os
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, List, NamedTuple, Optional, Tuple
+from cachetools import LRUCache, TTLCache
+from pydantic import BaseModel
+from sqlmodel import Session, select, func
 import numpy as np
 
 from models import Video
+from embedding_batcher import EmbeddingBatcher
+from embedding_backends import EMBEDDING_BACKEND, load_model
+from ann_index import IVFPartitions, IVFSnapshot, assign_partitions, train_centroids, vector_fingerprints
 
-_model: Optional[SentenceTransformer] = None
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
 
+_model: Optional["SentenceTransformer"] = None
+_model_lock = threading.Lock()
 
-def get_embedding_model() -> SentenceTransformer:
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+
+# "eager": load + warm up in a background thread at startup,
+# "lazy": load on first use, "disabled": never load (semantic features off).
+EMBEDDING_MODEL_LOAD = os.getenv("EMBEDDING_MODEL_LOAD", "eager").lower()
+
+# When set, embeddings come from embedding_sidecar.py over this Unix socket and
+# this process never loads the model (or torch) itself.
+EMBEDDING_SIDECAR_SOCKET = os.getenv("EMBEDDING_SIDECAR_SOCKET")
+
+_model_status = {
+    "state": "disabled" if EMBEDDING_MODEL_LOAD == "disabled" else "not_loaded",
+    "mode": EMBEDDING_MODEL_LOAD,
+    "backend": "sidecar" if EMBEDDING_SIDECAR_SOCKET else EMBEDDING_BACKEND,
+    "load_seconds": None,
+    "error": None,
+}
+
+# Rebuild the in-memory index after this many seconds so that writes made by
+# other worker processes eventually become visible. 0 disables the refresh.
+VIDEO_INDEX_MAX_AGE = float(os.getenv("VIDEO_INDEX_MAX_AGE", "300"))
+
+# Approximate search (IVF-flat partitions, see ann_index.py). Used once the
+# catalogue has at least VIDEO_ANN_MIN_SIZE vectors; VIDEO_ANN=off disables it.
+VIDEO_ANN = os.getenv("VIDEO_ANN", "ivf").lower()
+VIDEO_ANN_MIN_SIZE = int(os.getenv("VIDEO_ANN_MIN_SIZE", "20000"))
+VIDEO_ANN_NLIST = int(os.getenv("VIDEO_ANN_NLIST", "0"))  # 0 = sqrt(n)
+VIDEO_ANN_NPROBE = int(os.getenv("VIDEO_ANN_NPROBE", "16"))
+# Centroids are retrained once the catalogue has grown or shrunk by this factor
+# since they were trained, or when more than half the vectors have changed.
+VIDEO_ANN_RETRAIN_FACTOR = float(os.getenv("VIDEO_ANN_RETRAIN_FACTOR", "2"))
+VIDEO_ANN_SNAPSHOT = Path(
+    os.getenv("VIDEO_ANN_SNAPSHOT", "vector_index/videos_ivf.npz")
+).resolve()
+
+# How Video embeddings are persisted: "float32" / "float16" write raw bytes to
+# Video.embedding_blob, "json" keeps the legacy JSON list in Video.embedding.
+EMBEDDING_STORAGE = os.getenv("EMBEDDING_STORAGE", "float32").lower()
+BLOB_DTYPES = {"float32": np.float32, "float16": np.float16}
+
+# Query embedding cache: max entries and TTL in seconds (0 = LRU only, no expiry).
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+
+# Micro-batching of single-text encodes from concurrent requests.
+EMBEDDING_BATCHING = os.getenv("EMBEDDING_BATCHING", "1") == "1"
+EMBEDDING_BATCH_MAX = int(os.getenv("EMBEDDING_BATCH_MAX", "32"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+
+
+def embeddings_enabled() -> bool:
+    return EMBEDDING_MODEL_LOAD != "disabled"
+
+
+def get_embedding_model() -> "SentenceTransformer":
     global _model
-    if _model is None:
-        # You can change the model name if you like
-        _model = SentenceTransformer("all-MiniLM-L6-v2")
+    if _model is not None:
+        return _model
+    if not embeddings_enabled():
+        raise RuntimeError("Embedding model is disabled (EMBEDDING_MODEL_LOAD=disabled)")
+
+    with _model_lock:
+        if _model is None:
+            _model_status["state"] = "loading"
+            started = time.monotonic()
+            try:
+                if EMBEDDING_SIDECAR_SOCKET:
+                    from embedding_sidecar import SidecarEmbeddingClient
+
+                    _model = SidecarEmbeddingClient(EMBEDDING_SIDECAR_SOCKET)
+                else:
+                    loaded = load_model(EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND)
+                    _model = loaded.model
+                    # May differ from EMBEDDING_BACKEND after a fallback.
+                    _model_status["backend"] = loaded.backend
+            except Exception as e:
+                _model_status["state"] = "failed"
+                _model_status["error"] = str(e)
+                raise
+            _model_status["load_seconds"] = round(time.monotonic() - started, 3)
+            _model_status["state"] = "loaded"
     return _model
 
 
+def _warm_up_model() -> None:
+    try:
+        model = get_embedding_model()
+        # A throwaway encode triggers lazy kernel/allocator setup up front.
+        model.encode(["warm up"])
+        _model_status["state"] = "ready"
+        print(f"✅ Embedding model ready ({_model_status['load_seconds']}s)")
+    except Exception as e:
+        _model_status["state"] = "failed"
+        _model_status["error"] = str(e)
+        print(f"⚠️ Embedding model warm-up failed: {e}")
+
+
+def preload_embedding_model() -> None:
+    """
+    Load the weights in the gunicorn master before workers fork, so every
+    worker shares the same copy-on-write pages. No encode is run here: torch
+    thread pools started before fork() can hang in the children, so each
+    worker does its own warm-up encode in start_model_warmup().
+    """
+    if embeddings_enabled() and not EMBEDDING_SIDECAR_SOCKET:
+        get_embedding_model()
+
+
+def start_model_warmup() -> Optional[threading.Thread]:
+    """
+    Load the embedding model in a background thread (EMBEDDING_MODEL_LOAD=eager).
+    """
+    if EMBEDDING_MODEL_LOAD != "eager" or _model_status["state"] == "ready":
+        return None
+
+    thread = threading.Thread(target=_warm_up_model, name="embedding-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def embedding_model_status() -> dict:
+    status = dict(_model_status)
+    # Lazy/disabled workers are always routable; eager ones only once warm.
+    status["ready"] = status["state"] in ("ready", "disabled") or EMBEDDING_MODEL_LOAD == "lazy"
+    return status
+
+
+def _encode_batch(texts: List[str]) -> np.ndarray:
+    return get_embedding_model().encode(texts)
+
+
+embedding_batcher = EmbeddingBatcher(
+    _encode_batch,
+    max_batch=EMBEDDING_BATCH_MAX,
+    max_wait_ms=EMBEDDING_BATCH_WAIT_MS,
+)
+
+
+def encode_text(text: str) -> Optional[np.ndarray]:
+    """
+    Embed a single text and return the raw float32 vector (no list conversion).
+    Concurrent callers are coalesced into one batched encode when batching is on.
+    """
+    text = (text or "").strip()
+    if not text or not embeddings_enabled():
+        return None
+
+    if EMBEDDING_BATCHING:
+        return embedding_batcher.encode(text)
+
+    model = get_embedding_model()
+    return np.asarray(model.encode([text])[0], dtype=np.float32)  # shape (dim,)
+
+
+async def encode_text_async(text: str) -> Optional[np.ndarray]:
+    """
+    Awaitable encode that doesn't block the event loop while the batch runs.
+    """
+    text = (text or "").strip()
+    if not text or not embeddings_enabled():
+        return None
+
+    if EMBEDDING_BATCHING:
+        return await embedding_batcher.encode_async(text)
+    return await asyncio.to_thread(encode_text, text)
+
+
 def generate_embedding_for_text(text: str) -> List[float]:
     """
     Generate an embedding vector (as a Python list of floats) for any text.
-    Stored as JSON in SQLite.
     """
-    text = (text or "").strip()
-    if not text:
+    vec = encode_text(text)
+    if vec is None:
         return []
+    return vec.astype(float).tolist()
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU (optionally TTL) cache of query embeddings keyed on
+    normalised query text, with hit/miss counters.
+    """
+
+    def __init__(self, maxsize: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl) if ttl > 0 else LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        # all-MiniLM-L6-v2 is uncased, so lower-casing doesn't change the vector.
+        return " ".join((text or "").lower().split())
+
+    def get_or_compute(self, text: str, compute: Callable[[str], List[float]]) -> List[float]:
+        key = self.normalize(text)
+        if not key:
+            return []
+
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self.hits += 1
+                return cached
+            self.misses += 1
 
+        # Encode outside the lock so concurrent misses don't serialise.
+        vector = compute(key)
+        if vector:
+            with self._lock:
+                self._cache[key] = vector
+        return vector
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._cache),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+query_cache = QueryEmbeddingCache()
+
+
+def embed_query(text: str) -> List[float]:
+    """
+    Cached variant of generate_embedding_for_text for search/RAG queries.
+    The returned list is shared with the cache and must not be mutated.
+    """
+    return query_cache.get_or_compute(text, generate_embedding_for_text)
+
+
+def encode_texts(texts: List[str], batch_size: int = 32) -> np.ndarray:
+    """
+    Batched encode of many texts into an (n, dim) float32 matrix, for bulk
+    jobs. Callers must drop empty texts first.
+    """
     model = get_embedding_model()
-    vec = model.encode([text])[0]  # shape (dim,)
-    return vec.astype(float).tolist()
+    return np.asarray(model.encode(texts, batch_size=batch_size), dtype=np.float32)
 
 
 def generate_embeddings_for_texts(texts: List[str]) -> List[List[float]]:
     cleaned = [(text or "").strip() for text in texts]
-    if not any(cleaned):
+    if not any(cleaned) or not embeddings_enabled():
         return [[] for _ in cleaned]
 
-    model = get_embedding_model()
-    vectors = model.encode(cleaned)
+    vectors = encode_texts(cleaned)
     return [vec.astype(float).tolist() for vec in vectors]
 
 
+def encode_embedding(vector, dtype: str = "float32") -> bytes:
+    return np.asarray(vector, dtype=BLOB_DTYPES[dtype]).tobytes()
+
+
+def decode_embedding(blob: bytes, dtype: Optional[str] = "float32") -> np.ndarray:
+    """
+    Zero-copy, read-only view over stored vector bytes.
+    """
+    return np.frombuffer(blob, dtype=BLOB_DTYPES[dtype or "float32"])
+
+
+def embedding_columns(vector, storage: str = EMBEDDING_STORAGE) -> dict:
+    """
+    Video column values for `vector` in the configured storage format, with
+    the other representation cleared (all None when vector is None).
+    """
+    if vector is None or len(vector) == 0:
+        return {"embedding": None, "embedding_blob": None, "embedding_dtype": None}
+    if storage in BLOB_DTYPES:
+        return {
+            "embedding": None,
+            "embedding_blob": encode_embedding(vector, storage),
+            "embedding_dtype": storage,
+        }
+    return {
+        "embedding": np.asarray(vector, dtype=float).tolist(),
+        "embedding_blob": None,
+        "embedding_dtype": None,
+    }
+
+
+def set_video_embedding(video: Video, vector, storage: str = EMBEDDING_STORAGE) -> None:
+    """
+    Write (or clear, when vector is None) a video's embedding in the
+    configured storage format, clearing the other representation.
+    """
+    for column, value in embedding_columns(vector, storage).items():
+        setattr(video, column, value)
+
+
+def stored_embedding(
+    blob: Optional[bytes],
+    dtype: Optional[str],
+    legacy: Optional[List[float]],
+) -> Optional[np.ndarray]:
+    if blob:
+        return decode_embedding(blob, dtype)
+    if legacy:
+        return np.asarray(legacy, dtype=np.float32)
+    return None
+
+
+def get_video_embedding(video: Video) -> Optional[np.ndarray]:
+    return stored_embedding(video.embedding_blob, video.embedding_dtype, video.embedding)
+
+
+def video_embedding_text(title: Optional[str], description: Optional[str]) -> str:
+    parts = [title or ""]
+    if description:
+        parts.append(description)
+    return " ".join(parts).strip()
+
+
 def generate_embedding_for_video(video: Video, session: Session) -> None:
     """
     Generate and store an embedding for a specific Video row.
-    Uses title + description (you can extend with transcript later).
+    Uses title + description; transcripts are chunked separately (transcript_chunks.py).
     """
-    parts = [video.title or ""]
-    if video.description:
-        parts.append(video.description)
+    if not embeddings_enabled():
+        # Keep whatever is stored rather than wiping it.
+        return
 
-    full_text = " ".join(parts).strip()
-    if not full_text:
-        video.embedding = None
-    else:
-        video.embedding = generate_embedding_for_text(full_text)
+    full_text = video_embedding_text(video.title, video.description)
+    vector = encode_text(full_text) if full_text else None
+    set_video_embedding(video, vector)
 
     session.add(video)
     session.commit()
     session.refresh(video)
 
+    if vector is not None:
+        video_index.upsert(video.id, vector, VideoMeta.from_video(video))
+    else:
+        video_index.remove(video.id)
 
-def semantic_search_videos(
+
+def _normalize(vector) -> Optional[np.ndarray]:
+    vec = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vec)
+    if vec.size == 0 or norm == 0:
+        return None
+    return vec / norm
+
+
+# Stands in for a NULL Video.duration; never matches a duration bound, like
+# NULL in the SQL filters.
+UNKNOWN_DURATION = -1
+
+
+class VideoMeta(NamedTuple):
+    category: str = ""
+    tutor_name: str = ""
+    duration: int = UNKNOWN_DURATION
+    uploader_id: int = 0
+
+    @classmethod
+    def from_row(cls, category, tutor_name, duration, uploader_id) -> "VideoMeta":
+        return cls(
+            category or "",
+            tutor_name or "",
+            UNKNOWN_DURATION if duration is None else duration,
+            uploader_id or 0,
+        )
+
+    @classmethod
+    def from_video(cls, video: Video) -> "VideoMeta":
+        return cls.from_row(video.category, video.tutor_name, video.duration, video.uploader_id)
+
+
+class VideoSearchFilters(BaseModel):
+    category: Optional[str] = None
+    tutor_name: Optional[str] = None
+    min_duration: Optional[int] = None
+    max_duration: Optional[int] = None
+    uploader_id: Optional[int] = None
+
+    def is_empty(self) -> bool:
+        return not any(value is not None for value in self.model_dump().values())
+
+    def apply(self, stmt):
+        """Adds the same filters as WHERE clauses to a select() over Video."""
+        if self.category is not None:
+            stmt = stmt.where(Video.category == self.category)
+        if self.tutor_name is not None:
+            stmt = stmt.where(func.lower(Video.tutor_name) == _tutor_key(self.tutor_name))
+        if self.min_duration is not None:
+            stmt = stmt.where(Video.duration >= self.min_duration)
+        if self.max_duration is not None:
+            stmt = stmt.where(Video.duration <= self.max_duration)
+        if self.uploader_id is not None:
+            stmt = stmt.where(Video.uploader_id == self.uploader_id)
+        return stmt
+
+
+def _tutor_key(tutor_name: Optional[str]) -> str:
+    # Matches the case-insensitive tutor filter used by /api/videos/browse.
+    return (tutor_name or "").strip().lower()
+
+
+class _RowPostings:
+    """
+    Key -> set of matrix rows (e.g. all rows in one category), with cached
+    row arrays so a filtered query only gathers the matching vectors.
+    """
+
+    def __init__(self):
+        self._rows: Dict[str, set] = {}
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._key_of: Dict[int, str] = {}
+
+    def put(self, row: int, key: str) -> None:
+        old = self._key_of.get(row)
+        if old == key:
+            return
+        if old is not None:
+            self.drop(row)
+        self._rows.setdefault(key, set()).add(row)
+        self._arrays.pop(key, None)
+        self._key_of[row] = key
+
+    def drop(self, row: int) -> None:
+        key = self._key_of.pop(row, None)
+        if key is None:
+            return
+        members = self._rows[key]
+        members.discard(row)
+        if not members:
+            del self._rows[key]
+        self._arrays.pop(key, None)
+
+    def move(self, src_row: int, dst_row: int) -> None:
+        key = self._key_of.get(src_row)
+        if key is not None:
+            self.drop(src_row)
+            self.put(dst_row, key)
+
+    def rows(self, key: str) -> np.ndarray:
+        arr = self._arrays.get(key)
+        if arr is None:
+            members = self._rows.get(key, ())
+            arr = np.sort(np.fromiter(members, dtype=np.int64, count=len(members)))
+            self._arrays[key] = arr
+        return arr
+
+
+class VideoVectorIndex:
+    """
+    Process-wide cosine index over Video embeddings.
+
+    Vectors live in one contiguous, L2-normalised float32 matrix with a
+    parallel array of video ids, so a query is a single matrix-vector
+    product instead of a JSON decode + ORM hydration per row. Large
+    catalogues additionally get IVF partitions so a query only scores the
+    rows in the closest few partitions. Rows are also pre-partitioned by
+    category and tutor so filtered queries only touch matching vectors.
+    """
+
+    def __init__(self, max_age: float = VIDEO_INDEX_MAX_AGE, snapshot: Optional[Path] = None):
+        self.max_age = max_age
+        self._snapshot = snapshot
+        self._lock = threading.RLock()
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._positions: Dict[int, int] = {}
+        self._size = 0
+        self._built_at: Optional[float] = None
+        self._ann: Optional[IVFPartitions] = None
+        self._by_category = _RowPostings()
+        self._by_tutor = _RowPostings()
+        self._durations = np.zeros(0, dtype=np.int64)
+        self._uploaders = np.zeros(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def dim(self) -> int:
+        return self._matrix.shape[1]
+
+    @property
+    def snapshot_path(self) -> Path:
+        return self._snapshot or VIDEO_ANN_SNAPSHOT
+
+    def _reset(self, dim: int, capacity: int) -> None:
+        self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._durations = np.zeros(capacity, dtype=np.int64)
+        self._uploaders = np.zeros(capacity, dtype=np.int64)
+        self._positions = {}
+        self._size = 0
+        self._ann = None
+        self._by_category = _RowPostings()
+        self._by_tutor = _RowPostings()
+
+    def _grow(self, min_capacity: int) -> None:
+        capacity = max(min_capacity, 2 * len(self._ids), 64)
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        ids = np.zeros(capacity, dtype=np.int64)
+        durations = np.zeros(capacity, dtype=np.int64)
+        uploaders = np.zeros(capacity, dtype=np.int64)
+        matrix[: self._size] = self._matrix[: self._size]
+        ids[: self._size] = self._ids[: self._size]
+        durations[: self._size] = self._durations[: self._size]
+        uploaders[: self._size] = self._uploaders[: self._size]
+        self._matrix, self._ids = matrix, ids
+        self._durations, self._uploaders = durations, uploaders
+
+    def needs_build(self) -> bool:
+        if self._built_at is None:
+            return True
+        if self.max_age and time.monotonic() - self._built_at > self.max_age:
+            return True
+        return False
+
+    def build(self, session: Session) -> None:
+        """
+        (Re)load every stored embedding. Only the id and embedding columns
+        are selected, so no Video objects are hydrated.
+        """
+        rows = session.exec(
+            select(
+                Video.id,
+                Video.embedding_blob,
+                Video.embedding_dtype,
+                Video.embedding,
+                Video.category,
+                Video.tutor_name,
+                Video.duration,
+                Video.uploader_id,
+            ).where(
+                Video.embedding_blob.is_not(None) | Video.embedding.is_not(None)
+            )
+        ).all()
+
+        ids: List[int] = []
+        vectors: List[np.ndarray] = []
+        metas: List[VideoMeta] = []
+        for video_id, blob, dtype, legacy, category, tutor_name, duration, uploader_id in rows:
+            embedding = stored_embedding(blob, dtype, legacy)
+            vec = _normalize(embedding) if embedding is not None else None
+            if vec is None:
+                continue
+            if vectors and vec.shape[0] != vectors[0].shape[0]:
+                print(f"⚠️ Skipping video {video_id}: embedding dimension mismatch")
+                continue
+            ids.append(video_id)
+            vectors.append(vec)
+            metas.append(VideoMeta.from_row(category, tutor_name, duration, uploader_id))
+
+        self.load(ids, vectors, metas)
+
+    def load(
+        self,
+        ids: List[int],
+        vectors: List[np.ndarray],
+        metas: Optional[List[VideoMeta]] = None,
+    ) -> None:
+        """
+        Replace the index contents with already-normalised vectors.
+        """
+        metas = metas or [VideoMeta()] * len(ids)
+        by_category, by_tutor = _RowPostings(), _RowPostings()
+        for row, meta in enumerate(metas):
+            by_category.put(row, meta.category)
+            by_tutor.put(row, _tutor_key(meta.tutor_name))
+        durations = np.asarray([m.duration for m in metas], dtype=np.int64)
+        uploaders = np.asarray([m.uploader_id for m in metas], dtype=np.int64)
+
+        matrix = np.ascontiguousarray(np.vstack(vectors)) if vectors else None
+        id_array = np.asarray(ids, dtype=np.int64)
+
+        # Partitioning (and, the first time, k-means) runs outside the lock.
+        ann = self._build_ann(id_array, matrix) if matrix is not None else None
+
+        with self._lock:
+            if matrix is not None:
+                self._matrix = matrix
+                self._ids = id_array
+                self._durations = durations
+                self._uploaders = uploaders
+                self._by_category = by_category
+                self._by_tutor = by_tutor
+            else:
+                self._reset(dim=0, capacity=0)
+            self._positions = {video_id: row for row, video_id in enumerate(ids)}
+            self._size = len(ids)
+            self._ann = ann
+            self._built_at = time.monotonic()
+
+    def _previous_partitions(self, dim: int) -> Optional[IVFSnapshot]:
+        """
+        Centroids and {video_id: (partition, fingerprint)} from the live index
+        or, on a cold start, the on-disk snapshot of the same embedding model,
+        so k-means only runs when the catalogue has drifted.
+        """
+        with self._lock:
+            ann = self._ann
+            if ann is not None and ann.centroids.shape[1] == dim:
+                fingerprints = vector_fingerprints(self._matrix[: self._size]).tolist()
+                known = {}
+                for row in range(self._size):
+                    part = ann.partition_of(row)
+                    if part is not None:
+                        known[int(self._ids[row])] = (part, fingerprints[row])
+                return IVFSnapshot(ann.centroids, ann.model, ann.trained_size, known)
+
+        if self.snapshot_path.exists():
+            try:
+                snapshot = IVFPartitions.load(self.snapshot_path)
+                if snapshot.centroids.shape[1] == dim and snapshot.model == EMBEDDING_MODEL_NAME:
+                    return snapshot
+            except Exception as e:
+                print(f"⚠️ Ignoring unreadable ANN snapshot: {e}")
+        return None
+
+    def _build_ann(self, ids: np.ndarray, matrix: np.ndarray) -> Optional[IVFPartitions]:
+        size = matrix.shape[0]
+        if VIDEO_ANN != "ivf" or size < VIDEO_ANN_MIN_SIZE:
+            return None
+
+        fingerprints = vector_fingerprints(matrix)
+        nlist = VIDEO_ANN_NLIST or int(np.sqrt(size))
+        previous = self._previous_partitions(matrix.shape[1])
+
+        parts = np.full(size, -1, dtype=np.int32)
+        if previous is not None:
+            # A stored partition is only valid for the exact vector it was
+            # assigned from; re-embedded videos are placed again.
+            for row, (video_id, fingerprint) in enumerate(zip(ids.tolist(), fingerprints.tolist())):
+                part, known_fingerprint = previous.known.get(video_id, (-1, None))
+                if known_fingerprint == fingerprint:
+                    parts[row] = part
+
+        trained_size = previous.trained_size if previous is not None else 0
+        drift = max(size, 1) / max(trained_size, 1)
+        retrain = (
+            previous is None
+            or (VIDEO_ANN_NLIST and previous.centroids.shape[0] != VIDEO_ANN_NLIST)
+            or not 1 / VIDEO_ANN_RETRAIN_FACTOR <= drift <= VIDEO_ANN_RETRAIN_FACTOR
+            or np.count_nonzero(parts >= 0) < size / 2
+        )
+        if retrain:
+            print(f"🧮 Training IVF index ({size} vectors, {nlist} partitions)...")
+            centroids = train_centroids(matrix, nlist)
+            trained_size = size
+            parts[:] = -1
+        else:
+            centroids = previous.centroids
+
+        missing = np.flatnonzero(parts < 0)
+        if missing.size:
+            parts[missing] = assign_partitions(matrix[missing], centroids)
+
+        ann = IVFPartitions(centroids, nprobe=VIDEO_ANN_NPROBE, trained_size=trained_size, model=EMBEDDING_MODEL_NAME)
+        ann.assign_all(range(size), parts)
+
+        if missing.size:
+            try:
+                ann.save(self.snapshot_path, ids, fingerprints)
+            except Exception as e:
+                print(f"⚠️ Could not write ANN snapshot: {e}")
+        return ann
+
+    def ensure_built(self, session: Session) -> None:
+        if self.needs_build():
+            self.build(session)
+
+    def upsert(self, video_id: int, embedding, meta: Optional[VideoMeta] = None) -> None:
+        vec = _normalize(embedding) if embedding is not None else None
+        if vec is None:
+            self.remove(video_id)
+            return
+
+        with self._lock:
+            if self._size == 0 and self.dim != vec.shape[0]:
+                self._reset(dim=vec.shape[0], capacity=64)
+            if vec.shape[0] != self.dim:
+                print(f"⚠️ Not indexing video {video_id}: embedding dimension mismatch")
+                return
+
+            row = self._positions.get(video_id)
+            if row is None:
+                if self._size >= len(self._ids):
+                    self._grow(self._size + 1)
+                row = self._size
+                self._size += 1
+                self._ids[row] = video_id
+                self._positions[video_id] = row
+            self._matrix[row] = vec
+            meta = meta or VideoMeta()
+            self._by_category.put(row, meta.category)
+            self._by_tutor.put(row, _tutor_key(meta.tutor_name))
+            self._durations[row] = meta.duration
+            self._uploaders[row] = meta.uploader_id
+            if self._ann is not None:
+                self._ann.assign(row, vec)
+
+    def remove(self, video_id: int) -> None:
+        with self._lock:
+            row = self._positions.pop(video_id, None)
+            if row is None:
+                return
+            if self._ann is not None:
+                self._ann.unassign(row)
+            self._by_category.drop(row)
+            self._by_tutor.drop(row)
+            last = self._size - 1
+            if row != last:
+                # Move the last row into the hole to keep the matrix dense.
+                moved_id = int(self._ids[last])
+                self._matrix[row] = self._matrix[last]
+                self._ids[row] = moved_id
+                self._durations[row] = self._durations[last]
+                self._uploaders[row] = self._uploaders[last]
+                self._positions[moved_id] = row
+                self._by_category.move(last, row)
+                self._by_tutor.move(last, row)
+                if self._ann is not None:
+                    self._ann.move(last, row)
+            self._size = last
+
+    def _filtered_rows(self, filters: VideoSearchFilters, candidates: Optional[np.ndarray]) -> np.ndarray:
+        """
+        Rows matching `filters`, starting from the category/tutor postings
+        (or `candidates`) and narrowing with the duration/uploader arrays.
+        """
+        rows = candidates
+        if filters.category is not None:
+            rows = self._by_category.rows(filters.category)
+        if filters.tutor_name is not None:
+            tutor_rows = self._by_tutor.rows(_tutor_key(filters.tutor_name))
+            rows = tutor_rows if rows is None else np.intersect1d(rows, tutor_rows, assume_unique=True)
+        if rows is None:
+            rows = np.arange(self._size, dtype=np.int64)
+
+        mask = np.ones(rows.shape[0], dtype=bool)
+        if filters.min_duration is not None or filters.max_duration is not None:
+            mask &= self._durations[rows] != UNKNOWN_DURATION
+        if filters.min_duration is not None:
+            mask &= self._durations[rows] >= filters.min_duration
+        if filters.max_duration is not None:
+            mask &= self._durations[rows] <= filters.max_duration
+        if filters.uploader_id is not None:
+            mask &= self._uploaders[rows] == filters.uploader_id
+        return rows[mask]
+
+    def search(
+        self,
+        query_embedding,
+        limit: int = 20,
+        exact: bool = False,
+        nprobe: Optional[int] = None,
+        filters: Optional[VideoSearchFilters] = None,
+    ) -> List[Tuple[int, float]]:
+        """
+        Returns (video_id, cosine_similarity) pairs, best first. Uses the IVF
+        partitions when present unless `exact` is set; category/tutor filters
+        always scan their own partition exactly.
+        """
+        q = _normalize(query_embedding)
+        if q is None or limit <= 0:
+            return []
+        if filters is not None and filters.is_empty():
+            filters = None
+
+        with self._lock:
+            if self._size == 0 or q.shape[0] != self.dim:
+                return []
+
+            use_ann = self._ann is not None and not exact
+            if filters is not None and (filters.category is not None or filters.tutor_name is not None):
+                use_ann = False
+
+            if filters is not None:
+                candidates = self._ann.candidate_rows(q, nprobe) if use_ann else None
+                rows = self._filtered_rows(filters, candidates)
+                if use_ann and rows.shape[0] < limit:
+                    # Restrictive filter starved the probed partitions; scan exactly.
+                    rows = self._filtered_rows(filters, None)
+                scores = self._matrix[rows] @ q
+                ids = self._ids[rows]
+            elif use_ann:
+                rows = self._ann.candidate_rows(q, nprobe)
+                scores = self._matrix[rows] @ q
+                ids = self._ids[rows]
+            else:
+                scores = self._matrix[: self._size] @ q
+                ids = self._ids[: self._size].copy()
+
+        if scores.shape[0] == 0:
+            return []
+        k = min(limit, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+
+video_index = VideoVectorIndex()
+
+
+def fetch_videos_in_order(session: Session, ids: List[int]) -> List[Video]:
+    if not ids:
+        return []
+    videos = session.exec(select(Video).where(Video.id.in_(ids))).all()
+    by_id = {v.id: v for v in videos}
+    return [by_id[video_id] for video_id in ids if video_id in by_id]
+
+
+def semantic_video_hits(
     session: Session,
     query_embedding: List[float],
     limit: int = 20,
-) -> List[Video]:
-    """
-    Semantic search implemented in Python (cosine similarity) over
-    JSON-stored embeddings in SQLite.
-    """
+    filters: Optional[VideoSearchFilters] = None,
+) -> List[Tuple[int, float]]:
     if not query_embedding:
         return []
 
-    q = np.array(query_embedding, dtype=np.float32)
-    q_norm = np.linalg.norm(q)
-    if q_norm == 0:
-        return []
+    video_index.ensure_built(session)
+    return video_index.search(query_embedding, limit=limit, filters=filters)
+
 
-    videos = session.exec(
-        select(Video).where(Video.embedding.is_not(None))
-    ).all()
-
-    scored: List[tuple[float, Video]] = []
-    for v in videos:
-        if not v.embedding:
-            continue
-        emb = np.array(v.embedding, dtype=np.float32)
-        denom = np.linalg.norm(emb) * q_norm
-        if denom == 0:
-            continue
-        sim = float(np.dot(q, emb) / denom)  # cosine similarity
-        scored.append((sim, v))
-
-    scored.sort(key=lambda x: x[0], reverse=True)
-    top_videos = [v for sim, v in scored[:limit]]
-    return top_videos
+def semantic_search_videos(
+    session: Session,
+    query_embedding: List[float],
+    limit: int = 20,
+    filters: Optional[VideoSearchFilters] = None,
+) -> List[Video]:
+    """
+    Cosine-similarity search backed by the in-memory VideoVectorIndex.
+    Only the winning Video rows are fetched from the database.
+    """
+    hits = semantic_video_hits(session, query_embedding, limit=limit, filters=filters)
+    return fetch_videos_in_order(session, [video_id for video_id, _ in hits])
 
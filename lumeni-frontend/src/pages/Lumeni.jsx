@@ -71,8 +71,30 @@ export default function Lumeni() {
   const [copiedMessageIndex, setCopiedMessageIndex] = useState(null);
   const [messageFeedback, setMessageFeedback] = useState({});
 
+  // Pagination cursors: older chats in the sidebar, older messages in a chat
+  const [historyCursor, setHistoryCursor] = useState(null);
+  const [historyLoadingMore, setHistoryLoadingMore] = useState(false);
+  const [olderMessagesCursor, setOlderMessagesCursor] = useState(null);
+  const [olderMessagesLoading, setOlderMessagesLoading] = useState(false);
+
   const messagesEndRef = useRef(null);
   const fileInputRef = useRef(null);
+  const skipAutoScrollRef = useRef(false);
+
+  const formatChat = (chat) => ({
+    ...chat,
+    lastUpdated: chat.last_updated || chat.lastUpdated || "",
+  });
+
+  const formatMessage = (msg) => ({
+    from: msg.role === "model" ? "bot" : msg.role,
+    text: msg.content,
+  });
+
+  const historyCursorFrom = (data) =>
+    data.has_more
+      ? { before: data.next_before, before_id: data.next_before_id }
+      : null;
 
   // useEffect to load chat history on mount
   useEffect(() => {
@@ -82,10 +104,8 @@ export default function Lumeni() {
       try {
         // [FIX] Removed /api prefix because api.js already adds it
         const response = await apiClient.get("/chat/history");
-        loadedChats = (response.data || []).map((chat) => ({
-          ...chat,
-          lastUpdated: chat.last_updated || chat.lastUpdated || "",
-        }));
+        loadedChats = (response.data.chats || []).map(formatChat);
+        setHistoryCursor(historyCursorFrom(response.data));
       } catch (error) {
         console.error("Failed to fetch chat history:", error);
       } finally {
@@ -106,8 +126,12 @@ export default function Lumeni() {
     fetchChatHistory();
   }, []); // Empty array means this runs once on mount
 
-  // Smooth auto-scroll
+  // Smooth auto-scroll (not when older messages were prepended)
   useEffect(() => {
+    if (skipAutoScrollRef.current) {
+      skipAutoScrollRef.current = false;
+      return;
+    }
     if (messagesEndRef.current) {
       const timeout = setTimeout(() => {
         messagesEndRef.current.scrollIntoView({ behavior: "smooth" });
@@ -116,6 +140,55 @@ export default function Lumeni() {
     }
   }, [messages, loading, chatLoading]);
 
+  const handleLoadMoreChats = async () => {
+    if (!historyCursor || historyLoadingMore) return;
+    setHistoryLoadingMore(true);
+    try {
+      const response = await apiClient.get("/chat/history", {
+        params: historyCursor,
+      });
+      const olderChats = (response.data.chats || []).map(formatChat);
+      setChats((prev) => [
+        ...prev,
+        ...olderChats.filter((chat) => !prev.some((c) => c.id === chat.id)),
+      ]);
+      setHistoryCursor(historyCursorFrom(response.data));
+    } catch (error) {
+      console.error("Failed to fetch more chats:", error);
+    } finally {
+      setHistoryLoadingMore(false);
+    }
+  };
+
+  const handleLoadOlderMessages = async () => {
+    if (!activeChat || olderMessagesCursor === null || olderMessagesLoading) return;
+    setOlderMessagesLoading(true);
+    try {
+      const response = await apiClient.get(`/chat/${activeChat}`, {
+        params: { before_seq: olderMessagesCursor },
+      });
+      const olderMessages = response.data.messages.map(formatMessage);
+      skipAutoScrollRef.current = true;
+      setMessages((prev) => [...olderMessages, ...prev]);
+      // Feedback is keyed by message index, which just shifted
+      setMessageFeedback((prev) =>
+        Object.fromEntries(
+          Object.entries(prev).map(([index, type]) => [
+            Number(index) + olderMessages.length,
+            type,
+          ])
+        )
+      );
+      setOlderMessagesCursor(
+        response.data.has_more ? response.data.next_before_seq : null
+      );
+    } catch (error) {
+      console.error("Failed to fetch older messages:", error);
+    } finally {
+      setOlderMessagesLoading(false);
+    }
+  };
+
   // --- (Clipboard and Feedback handlers are unchanged) ---
   const handleCopyToClipboard = async (text) => {
     try {
@@ -236,6 +309,7 @@ export default function Lumeni() {
   const handleNewChat = () => {
     setActiveChat(null);
     setMessages([]);
+    setOlderMessagesCursor(null);
     setAttachedFiles([]);
     setMessageFeedback({});
     // Ensure "New Chat" is at the top and selected
@@ -251,6 +325,7 @@ export default function Lumeni() {
       // This is the "New Chat" placeholder
       setActiveChat(null);
       setMessages([]);
+      setOlderMessagesCursor(null);
       setMessageFeedback({});
       return;
     }
@@ -262,16 +337,17 @@ export default function Lumeni() {
     setChatLoading(true);
     setActiveChat(chat.id);
     setMessages([]);
+    setOlderMessagesCursor(null);
     setMessageFeedback({});
 
     try {
       // [FIX] Removed /api prefix because api.js already adds it
       const response = await apiClient.get(`/chat/${chat.id}`);
-      const formattedMessages = response.data.messages.map((msg) => ({
-        from: msg.role === "model" ? "bot" : msg.role, 
-        text: msg.content,
-      }));
+      const formattedMessages = response.data.messages.map(formatMessage);
       setMessages(formattedMessages);
+      setOlderMessagesCursor(
+        response.data.has_more ? response.data.next_before_seq : null
+      );
     } catch (error) {
       console.error("Failed to fetch chat messages:", error);
       setMessages([
@@ -590,6 +666,22 @@ export default function Lumeni() {
               </Box>
             ) : (
               <>
+                {olderMessagesCursor !== null && (
+                  <Box sx={{ display: "flex", justifyContent: "center", mb: 2 }}>
+                    <Button
+                      size="small"
+                      onClick={handleLoadOlderMessages}
+                      disabled={olderMessagesLoading}
+                      sx={{ color: textColor, fontFamily: commonFontFamily }}
+                    >
+                      {olderMessagesLoading ? (
+                        <CircularProgress size={16} sx={{ color: textColor }} />
+                      ) : (
+                        "Load older messages"
+                      )}
+                    </Button>
+                  </Box>
+                )}
                 {messages.map((msg, index) => {
                   const isUser = msg.from === "user";
                   const isThinking = msg.id === "thinking-msg";
@@ -1007,6 +1099,21 @@ export default function Lumeni() {
                   />
                 </ListItemButton>
               ))}
+              {historyCursor && (
+                <Button
+                  size="small"
+                  fullWidth
+                  onClick={handleLoadMoreChats}
+                  disabled={historyLoadingMore}
+                  sx={{ color: textColor, fontFamily: commonFontFamily }}
+                >
+                  {historyLoadingMore ? (
+                    <CircularProgress size={16} sx={{ color: textColor }} />
+                  ) : (
+                    "Load more chats"
+                  )}
+                </Button>
+              )}
             </List>
           </>
         )}